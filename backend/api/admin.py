@@ -2,10 +2,13 @@ from django.contrib import admin
 from django.contrib.auth.admin import GroupAdmin as BaseGroupAdmin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
 from unfold.admin import ModelAdmin
 from unfold.forms import AdminPasswordChangeForm, UserChangeForm, UserCreationForm
 
-from .models import User
+from .models import CustomField, PatientCustomFieldValue, User
+from .projection import refresh_custom_field_data
 
 admin.site.unregister(Group)
 
@@ -20,3 +23,31 @@ class UserAdmin(BaseUserAdmin, ModelAdmin):
 @admin.register(Group)
 class GroupAdmin(BaseGroupAdmin, ModelAdmin):
     pass
+
+
+@admin.register(CustomField)
+class CustomFieldAdmin(ModelAdmin):
+    list_display = ["name", "field_type", "provider"]
+    list_filter = ["field_type"]
+    list_select_related = ["provider"]
+    search_fields = ["name", "provider__username"]
+
+
+@admin.register(PatientCustomFieldValue)
+class PatientCustomFieldValueAdmin(ModelAdmin):
+    # Custom field names and types come from custom_field_cache, so the
+    # change list does not join or query custom fields per row.
+    list_display = ["patient", "custom_field_name", "value"]
+    list_select_related = ["patient"]
+    raw_id_fields = ["patient"]
+
+    @admin.display(description=_("custom field"))
+    def custom_field_name(self, obj):
+        return obj.get_custom_field().name
+
+    def delete_queryset(self, request, queryset):
+        # Queryset deletes leave Patient.custom_field_data to the caller.
+        patient_ids = set(queryset.values_list("patient_id", flat=True))
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            refresh_custom_field_data(patient_ids)
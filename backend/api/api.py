@@ -1,25 +1,59 @@
 from django.contrib.auth import get_user_model
-from drf_spectacular.utils import extend_schema
-from rest_framework import mixins, status, viewsets
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
+from rest_framework import mixins, serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from .bulk import bulk_upsert_patients
+from .cache import CachedListMixin, custom_field_cache
+from .changes import get_changes
+from .export import aexport_rows, export_columns, export_custom_fields, export_rows
+from .fieldsets import SparseFieldsetMixin, fieldset_parameters
+from .filters import (
+    PatientFilterBackend,
+    PatientFilterSerializer,
+    PatientOrderingFilter,
+    PatientSearchFilter,
+)
+from .models import CustomField, Patient, PatientAddress
+from .mutations import mutate_patients
+from .pagination import PatientPagination
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .routers import ReplicaReadMixin
+from .rows import PatientRowsMixin, patient_row_columns
 from .serializers import (
+    ChangesQuerySerializer,
+    CustomFieldChangesSerializer,
+    PatientBulkResultSerializer,
+    PatientBulkSerializer,
+    PatientChangesSerializer,
+    PatientCreateSerializer,
+    PatientCustomFieldCreateSerializer,
+    PatientCustomFieldSerializer,
+    PatientListSerializer,
+    PatientMutationResultSerializer,
+    PatientMutationSerializer,
+    PatientStatsQuerySerializer,
+    PatientStatsSerializer,
     UserChangePasswordErrorSerializer,
     UserChangePasswordSerializer,
     UserCreateErrorSerializer,
     UserCreateSerializer,
     UserCurrentErrorSerializer,
     UserCurrentSerializer,
-    PatientCreateSerializer,
-    PatientListSerializer,
-    PatientCustomFieldSerializer,
-    PatientCustomFieldCreateSerializer,
 )
+from .stats import get_patient_stats
 
 User = get_user_model()
-from .models import Patient, CustomField
 
 
 class UserViewSet(
@@ -83,7 +117,7 @@ class UserViewSet(
     )
     @action(["post"], url_path="change-password", detail=False)
     def change_password(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
+        serializer = self.get_serializer(request.user, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -94,36 +128,260 @@ class UserViewSet(
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class PatientViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            PatientFilterSerializer,
+            *fieldset_parameters(PatientListSerializer),
+        ]
+    ),
+    retrieve=extend_schema(parameters=fieldset_parameters(PatientListSerializer)),
+)
+class PatientViewSet(
+    ReplicaReadMixin,
+    SparseFieldsetMixin,
+    CachedListMixin,
+    PatientRowsMixin,
+    viewsets.ModelViewSet,
+):
     """
     ViewSet for managing patient records.
-    
+
     Provides CRUD operations for patients and their related data.
     """
+
     queryset = Patient.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = PatientPagination
+    filter_backends = [PatientFilterBackend, PatientOrderingFilter, PatientSearchFilter]
+    ordering = ["id"]
+    read_actions = ["list", "retrieve", "export"]
+    replica_actions = ["list", "retrieve", "export", "stats", "changes"]
+    custom_fields = None
 
     def get_queryset(self):
-        return self.queryset.filter(provider=self.request.user)
+        queryset = self.queryset.filter(provider=self.request.user)
+        if self.action == "export":
+            queryset = self.get_export_queryset(queryset)
+        return queryset
+
+    def get_export_queryset(self, queryset):
+        """
+        Load patients and the nested rows used by export_rows in a constant
+        number of queries per chunk, fetching only the exported columns.
+        List and retrieve read their rows through PatientRowsMixin.
+        """
+        addresses = PatientAddress.objects.only(
+            "patient_id",
+            "address_type",
+            "street_address",
+            "city",
+            "state",
+            "postal_code",
+            "is_primary",
+        )
+        # Custom field values come from the custom_field_data projection, and
+        # custom field names and types from custom_field_cache.
+        return queryset.only(
+            "id",
+            "provider_id",
+            "external_id",
+            "first_name",
+            "middle_name",
+            "last_name",
+            "date_of_birth",
+            "status",
+            "created_at",
+            "custom_field_data",
+        ).prefetch_related(Prefetch("addresses", queryset=addresses))
 
     def get_serializer_class(self):
-        if self.action in ["list", "retrieve"]:
+        if self.action in self.read_actions:
             return PatientListSerializer
         return PatientCreateSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.user.is_authenticated and self.is_field_selected(
+            "custom_field_values"
+        ):
+            context["custom_fields"] = self.get_custom_fields()
+        return context
+
+    def get_custom_fields(self):
+        """
+        The requesting provider's custom fields by id, looked up once per
+        request. Async views set ``custom_fields`` before using the view.
+        """
+        if self.custom_fields is None:
+            self.custom_fields = custom_field_cache.for_provider(self.request.user.pk)
+        return self.custom_fields
+
     def perform_create(self, serializer):
         serializer.save(provider=self.request.user)
 
+    @extend_schema(
+        request=PatientBulkSerializer(many=True),
+        parameters=[
+            OpenApiParameter(
+                "upsert",
+                bool,
+                description="Update patients whose external_id already exists "
+                "instead of reporting them as errors.",
+            ),
+        ],
+        responses={200: PatientBulkResultSerializer},
+    )
+    @action(["post"], detail=False, parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise serializers.ValidationError(
+                {"non_field_errors": [_("Expected a list of patients.")]}
+            )
+
+        upsert = serializers.BooleanField().to_internal_value(
+            request.query_params.get("upsert", False)
+        )
+        result = bulk_upsert_patients(request.user, request.data, upsert=upsert)
+        return Response(PatientBulkResultSerializer(result).data)
 
-class CustomFieldViewSet(viewsets.ModelViewSet):
+    @extend_schema(
+        request=PatientMutationSerializer,
+        parameters=[PatientFilterSerializer],
+        responses={200: PatientMutationResultSerializer},
+    )
+    @action(["post"], detail=False, pagination_class=None)
+    def mutate(self, request, *args, **kwargs):
+        """
+        Set the status, set a custom field value or delete every patient
+        matching the list filters in the query string and the ``ids`` in the
+        body, with set-based SQL in chunks rather than a request per patient.
+        Returns how many patients matched and how many changed. With
+        ``dry_run`` nothing is changed.
+        """
+        filters = [*PatientFilterSerializer().fields, api_settings.SEARCH_PARAM]
+        serializer = PatientMutationSerializer(
+            data=request.data,
+            context={
+                "custom_fields": self.get_custom_fields(),
+                "filtered": any(name in request.query_params for name in filters),
+            },
+        )
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        patients = self.filter_queryset(self.get_queryset())
+        if "ids" in data:
+            patients = patients.filter(pk__in=data["ids"])
+        result = mutate_patients(
+            patients,
+            request.user.pk,
+            data["operation"],
+            status=data.get("status"),
+            custom_field_value=data.get("custom_field_value"),
+            dry_run=data["dry_run"],
+        )
+        return Response(PatientMutationResultSerializer(result).data)
+
+    @extend_schema(
+        parameters=[PatientStatsQuerySerializer],
+        responses={200: PatientStatsSerializer},
+    )
+    @action(["get"], detail=False, filter_backends=[], pagination_class=None)
+    def stats(self, request, *args, **kwargs):
+        """
+        Dashboard counts of the provider's patients by status, by state of the
+        primary address and by week created. Served from counters that are
+        updated on every write, so the cost does not depend on the number of
+        patients.
+        """
+        query = PatientStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        stats = get_patient_stats(request.user.pk, weeks=query.validated_data["weeks"])
+        return Response(PatientStatsSerializer(stats).data)
+
+    @extend_schema(
+        parameters=[ChangesQuerySerializer],
+        responses={200: PatientChangesSerializer},
+    )
+    @action(["get"], detail=False, filter_backends=[], pagination_class=None)
+    def changes(self, request, *args, **kwargs):
+        """
+        The provider's patients created, changed or deleted since ``cursor``,
+        oldest first, for clients that keep a copy of the roster. Patients
+        are changed when their addresses or custom field values are. Call
+        again with the returned cursor right away while ``more`` is true, and
+        later to poll. A cursor older than the retained deletions is refused
+        with 410, and the client has to start over without one.
+        """
+        query = ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        queryset = self.filter_queryset(self.get_queryset())
+        changes = get_changes(
+            queryset.values(*patient_row_columns(), "modified_at"),
+            request.user.pk,
+            **query.validated_data,
+        )
+        changes.changed = self.get_rows(changes.changed, None)
+        return Response(vars(changes))
+
+    @extend_schema(
+        parameters=[PatientFilterSerializer],
+        responses={
+            (200, CSVRenderer.media_type): OpenApiTypes.STR,
+            (200, NDJSONRenderer.media_type): OpenApiTypes.STR,
+        },
+    )
+    @action(
+        ["get"],
+        detail=False,
+        renderer_classes=[CSVRenderer, NDJSONRenderer],
+        pagination_class=None,
+    )
+    def export(self, request, *args, **kwargs):
+        """
+        Stream all of the provider's patients matching the list filters as CSV
+        or NDJSON, selected by the Accept header or ``?format=``. Each row has
+        the primary address and one ``custom:<name>`` column per custom field.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        custom_fields = export_custom_fields(request.user)
+        columns = export_columns(custom_fields)
+
+        renderer = request.accepted_renderer
+        if isinstance(request._request, ASGIRequest):
+            # The ASGI handler would read a synchronous body into memory
+            # before sending any of it.
+            content = renderer.astream(columns, aexport_rows(queryset, custom_fields))
+        else:
+            content = renderer.stream(columns, export_rows(queryset, custom_fields))
+        response = StreamingHttpResponse(
+            content,
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="patients.{renderer.format}"'
+        )
+        return response
+
+
+@extend_schema_view(
+    list=extend_schema(parameters=fieldset_parameters(PatientCustomFieldSerializer)),
+    retrieve=extend_schema(
+        parameters=fieldset_parameters(PatientCustomFieldSerializer)
+    ),
+)
+class CustomFieldViewSet(ReplicaReadMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing custom fields.
-    
+
     Provides CRUD operations for custom fields.
     """
+
     queryset = CustomField.objects.all()
     serializer_class = PatientCustomFieldSerializer
     permission_classes = [IsAuthenticated]
+    replica_actions = ["list", "retrieve", "changes"]
 
     def get_queryset(self):
         return self.queryset.filter(provider=self.request.user)
@@ -134,4 +392,24 @@ class CustomFieldViewSet(viewsets.ModelViewSet):
         return PatientCustomFieldSerializer
 
     def perform_create(self, serializer):
-        serializer.save(provider=self.request.user)
\ No newline at end of file
+        serializer.save(provider=self.request.user)
+
+    @extend_schema(
+        parameters=[ChangesQuerySerializer],
+        responses={200: CustomFieldChangesSerializer},
+    )
+    @action(["get"], detail=False, pagination_class=None)
+    def changes(self, request, *args, **kwargs):
+        """
+        The provider's custom fields created, changed or deleted since
+        ``cursor``, oldest first. Paged and polled like the patient changes.
+        """
+        query = ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        changes = get_changes(
+            self.filter_queryset(self.get_queryset()),
+            request.user.pk,
+            **query.validated_data,
+        )
+        changes.changed = self.get_serializer(changes.changed, many=True).data
+        return Response(vars(changes))
@@ -1,7 +1,14 @@
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
 
 application = get_asgi_application()
+
+if settings.DEBUG:
+    # As runserver, serve the static files of the admin and browsable API.
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(application)
@@ -0,0 +1,204 @@
+"""
+Async versions of the patient list, retrieve and stats endpoints, and the
+patient event stream, served under /api/async/ by the ASGI application.
+
+They answer like the PatientViewSet actions and reuse its filters, field
+selection, pagination, list response cache and row building, but
+authenticate and read the database through the async ORM, so that a worker
+can serve other requests while Postgres answers.
+"""
+
+from abc import ABCMeta, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .api import PatientViewSet
+from .authentication import CachedJWTAuthentication
+from .cache import (
+    cached_list_response,
+    custom_field_cache,
+    list_etag,
+    patch_list_response,
+    patient_cache,
+)
+from .events import patient_event_stream
+from .models import Patient
+from .renderers import ORJSONRenderer
+from .rows import apatient_rows, patient_row_columns
+from .serializers import PatientStatsQuerySerializer, PatientStatsSerializer
+from .stats import aget_patient_stats
+
+
+class AsyncAPIView(View, metaclass=ABCMeta):
+    """
+    Base of the async endpoints: authenticates the request with a JWT, calls
+    ``respond`` and renders the DRF Response it returns, or the error, as
+    JSON.
+    """
+
+    authenticator_class = CachedJWTAuthentication
+    renderer_class = ORJSONRenderer
+
+    async def get(self, request, *args, **kwargs):
+        request = Request(request)
+        request.accepted_renderer = self.renderer_class()
+        request.accepted_media_type = request.accepted_renderer.media_type
+        try:
+            await self.authenticate(request)
+            response = await self.respond(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(request, exc)
+        if isinstance(response, Response):
+            response = self.render(request, response)
+        return response
+
+    @abstractmethod
+    async def respond(self, request, *args, **kwargs):
+        """
+        The DRF Response, or Django response, to the authenticated request.
+        """
+
+    async def authenticate(self, request):
+        result = await self.authenticator_class().aauthenticate(request)
+        if result is None:
+            raise exceptions.NotAuthenticated()
+        request.user, request.auth = result
+
+    def handle_exception(self, request, exc):
+        # As APIView.handle_exception().
+        if isinstance(
+            exc, exceptions.NotAuthenticated | exceptions.AuthenticationFailed
+        ):
+            exc.auth_header = self.authenticator_class().authenticate_header(request)
+        response = api_settings.EXCEPTION_HANDLER(
+            exc, {"view": self, "request": request}
+        )
+        if response is None:
+            raise exc
+        response.exception = True
+        return response
+
+    def render(self, request, response):
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = {
+            "view": self,
+            "request": request,
+            "response": response,
+        }
+        return response.render()
+
+
+class AsyncPatientView(AsyncAPIView):
+    """
+    Base of the async patient endpoints, which delegate to a PatientViewSet
+    set up for the request and for ``action``.
+    """
+
+    action = None
+
+    async def get_viewset(self, request, **kwargs):
+        viewset = PatientViewSet(
+            request=request,
+            args=(),
+            kwargs=kwargs,
+            action=self.action,
+            format_kwarg=None,
+        )
+        # Loaded here, as the filters and rows only read them.
+        viewset.custom_fields = await sync_to_async(custom_field_cache.for_provider)(
+            request.user.pk
+        )
+        return viewset
+
+
+class AsyncPatientListView(AsyncPatientView):
+    """
+    The patient list, as ``GET /api/patients/``.
+    """
+
+    action = "list"
+
+    async def respond(self, request):
+        viewset = await self.get_viewset(request)
+        key = await sync_to_async(viewset.get_list_cache_key)(request)
+        etag = list_etag(key)
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cached = await patient_cache().aget(key)
+            if cached is not None:
+                response = cached_list_response(cached)
+            else:
+                selected = viewset.get_selected_fields()
+                queryset = viewset.filter_queryset(viewset.get_queryset())
+                page = await viewset.paginator.apaginate_queryset(
+                    queryset.values(*patient_row_columns(selected)), request, viewset
+                )
+                rows = await apatient_rows(page, viewset.custom_fields, selected)
+                response = self.render(request, viewset.get_paginated_response(rows))
+                await patient_cache().aset(
+                    key, (response.content, response["Content-Type"])
+                )
+
+        return patch_list_response(response, etag)
+
+
+class AsyncPatientDetailView(AsyncPatientView):
+    """
+    One patient, as ``GET /api/patients/<id>/``.
+    """
+
+    action = "retrieve"
+
+    async def respond(self, request, pk):
+        viewset = await self.get_viewset(request, pk=pk)
+        selected = viewset.get_selected_fields()
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        try:
+            patient = await queryset.values(*patient_row_columns(selected)).aget(pk=pk)
+        except Patient.DoesNotExist as e:
+            raise Http404 from e
+        rows = await apatient_rows([patient], viewset.custom_fields, selected)
+        return Response(rows[0])
+
+
+class AsyncPatientStatsView(AsyncAPIView):
+    """
+    The dashboard counts, as ``GET /api/patients/stats/``.
+    """
+
+    async def respond(self, request):
+        query = PatientStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        stats = await aget_patient_stats(
+            request.user.pk, weeks=query.validated_data["weeks"]
+        )
+        return Response(PatientStatsSerializer(stats).data)
+
+
+class AsyncPatientEventsView(AsyncAPIView):
+    """
+    Server-sent events for changes of the provider's patients, as
+    ``GET /api/async/patients/events/``. ``changed`` and ``deleted`` events
+    carry the patient ids, or null when a write touched too many to list.
+    ``resync`` events mean that events were lost. Clients fetch the changes
+    endpoint when they connect and on ``resync`` or null ids.
+    """
+
+    async def respond(self, request):
+        response = StreamingHttpResponse(
+            patient_event_stream(request.user.pk), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stops nginx from buffering the stream.
+        response["X-Accel-Buffering"] = "no"
+        return response
@@ -0,0 +1,447 @@
+import asyncio
+import math
+import random
+import re
+import resource
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection, connections
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .cache import invalidate_custom_field_cache
+from .models import (
+    AddressType,
+    CustomField,
+    CustomFieldType,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+    PatientStatus,
+)
+from .pagination import KeysetPagination
+from .projection import project_custom_field_values
+from .seed import (
+    SEED_ADDRESS_WEIGHTS,
+    SEED_CHUNK_SIZE,
+    SeedOptions,
+    run_seed_chunks,
+    seed_chunks,
+    seed_provider,
+)
+from .stats import count_patient_stats, delete_patients, record_patient_stats
+
+BENCHMARK_PASSWORD = "benchmark"
+
+# Patients and custom fields created by the benchmark itself, removed
+# afterwards so that the seeded data stays the same between runs.
+BENCHMARK_PREFIX = "bench-"
+
+# Number of seeded patients retrieve requests are spread over.
+BENCHMARK_SAMPLE_SIZE = 1000
+
+
+def seed_benchmark_provider(size, workers=1, chunk_size=SEED_CHUNK_SIZE):
+    """
+    Get the benchmark provider for ``size`` patients, seeding whatever is
+    missing. Seeding is deterministic, so every run measures the same data.
+    """
+    provider, custom_fields = seed_provider(
+        size, 2, BENCHMARK_PASSWORD, username=f"benchmark-{size}@example.com"
+    )
+    options = SeedOptions(
+        seed=0,
+        status_weights=dict.fromkeys(PatientStatus.values, 1),
+        address_weights=SEED_ADDRESS_WEIGHTS,
+    )
+    chunks = list(seed_chunks(size, provider.pk, custom_fields, size, chunk_size))
+    for _created in run_seed_chunks(chunks, options, workers):
+        pass
+    return provider
+
+
+def server_timing_queries(response):
+    """
+    The query count PerformanceMiddleware reports in the Server-Timing
+    header, 0 when metrics are disabled.
+    """
+    match = re.search(r'desc="(\d+) queries"', response.get("Server-Timing", ""))
+    return int(match[1]) if match else 0
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(math.ceil(len(ordered) * percent / 100) - 1, 0)
+    return ordered[index]
+
+
+class PatientBenchmark:
+    """
+    Measures the patient and custom field endpoints for one seeded provider
+    through the URL routes, with ``concurrency`` clients on their own threads
+    and database connections sending ``requests`` requests in total. The
+    async endpoints are measured with ``concurrency`` clients on one event
+    loop instead.
+    """
+
+    def __init__(self, provider, size, requests=200, concurrency=4, warmup=10):
+        self.provider = provider
+        self.size = size
+        self.requests = requests
+        self.concurrency = concurrency
+        self.warmup = warmup
+        self.custom_fields = list(
+            CustomField.objects.filter(provider=provider).exclude(
+                name__startswith=BENCHMARK_PREFIX
+            )
+        )
+
+        response = Client(SERVER_NAME="localhost").post(
+            reverse("token_obtain_pair"),
+            {"username": provider.username, "password": BENCHMARK_PASSWORD},
+        )
+        self.token = response.json()["access"]
+
+    def client(self):
+        return Client(
+            SERVER_NAME="localhost", HTTP_AUTHORIZATION=f"Bearer {self.token}"
+        )
+
+    def async_client(self):
+        # AsyncClient sends its default headers under their WSGI names, so
+        # they are passed with each request instead. Its requests are always
+        # for the "testserver" host, which measure_async() allows.
+        client = AsyncClient()
+        headers = {"Authorization": f"Bearer {self.token}"}
+
+        def get(path):
+            return client.get(path, headers=headers)
+
+        return get
+
+    def run(self):
+        try:
+            return [
+                self.measure(name, send, expected)
+                for name, send, expected in self.scenarios()
+            ]
+        finally:
+            self.cleanup()
+
+    def scenarios(self):
+        patients = reverse("api-patients-list")
+        custom_fields = reverse("custom-field-list")
+        count = self.warmup + self.requests
+
+        sample = self.sample_patients()
+        last_page = max(math.ceil(self.size / 100), 1)
+        deep_cursor = self.cursor_at(int(self.size * 0.9))
+        updated = self.create_patients("update", count)
+        deleted = self.create_patients("delete", count)
+        updated_fields = self.create_custom_fields("update", count)
+        deleted_fields = self.create_custom_fields("delete", count)
+
+        def detail(pk):
+            return reverse("api-patients-detail", args=[pk])
+
+        def field_detail(pk):
+            return reverse("custom-field-detail", args=[pk])
+
+        stats = reverse("api-patients-stats")
+        async_patients = reverse("api-async-patients-list")
+        async_stats = reverse("api-async-patients-stats")
+
+        async def async_list(get, n):
+            return await get(async_patients)
+
+        async def async_retrieve(get, n):
+            return await get(
+                reverse("api-async-patients-detail", args=[sample[n % len(sample)]])
+            )
+
+        async def async_stats_get(get, n):
+            return await get(async_stats)
+
+        return [
+            ("patients_list", lambda client, n: client.get(patients), 200),
+            (
+                "patients_list_deep_page",
+                lambda client, n: client.get(patients, {"page": last_page}),
+                200,
+            ),
+            (
+                "patients_list_deep_cursor",
+                lambda client, n: client.get(
+                    patients, {"pagination": "cursor", "cursor": deep_cursor}
+                ),
+                200,
+            ),
+            (
+                "patients_retrieve",
+                lambda client, n: client.get(detail(sample[n % len(sample)])),
+                200,
+            ),
+            (
+                "patients_create",
+                lambda client, n: client.post(
+                    patients,
+                    self.payload(f"create-{n}"),
+                    content_type="application/json",
+                ),
+                201,
+            ),
+            (
+                "patients_update",
+                lambda client, n: client.put(
+                    detail(updated[n]),
+                    self.payload(f"update-{n}", first_name="Updated"),
+                    content_type="application/json",
+                ),
+                200,
+            ),
+            (
+                "patients_delete",
+                lambda client, n: client.delete(detail(deleted[n])),
+                204,
+            ),
+            ("patients_list_async", async_list, 200),
+            ("patients_retrieve_async", async_retrieve, 200),
+            ("patients_stats", lambda client, n: client.get(stats), 200),
+            ("patients_stats_async", async_stats_get, 200),
+            ("custom_fields_list", lambda client, n: client.get(custom_fields), 200),
+            (
+                "custom_fields_create",
+                lambda client, n: client.post(
+                    custom_fields,
+                    {"name": f"{BENCHMARK_PREFIX}create-{n}", "field_type": "TEXT"},
+                    content_type="application/json",
+                ),
+                201,
+            ),
+            (
+                "custom_fields_update",
+                lambda client, n: client.patch(
+                    field_detail(updated_fields[n]),
+                    {"description": "Updated"},
+                    content_type="application/json",
+                ),
+                200,
+            ),
+            (
+                "custom_fields_delete",
+                lambda client, n: client.delete(field_detail(deleted_fields[n])),
+                204,
+            ),
+        ]
+
+    def measure(self, name, send, expected_status):
+        if iscoroutinefunction(send):
+            return asyncio.run(self.measure_async(name, send, expected_status))
+
+        client = self.client()
+        for number in range(self.warmup):
+            send(client, number)
+
+        numbers = iter(range(self.warmup, self.warmup + self.requests))
+        lock = threading.Lock()
+
+        def worker():
+            client = self.client()
+            latencies = []
+            errors = 0
+            with CaptureQueriesContext(connection) as queries:
+                while True:
+                    with lock:
+                        number = next(numbers, None)
+                    if number is None:
+                        break
+                    started = time.perf_counter()
+                    response = send(client, number)
+                    latencies.append(time.perf_counter() - started)
+                    errors += response.status_code != expected_status
+            connection.close()
+            return latencies, errors, len(queries)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            results = [executor.submit(worker) for _ in range(self.concurrency)]
+            results = [result.result() for result in results]
+        elapsed = time.perf_counter() - started
+        return self.summarize(name, results, elapsed)
+
+    async def measure_async(self, name, send, expected_status):
+        """
+        Measure an async endpoint with ``concurrency`` clients sharing one
+        event loop, as on a single ASGI worker.
+        """
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            return await self.measure_async_requests(name, send, expected_status)
+
+    async def measure_async_requests(self, name, send, expected_status):
+        client = self.async_client()
+        for number in range(self.warmup):
+            await self.send_async(send, client, number)
+
+        numbers = iter(range(self.warmup, self.warmup + self.requests))
+
+        async def worker():
+            client = self.async_client()
+            latencies = []
+            errors = 0
+            queries = 0
+            for number in numbers:
+                started = time.perf_counter()
+                response = await self.send_async(send, client, number)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code != expected_status
+                queries += server_timing_queries(response)
+            return latencies, errors, queries
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+        return self.summarize(name, results, elapsed)
+
+    async def send_async(self, send, client, number):
+        # Like the ASGI handler, run the sync parts of each request on a
+        # thread of its own. The thread ends with the request, so its database
+        # connection is closed rather than lost.
+        async with ThreadSensitiveContext():
+            try:
+                return await send(client, number)
+            finally:
+                await sync_to_async(connections.close_all)()
+
+    def summarize(self, name, results, elapsed):
+        latencies = [latency * 1000 for result in results for latency in result[0]]
+        return {
+            "size": self.size,
+            "scenario": name,
+            "requests": len(latencies),
+            "concurrency": self.concurrency,
+            "errors": sum(result[1] for result in results),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "queries_per_request": round(
+                sum(result[2] for result in results) / len(latencies), 2
+            ),
+            # ru_maxrss is in kilobytes on Linux.
+            "peak_rss_mb": round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+            ),
+        }
+
+    def sample_patients(self):
+        rng = random.Random(self.size)
+        numbers = rng.sample(range(self.size), min(self.size, BENCHMARK_SAMPLE_SIZE))
+        return list(
+            Patient.objects.filter(
+                provider=self.provider,
+                external_id__in=[f"seed-{self.size}-{number}" for number in numbers],
+            ).values_list("id", flat=True)
+        )
+
+    def cursor_at(self, offset):
+        paginator = KeysetPagination()
+        paginator.ordering = KeysetPagination.default_ordering
+        paginator.fields = KeysetPagination.orderings[paginator.ordering]
+        patient = (
+            Patient.objects.filter(provider=self.provider)
+            .order_by("id")
+            .only("id")[offset]
+        )
+        return paginator.encode_cursor(patient)
+
+    def payload(self, name, **overrides):
+        payload = {
+            "external_id": f"{BENCHMARK_PREFIX}{name}",
+            "first_name": "Bench",
+            "last_name": name,
+            "date_of_birth": "1980-01-01",
+            "status": PatientStatus.ACTIVE,
+            "addresses": [
+                {
+                    "address_type": AddressType.HOME,
+                    "street_address": "1 Main St",
+                    "city": "Springfield",
+                    "state": "CA",
+                    "postal_code": "90001",
+                    "is_primary": True,
+                }
+            ],
+            "custom_field_values": [
+                {"custom_field": custom_field.pk, "text_value": "Dr. Bench"}
+                if custom_field.field_type == CustomFieldType.TEXT
+                else {"custom_field": custom_field.pk, "number_value": 3}
+                for custom_field in self.custom_fields
+            ],
+        }
+        payload.update(overrides)
+        return payload
+
+    def create_patients(self, name, count):
+        payload = self.payload(name)
+        custom_field_data = project_custom_field_values(payload["custom_field_values"])
+        patients = Patient.objects.bulk_create(
+            Patient(
+                provider=self.provider,
+                external_id=f"{BENCHMARK_PREFIX}{name}-{number}-existing",
+                first_name="Bench",
+                last_name=name,
+                date_of_birth="1980-01-01",
+                status=PatientStatus.ACTIVE,
+                custom_field_data=custom_field_data,
+            )
+            for number in range(count)
+        )
+        PatientAddress.objects.bulk_create(
+            PatientAddress(patient=patient, **payload["addresses"][0])
+            for patient in patients
+        )
+        PatientCustomFieldValue.objects.bulk_create(
+            PatientCustomFieldValue(
+                patient=patient,
+                custom_field_id=value["custom_field"],
+                text_value=value.get("text_value"),
+                number_value=value.get("number_value"),
+            )
+            for patient in patients
+            for value in payload["custom_field_values"]
+        )
+        record_patient_stats(
+            count_patient_stats(
+                Patient.objects.filter(pk__in=[patient.pk for patient in patients])
+            )
+        )
+        return [patient.pk for patient in patients]
+
+    def create_custom_fields(self, name, count):
+        custom_fields = CustomField.objects.bulk_create(
+            CustomField(
+                provider=self.provider,
+                name=f"{BENCHMARK_PREFIX}{name}-{number}",
+                field_type=CustomFieldType.TEXT,
+            )
+            for number in range(count)
+        )
+        invalidate_custom_field_cache(self.provider.pk)
+        return [custom_field.pk for custom_field in custom_fields]
+
+    def cleanup(self):
+        delete_patients(
+            Patient.objects.filter(
+                provider=self.provider, external_id__startswith=BENCHMARK_PREFIX
+            )
+        )
+        CustomField.objects.filter(
+            provider=self.provider, name__startswith=BENCHMARK_PREFIX
+        ).delete()
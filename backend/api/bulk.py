@@ -0,0 +1,221 @@
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils.translation import gettext_lazy as _
+
+from .cache import custom_field_cache, invalidate_patient_cache
+from .models import Patient, PatientAddress, PatientCustomFieldValue
+from .projection import project_custom_field_values
+from .serializers import PatientBulkSerializer
+from .stats import address_stats, patient_stats, record_patient_stats, status_stats
+
+logger = logging.getLogger(__name__)
+
+BULK_CHUNK_SIZE = 500
+
+# Violated when another request creates the same external id concurrently.
+EXTERNAL_ID_CONSTRAINT = "patients_provider_external_id_uniq"
+DUPLICATE_EXTERNAL_ID_MESSAGE = _("A patient with this external id already exists.")
+
+PATIENT_UPSERT_FIELDS = [
+    "first_name",
+    "middle_name",
+    "last_name",
+    "date_of_birth",
+    "status",
+    "custom_field_data",
+    "modified_at",
+]
+
+
+@dataclass
+class BulkResult:
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, index, errors):
+        self.errors.append({"index": index, "errors": errors})
+
+
+def bulk_upsert_patients(provider, rows, upsert=False, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Validate and write a batch of patients with their nested addresses and
+    custom field values.
+
+    Rows are written with one INSERT per table and chunk, each chunk in its own
+    transaction. With ``upsert`` rows whose ``external_id`` already exists for
+    the provider update that patient and replace its nested rows. Invalid rows
+    are reported by index in the result and do not stop the rest of the batch.
+    """
+    result = BulkResult()
+    valid_rows = validate_rows(provider, rows, result)
+
+    for start in range(0, len(valid_rows), chunk_size):
+        write_chunk(provider, valid_rows[start : start + chunk_size], upsert, result)
+
+    result.errors.sort(key=lambda error: error["index"])
+    return result
+
+
+def validate_rows(provider, rows, result):
+    context = {"custom_fields": custom_field_cache.for_provider(provider.pk)}
+    external_ids = set()
+    valid_rows = []
+
+    for index, row in enumerate(rows):
+        serializer = PatientBulkSerializer(data=row, context=context)
+        if not serializer.is_valid():
+            result.add_error(index, serializer.errors)
+            continue
+
+        external_id = serializer.validated_data.get("external_id")
+        if external_id is not None:
+            if external_id in external_ids:
+                result.add_error(
+                    index,
+                    {"external_id": [_("Duplicate external id in this batch.")]},
+                )
+                continue
+            external_ids.add(external_id)
+
+        valid_rows.append((index, serializer.validated_data))
+
+    return valid_rows
+
+
+def write_chunk(provider, chunk, upsert, result, retry=True):
+    try:
+        with transaction.atomic():
+            created, updated, errors = insert_rows(provider, chunk, upsert)
+            invalidate_patient_cache(provider_ids=[provider.pk])
+    except DatabaseError as e:
+        if upsert and retry and is_duplicate_external_id(e):
+            # Another request created one of the new patients after they were
+            # read. Read again, so that it is updated with the existing ones.
+            write_chunk(provider, chunk, upsert, result, retry=False)
+            return
+        if len(chunk) == 1:
+            logger.exception("Could not write bulk patient row %s.", chunk[0][0])
+            result.add_error(chunk[0][0], database_error(e))
+            return
+        # Isolate the failing rows so the rest of the chunk is still written.
+        for row in chunk:
+            write_chunk(provider, [row], upsert, result)
+        return
+
+    result.created += created
+    result.updated += updated
+    for index, error in errors:
+        result.add_error(index, error)
+
+
+def database_error(e):
+    """
+    The error reported for a row the database rejected. The database's message
+    names constraints and can quote other patients' values, so it is only
+    logged.
+    """
+    if is_duplicate_external_id(e):
+        return {"external_id": [DUPLICATE_EXTERNAL_ID_MESSAGE]}
+    if isinstance(e, IntegrityError):
+        return {"non_field_errors": [_("This patient conflicts with existing data.")]}
+    return {"non_field_errors": [_("This patient could not be saved.")]}
+
+
+def is_duplicate_external_id(e):
+    diag = getattr(e.__cause__, "diag", None)
+    return getattr(diag, "constraint_name", None) == EXTERNAL_ID_CONSTRAINT
+
+
+def insert_rows(provider, chunk, upsert):
+    """
+    Write the chunk and return the created and updated counts and the errors
+    of the rows that were not written.
+
+    The patients that already exist are read first, and locked when upserting
+    so that their status does not change before they are updated. The other
+    patients are inserted without a conflict clause: if another request
+    creates one of them in the meantime, the insert fails rather than
+    updating a patient whose nested rows and statistics are not replaced.
+    """
+    external_ids = [
+        data["external_id"] for _index, data in chunk if data.get("external_id")
+    ]
+    existing = {}
+    if external_ids:
+        patients = Patient.objects.filter(
+            provider=provider, external_id__in=external_ids
+        )
+        if upsert:
+            patients = patients.select_for_update()
+        existing = dict(patients.values_list("external_id", "status"))
+
+    errors = []
+    if not upsert and existing:
+        errors = [
+            (index, {"external_id": [DUPLICATE_EXTERNAL_ID_MESSAGE]})
+            for index, data in chunk
+            if data.get("external_id") in existing
+        ]
+        chunk = [
+            (index, data)
+            for index, data in chunk
+            if data.get("external_id") not in existing
+        ]
+
+    stats = Counter()
+    patients = []
+    for _index, data in chunk:
+        data = dict(data)
+        data.pop("addresses")
+        custom_field_data = project_custom_field_values(
+            data.pop("custom_field_values", [])
+        )
+        patients.append(
+            Patient(provider=provider, custom_field_data=custom_field_data, **data)
+        )
+
+    Patient.objects.bulk_create(
+        [patient for patient in patients if patient.external_id not in existing]
+    )
+    replaced = [patient for patient in patients if patient.external_id in existing]
+    if replaced:
+        Patient.objects.bulk_create(
+            replaced,
+            update_conflicts=True,
+            unique_fields=["provider", "external_id"],
+            update_fields=PATIENT_UPSERT_FIELDS,
+        )
+        replaced_ids = [patient.pk for patient in replaced]
+        addresses = PatientAddress.objects.filter(patient_id__in=replaced_ids)
+        stats.update(
+            address_stats(provider.pk, addresses.values_list("is_primary", "state"), -1)
+        )
+        addresses.delete()
+        PatientCustomFieldValue.objects.filter(patient_id__in=replaced_ids).delete()
+
+    addresses = PatientAddress.objects.bulk_create(
+        PatientAddress(patient=patient, **address)
+        for patient, (_index, data) in zip(patients, chunk, strict=True)
+        for address in data["addresses"]
+    )
+    PatientCustomFieldValue.objects.bulk_create(
+        PatientCustomFieldValue(patient=patient, **value)
+        for patient, (_index, data) in zip(patients, chunk, strict=True)
+        for value in data.get("custom_field_values", [])
+    )
+
+    stats.update(address_stats(provider.pk, addresses))
+    for patient in patients:
+        if patient.external_id in existing:
+            stats.update(status_stats(provider.pk, existing[patient.external_id], -1))
+            stats.update(status_stats(provider.pk, patient.status))
+        else:
+            stats.update(patient_stats(provider.pk, patient.status, patient.created_at))
+    record_patient_stats(stats)
+
+    updated = sum(patient.external_id in existing for patient in patients)
+    return len(patients) - updated, updated, errors
@@ -0,0 +1,324 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import CustomField, Patient, User
+
+_pending = threading.local()
+
+
+def patient_cache():
+    return caches[settings.PATIENT_CACHE_ALIAS]
+
+
+def get_version(key):
+    """
+    Current version stored under ``key``. Versions are random rather than
+    counters, so a version lost to eviction is never handed out again for
+    different data.
+    """
+    cache = patient_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    patient_cache().set(key, uuid4().hex, None)
+
+
+def version_key(provider_id):
+    return f"patients:version:{provider_id}"
+
+
+def get_patient_version(provider_id):
+    return get_version(version_key(provider_id))
+
+
+def bump_patient_version(provider_id):
+    bump_version(version_key(provider_id))
+
+
+def invalidate_patient_cache(provider_ids=(), patient_ids=()):
+    """
+    Bump the data version of the given providers, and of the providers of the
+    given patients, once the current transaction commits. Bumping earlier
+    would let a concurrent request cache the old rows under the new version.
+
+    Calls within a transaction are collected, so every provider is bumped
+    once however many rows changed.
+    """
+    if not hasattr(_pending, "provider_ids"):
+        _pending.provider_ids = set()
+        _pending.patient_ids = set()
+    _pending.provider_ids.update(provider_ids)
+    _pending.patient_ids.update(patient_ids)
+    transaction.on_commit(flush_patient_cache_invalidation)
+
+
+def flush_patient_cache_invalidation():
+    provider_ids = getattr(_pending, "provider_ids", set())
+    patient_ids = getattr(_pending, "patient_ids", set())
+    if not provider_ids and not patient_ids:
+        return
+
+    _pending.provider_ids = set()
+    _pending.patient_ids = set()
+    if patient_ids:
+        provider_ids |= set(
+            Patient.objects.filter(pk__in=patient_ids).values_list(
+                "provider_id", flat=True
+            )
+        )
+    for provider_id in provider_ids:
+        bump_patient_version(provider_id)
+
+
+def custom_field_version_key(provider_id):
+    return f"custom_fields:version:{provider_id}"
+
+
+class CustomFieldCache:
+    """
+    In-process LRU cache of the custom fields of the ``maxsize`` most
+    recently used providers, as CustomField instances with only ``id``,
+    ``provider_id``, ``name`` and ``field_type`` loaded.
+
+    Entries are checked against a per-provider version in the shared patient
+    cache, so a change made by another process is picked up on the next
+    lookup. The returned dicts are shared and must not be modified.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.providers = {}
+        self.lock = threading.Lock()
+
+    def for_provider(self, provider_id):
+        """
+        The provider's custom fields by id.
+        """
+        version = get_version(custom_field_version_key(provider_id))
+        with self.lock:
+            entry = self.entries.get(provider_id)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(provider_id)
+                return entry[1]
+
+        custom_fields = {
+            custom_field.pk: custom_field
+            # From the primary, as a lagging replica could return fields older
+            # than the version they are stored under.
+            for custom_field in CustomField.objects.using(DEFAULT_DB_ALIAS)
+            .filter(provider_id=provider_id)
+            .only("id", "provider_id", "name", "field_type")
+            .order_by("id")
+        }
+        with self.lock:
+            self.drop(provider_id)
+            self.entries[provider_id] = (version, custom_fields)
+            self.providers.update(dict.fromkeys(custom_fields, provider_id))
+            while len(self.entries) > self.maxsize:
+                self.drop(next(iter(self.entries)))
+        return custom_fields
+
+    def get(self, custom_field_id):
+        """
+        A custom field of any provider by id, or None if it does not exist.
+        """
+        with self.lock:
+            provider_id = self.providers.get(custom_field_id)
+        if provider_id is None:
+            provider_id = (
+                CustomField.objects.using(DEFAULT_DB_ALIAS)
+                .filter(pk=custom_field_id)
+                .values_list("provider_id", flat=True)
+                .first()
+            )
+            if provider_id is None:
+                return None
+        return self.for_provider(provider_id).get(custom_field_id)
+
+    def drop(self, provider_id):
+        _version, custom_fields = self.entries.pop(provider_id, (None, {}))
+        for custom_field_id in custom_fields:
+            self.providers.pop(custom_field_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.providers.clear()
+
+
+custom_field_cache = CustomFieldCache(settings.CUSTOM_FIELD_CACHE_SIZE)
+
+
+def invalidate_custom_field_cache(provider_id):
+    """
+    Bump the provider's custom field version once the current transaction
+    commits.
+    """
+    transaction.on_commit(lambda: bump_version(custom_field_version_key(provider_id)))
+
+
+def user_version_key(user_id):
+    return f"users:version:{user_id}"
+
+
+class UserCache:
+    """
+    In-process LRU cache of the ``maxsize`` most recently authenticated
+    users, each kept for ``timeout`` seconds, so that authenticating a
+    request does not query the database.
+
+    Entries are checked against a per-user version in the shared patient
+    cache, bumped when the user is saved or deleted, so that a password
+    change, deactivation or deletion applies to the next request in every
+    process. Users are not kept when the patient cache holds no version,
+    such as when it is turned off. Each lookup returns a copy, which the
+    request may modify.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        The user with the given id. Raises User.DoesNotExist.
+        """
+        version = get_version(user_version_key(user_id))
+        user = self.lookup(user_id, version)
+        if user is None:
+            user = User.objects.get(pk=user_id)
+            self.store(user_id, version, user)
+        return copy.copy(user)
+
+    async def aget(self, user_id):
+        """
+        get() for async views.
+        """
+        version = await sync_to_async(get_version)(user_version_key(user_id))
+        user = self.lookup(user_id, version)
+        if user is None:
+            user = await User.objects.aget(pk=user_id)
+            self.store(user_id, version, user)
+        return copy.copy(user)
+
+    def lookup(self, user_id, version):
+        if version is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            entry_version, expires, user = entry
+            if entry_version != version or expires <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return user
+
+    def store(self, user_id, version, user):
+        if version is None:
+            return
+        with self.lock:
+            self.entries[user_id] = (version, time.monotonic() + self.timeout, user)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TIMEOUT)
+
+
+def invalidate_user_cache(user_id):
+    """
+    Bump the user's version once the current transaction commits.
+    """
+    transaction.on_commit(lambda: bump_version(user_version_key(user_id)))
+
+
+def list_etag(key):
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def cached_list_response(cached):
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def patch_list_response(response, etag):
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class CachedListMixin:
+    """
+    Caches rendered list responses per provider, query string and data
+    version, and answers ``If-None-Match`` with 304.
+
+    The ETag only depends on the cache key, so conditional requests and cache
+    hits are answered after a single cache read, without querying patients.
+    """
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_list_cache_key(request)
+        etag = list_etag(key)
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cached = patient_cache().get(key)
+            if cached is not None:
+                response = cached_list_response(cached)
+            else:
+                response = super().list(request, *args, **kwargs)
+                response.add_post_render_callback(
+                    lambda rendered: self.store_list_response(key, rendered)
+                )
+
+        return patch_list_response(response, etag)
+
+    def get_list_cache_key(self, request):
+        # The absolute URI is part of the key as pagination links contain it.
+        query = sorted(request.query_params.lists())
+        material = "|".join(
+            [
+                request.build_absolute_uri(request.path),
+                repr(query),
+                request.accepted_media_type or "",
+            ]
+        )
+        digest = hashlib.sha256(material.encode()).hexdigest()
+        return (
+            f"patients:list:{request.user.pk}:"
+            f"{get_patient_version(request.user.pk)}:{digest}"
+        )
+
+    def store_list_response(self, key, response):
+        if response.status_code == status.HTTP_200_OK:
+            patient_cache().set(key, (response.content, response["Content-Type"]))
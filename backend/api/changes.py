@@ -0,0 +1,189 @@
+"""
+Change feeds of the patient and custom field endpoints, for clients that keep
+a copy of a provider's rows and only fetch what changed since their last sync.
+
+Rows are reported by ``modified_at``, which every write that changes a
+patient's representation bumps: its own fields, its addresses, its custom
+field values through the projection, and renames of the custom fields it
+shows. Deleted patients and custom fields leave a Tombstone. Addresses and
+values deleted with their patient need none, and the other deletes show up as
+a change of their patient.
+
+Both streams are read in ``(time, id)`` order after the cursor, merged and cut
+at the page size. ``modified_at`` is set before the transaction commits, so a
+row can become visible with a time older than rows already served. The cursor
+therefore never passes CHANGES_SETTLE_SECONDS behind the clock: a page that
+reaches into that window is the last one, and the changes of the window are
+served again by the next call.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, status
+
+from .models import Tombstone
+
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 1000
+
+# Changes sort before deletions made at the same time.
+CHANGED = 0
+DELETED = 1
+
+TOMBSTONE_SQL = """
+INSERT INTO {tombstones} (provider_id, object_type, object_id, deleted_at)
+SELECT provider_id, %s, id, %s FROM ({rows}) deleted
+"""
+
+
+class CursorExpired(exceptions.APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = _(
+        "The cursor is older than the retained deletions. Fetch all rows again "
+        "without a cursor."
+    )
+    default_code = "cursor_expired"
+
+
+@dataclass
+class Changes:
+    changed: list
+    deleted: list
+    cursor: str
+    more: bool
+
+
+def encode_change_cursor(position):
+    time, kind, pk = position
+    payload = json.dumps(
+        {"t": time.isoformat(), "k": kind, "i": pk}, separators=(",", ":")
+    )
+    return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_change_cursor(encoded):
+    """
+    The ``(time, kind, id)`` position of a cursor. Raises ValueError for
+    cursors this module did not make.
+    """
+    try:
+        padded = encoded + "=" * (-len(encoded) % 4)
+        payload = json.loads(urlsafe_b64decode(padded.encode()).decode())
+        time = datetime.fromisoformat(payload["t"])
+        kind, pk = int(payload["k"]), int(payload["i"])
+    except (TypeError, ValueError, KeyError, AttributeError) as e:
+        raise ValueError("invalid cursor") from e
+    if timezone.is_naive(time) or kind not in (CHANGED, DELETED):
+        raise ValueError("invalid cursor")
+    return time, kind, pk
+
+
+def seek_filter(field, kind, position):
+    """
+    Rows of a stream of ``kind`` whose ``(field, kind, pk)`` sorts after
+    ``position``.
+    """
+    time, cursor_kind, cursor_pk = position
+    after = Q(**{f"{field}__gt": time})
+    if kind > cursor_kind:
+        after |= Q(**{field: time})
+    elif kind == cursor_kind:
+        after |= Q(**{field: time, "pk__gt": cursor_pk})
+    return Q(**{f"{field}__gte": time}) & after
+
+
+def row_position(row):
+    if isinstance(row, dict):
+        return row["modified_at"], CHANGED, row["id"]
+    return row.modified_at, CHANGED, row.pk
+
+
+def tombstone_retention():
+    return timedelta(days=settings.CHANGES_TOMBSTONE_RETENTION_DAYS)
+
+
+def get_changes(queryset, provider_id, cursor=None, page_size=CHANGES_PAGE_SIZE):
+    """
+    The rows of ``queryset``, one provider's patients or custom fields, changed
+    after the ``cursor`` position, and the ids of the provider's rows of that
+    model deleted after it, oldest first. Without a cursor every row is
+    changed. ``queryset`` may be a ``values()`` queryset that includes ``id``
+    and ``modified_at``.
+
+    Raises CursorExpired for cursors older than CHANGES_TOMBSTONE_RETENTION_DAYS,
+    whose deletions may have been pruned.
+    """
+    now = timezone.now()
+    if cursor is not None and cursor[0] < now - tombstone_retention():
+        raise CursorExpired()
+
+    tombstones = Tombstone.objects.using(queryset.db).filter(
+        provider_id=provider_id, object_type=queryset.model._meta.model_name
+    )
+    changed = queryset.order_by("modified_at", "id")
+    tombstones = tombstones.order_by("deleted_at", "id").values_list(
+        "deleted_at", "id", "object_id"
+    )
+    if cursor is not None:
+        changed = changed.filter(seek_filter("modified_at", CHANGED, cursor))
+        tombstones = tombstones.filter(seek_filter("deleted_at", DELETED, cursor))
+
+    # One more than a page of each, to tell whether there is more.
+    entries = sorted(
+        [(row_position(row), row) for row in changed[: page_size + 1]]
+        + [
+            ((deleted_at, DELETED, pk), object_id)
+            for deleted_at, pk, object_id in tombstones[: page_size + 1]
+        ],
+        key=lambda entry: entry[0],
+    )
+    more = len(entries) > page_size
+    entries = entries[:page_size]
+
+    settled = (now - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS), CHANGED, 0)
+    if more and entries[-1][0] < settled:
+        position = entries[-1][0]
+    else:
+        # Every settled change was served.
+        position = settled
+        more = False
+    return Changes(
+        changed=[entry for (_time, kind, _pk), entry in entries if kind == CHANGED],
+        deleted=[entry for (_time, kind, _pk), entry in entries if kind == DELETED],
+        cursor=encode_change_cursor(position),
+        more=more,
+    )
+
+
+def record_tombstones(queryset):
+    """
+    Record the deletion of the rows of ``queryset``, patients or custom
+    fields, in one statement. Called by queryset deletes before they delete.
+    The rows are read on the default database, like the delete.
+    """
+    rows = queryset.order_by().values("provider_id", "id")
+    sql, params = rows.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            TOMBSTONE_SQL.format(tombstones=Tombstone._meta.db_table, rows=sql),
+            [queryset.model._meta.model_name, timezone.now(), *params],
+        )
+
+
+def prune_tombstones(before=None):
+    """
+    Delete the tombstones older than ``before``, by default older than
+    CHANGES_TOMBSTONE_RETENTION_DAYS. Returns the number deleted.
+    """
+    if before is None:
+        before = timezone.now() - tombstone_retention()
+    deleted, _rows = Tombstone.objects.filter(deleted_at__lt=before).delete()
+    return deleted
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+from django.core.checks import Warning as CheckWarning
+from rest_framework_simplejwt.settings import api_settings
+
+
+@register(Tags.caches, deploy=True)
+def check_patient_cache_is_shared(app_configs, **kwargs):
+    """
+    Writes invalidate cached lists and users through the patient cache, which
+    only reaches other worker processes if they share it.
+    """
+    if isinstance(caches[settings.PATIENT_CACHE_ALIAS], LocMemCache):
+        return [
+            CheckWarning(
+                "The patient cache is local to each process, so with several "
+                "workers a write does not invalidate the cached lists and users "
+                "of the other workers.",
+                hint="Set PATIENT_CACHE_BACKEND to memcached, or run one worker.",
+                id="api.W001",
+            )
+        ]
+    return []
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_stickiness_is_shared(app_configs, **kwargs):
+    """
+    A provider's writes keep its reads on the primary through a marker in the
+    patient cache, which every worker process must see for the provider to
+    read its own writes from any of them.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return []
+    cache = caches[settings.PATIENT_CACHE_ALIAS]
+    if isinstance(cache, DummyCache):
+        reason = "is turned off"
+    elif isinstance(cache, LocMemCache):
+        reason = "is local to each process"
+    else:
+        return []
+    return [
+        CheckWarning(
+            f"DATABASE_REPLICAS are configured but the patient cache {reason}, "
+            "so reads following a write can go to a replica that is behind.",
+            hint="Set PATIENT_CACHE_BACKEND to memcached.",
+            id="api.W002",
+        )
+    ]
+
+
+@register(Tags.security)
+def check_jwt_user_id_field(app_configs, **kwargs):
+    """
+    CachedJWTAuthentication looks the users of tokens up by primary key.
+    """
+    if api_settings.USER_ID_FIELD != "id":
+        return [
+            Error(
+                "CachedJWTAuthentication requires tokens to identify users by "
+                f"primary key, not by {api_settings.USER_ID_FIELD!r}.",
+                hint="Set SIMPLE_JWT['USER_ID_FIELD'] to 'id'.",
+                id="api.E001",
+            )
+        ]
+    return []
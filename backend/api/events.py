@@ -0,0 +1,154 @@
+"""
+Real-time patient change events, pushed to the provider's clients as
+server-sent events instead of being polled for.
+
+Statement triggers on the patient, address and custom field value tables
+(migration 0013) NOTIFY the ``patient_changes`` channel on commit with the
+provider and the ids of the patients written, or deleted. Each worker process
+holds one LISTEN connection, opened by its first subscriber and closed after
+its last, and fans the notifications out to the queues of the subscribed
+streams of that provider. The cost is one message per change and client,
+whatever the number of clients.
+
+Notifications are not stored. Clients that connect, reconnect or receive a
+``resync`` event catch up with the changes endpoint.
+"""
+
+import asyncio
+import json
+import logging
+
+import psycopg
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .metrics import PATIENT_EVENTS
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "patient_changes"
+
+# Sent in place of events that a slow client's queue had no room for, and
+# after the listener reconnected.
+RESYNC = {"event": "resync", "patients": None}
+
+
+def listen_connection_params():
+    """
+    Connection parameters of the default database, for a psycopg async
+    connection outside of Django's connection handling and pool.
+    """
+    params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+    params.pop("cursor_factory", None)
+    params.pop("context", None)
+    return params
+
+
+def format_event(event):
+    data = json.dumps({"patients": event["patients"]}, separators=(",", ":"))
+    return f"event: {event['event']}\ndata: {data}\n\n"
+
+
+class PatientEventListener:
+    """
+    The LISTEN connection of this process and the queues of its subscribers
+    by provider id.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.task = None
+        self.listening = None
+
+    def subscribe(self, provider_id):
+        """
+        A queue that receives the provider's events until unsubscribed.
+        Starts listening if this process is not yet.
+        """
+        queue = asyncio.Queue(maxsize=settings.PATIENT_EVENTS_QUEUE_SIZE)
+        self.subscribers.setdefault(provider_id, set()).add(queue)
+        if self.task is None or self.task.done():
+            self.listening = asyncio.Event()
+            self.task = asyncio.get_running_loop().create_task(self.listen())
+        return queue
+
+    def unsubscribe(self, provider_id, queue):
+        """
+        Stop sending events to ``queue``, and stop listening after the last
+        subscriber.
+        """
+        queues = self.subscribers.get(provider_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(provider_id, None)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def listen(self):
+        reconnecting = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    **listen_connection_params(), autocommit=True
+                ) as connection:
+                    await connection.execute(f"LISTEN {CHANNEL}")
+                    self.listening.set()
+                    if reconnecting:
+                        self.broadcast(RESYNC)
+                    async for notify in connection.notifies():
+                        self.dispatch(notify.payload)
+            except psycopg.Error:
+                logger.exception("Lost the %s listener connection.", CHANNEL)
+            reconnecting = True
+            await asyncio.sleep(settings.PATIENT_EVENTS_RECONNECT_SECONDS)
+
+    def dispatch(self, payload):
+        """
+        Queue a notification payload for the subscribers of its provider.
+        """
+        notification = json.loads(payload)
+        event = {"event": notification["event"], "patients": notification["patients"]}
+        for queue in self.subscribers.get(notification["provider"], ()):
+            self.put(queue, event)
+
+    def broadcast(self, event):
+        for queues in self.subscribers.values():
+            for queue in queues:
+                self.put(queue, event)
+
+    def put(self, queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client will refetch, so the queued events are moot.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+
+patient_events = PatientEventListener()
+
+
+async def patient_event_stream(provider_id, listener=patient_events):
+    """
+    The text of an event stream of the provider's patient changes. The first
+    message is sent once the listener is listening, and comments keep the
+    connection alive while nothing changes.
+    """
+    queue = listener.subscribe(provider_id)
+    try:
+        await listener.listening.wait()
+        yield f"retry: {int(settings.PATIENT_EVENTS_RETRY_SECONDS * 1000)}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), timeout=settings.PATIENT_EVENTS_KEEPALIVE_SECONDS
+                )
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            PATIENT_EVENTS.inc((event["event"],))
+            yield format_event(event)
+    finally:
+        listener.unsubscribe(provider_id, queue)
@@ -0,0 +1,95 @@
+from rest_framework import serializers
+
+from .cache import custom_field_cache
+
+EXPORT_CHUNK_SIZE = 2000
+
+PATIENT_EXPORT_COLUMNS = [
+    "id",
+    "external_id",
+    "first_name",
+    "middle_name",
+    "last_name",
+    "date_of_birth",
+    "status",
+    "created_at",
+]
+
+ADDRESS_EXPORT_COLUMNS = [
+    "address_type",
+    "street_address",
+    "city",
+    "state",
+    "postal_code",
+]
+
+# Custom field columns are named after the field with this prefix, so that a
+# field named like a patient or address column does not replace that column.
+CUSTOM_FIELD_COLUMN_PREFIX = "custom:"
+
+
+def export_custom_fields(provider):
+    return list(custom_field_cache.for_provider(provider.pk).values())
+
+
+def custom_field_column(name):
+    return f"{CUSTOM_FIELD_COLUMN_PREFIX}{name}"
+
+
+def export_columns(custom_fields):
+    """
+    Patient columns, then the primary address, then one column per custom
+    field of the provider, named after the field as ``custom:<name>``.
+    """
+    return [
+        *PATIENT_EXPORT_COLUMNS,
+        *ADDRESS_EXPORT_COLUMNS,
+        *(custom_field_column(custom_field.name) for custom_field in custom_fields),
+    ]
+
+
+def export_rows(queryset, custom_fields, chunk_size=None):
+    """
+    Yield one flat row per patient, with custom field values taken from the
+    custom_field_data projection. The queryset is read through a server-side
+    cursor ``chunk_size`` rows at a time and its prefetches run per chunk, so
+    memory use does not grow with the number of patients.
+    """
+    created_at = serializers.DateTimeField()
+    custom_fields = {custom_field.pk: custom_field for custom_field in custom_fields}
+
+    for patient in queryset.iterator(chunk_size=chunk_size or EXPORT_CHUNK_SIZE):
+        yield export_row(patient, custom_fields, created_at)
+
+
+async def aexport_rows(queryset, custom_fields, chunk_size=None):
+    """
+    export_rows for responses served under ASGI, reading the chunks with the
+    async ORM so that each is sent before the next is read.
+    """
+    created_at = serializers.DateTimeField()
+    custom_fields = {custom_field.pk: custom_field for custom_field in custom_fields}
+
+    async for patient in queryset.aiterator(chunk_size=chunk_size or EXPORT_CHUNK_SIZE):
+        yield export_row(patient, custom_fields, created_at)
+
+
+def export_row(patient, custom_fields, created_at):
+    row = {column: getattr(patient, column) for column in PATIENT_EXPORT_COLUMNS}
+    row["date_of_birth"] = patient.date_of_birth.isoformat()
+    row["created_at"] = created_at.to_representation(patient.created_at)
+
+    addresses = patient.addresses.all()
+    primary = next(
+        (address for address in addresses if address.is_primary),
+        addresses[0] if addresses else None,
+    )
+    for column in ADDRESS_EXPORT_COLUMNS:
+        row[column] = getattr(primary, column) if primary else None
+
+    for custom_field_id, custom_field in custom_fields.items():
+        row[custom_field_column(custom_field.name)] = patient.custom_field_data.get(
+            str(custom_field_id)
+        )
+
+    return row
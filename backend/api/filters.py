@@ -0,0 +1,274 @@
+from functools import reduce
+from operator import add
+
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Exists, OuterRef, Subquery, Value
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend, OrderingFilter, SearchFilter
+from rest_framework.settings import api_settings
+
+from .cache import custom_field_cache
+from .models import (
+    PATIENT_SEARCH_NAME,
+    CustomFieldType,
+    PatientAddress,
+    PatientStatus,
+    StateChoices,
+)
+from .projection import custom_field_value
+
+
+class CustomFieldFilterField(serializers.CharField):
+    """
+    A condition on a custom field value, written ``<custom field id>:<op>:<value>``
+    such as ``12:gt:5``. Every field supports ``eq``, number fields also
+    ``gt``, ``gte``, ``lt`` and ``lte``, and text fields ``contains``, which
+    is case-insensitive.
+    """
+
+    operators = {
+        CustomFieldType.TEXT: ["eq", "contains"],
+        CustomFieldType.NUMBER: ["eq", "gt", "gte", "lt", "lte"],
+    }
+
+    default_error_messages = {
+        "format": _("Expected <custom field id>:<op>:<value>."),
+        "custom_field": _("Invalid custom field {custom_field}."),
+        "operator": _("Operator {operator} is not supported for {field_type} fields."),
+    }
+
+    def to_internal_value(self, data):
+        data = super().to_internal_value(data)
+        try:
+            custom_field_id, operator, value = data.split(":", 2)
+            custom_field_id = int(custom_field_id)
+        except ValueError:
+            self.fail("format")
+
+        # The view's custom fields, so that async views can load them first.
+        view = self.context.get("view")
+        if view is not None:
+            custom_fields = view.get_custom_fields()
+        else:
+            custom_fields = custom_field_cache.for_provider(
+                self.context["request"].user.pk
+            )
+        custom_field = custom_fields.get(custom_field_id)
+        if custom_field is None:
+            self.fail("custom_field", custom_field=custom_field_id)
+        if operator not in self.operators.get(custom_field.field_type, []):
+            self.fail("operator", operator=operator, field_type=custom_field.field_type)
+
+        if custom_field.field_type == CustomFieldType.NUMBER:
+            value = serializers.DecimalField(
+                max_digits=15, decimal_places=2
+            ).run_validation(value)
+        return custom_field, operator, value
+
+
+class PatientFilterSerializer(serializers.Serializer):
+    """
+    Query parameters accepted by the patient list. Multi-valued parameters are
+    repeated, e.g. ``?status=ACTIVE&status=ONBOARDING``.
+    """
+
+    status = serializers.ListField(
+        child=serializers.ChoiceField(choices=PatientStatus.choices), required=False
+    )
+    state = serializers.ListField(
+        child=serializers.ChoiceField(choices=StateChoices.choices),
+        required=False,
+        help_text="State of the primary address.",
+    )
+    city = serializers.CharField(
+        required=False, help_text="City of the primary address."
+    )
+    date_of_birth_after = serializers.DateField(required=False)
+    date_of_birth_before = serializers.DateField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    custom_field = serializers.ListField(
+        child=CustomFieldFilterField(),
+        required=False,
+        help_text="Custom field condition written <custom field id>:<op>:<value>, "
+        "e.g. 12:gt:5. Operators are eq for all fields, gt, gte, lt and lte for "
+        "number fields, and contains for text fields.",
+    )
+
+
+class PatientFilterBackend(BaseFilterBackend):
+    """
+    Filters patients in SQL from the parameters in PatientFilterSerializer.
+    """
+
+    lookups = {
+        "gt": "gt",
+        "gte": "gte",
+        "lt": "lt",
+        "lte": "lte",
+        "contains": "icontains",
+    }
+
+    def get_filters(self, request, view=None):
+        serializer = PatientFilterSerializer(
+            data=request.query_params, context={"request": request, "view": view}
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def filter_queryset(self, request, queryset, view):
+        filters = self.get_filters(request, view)
+
+        if filters.get("status"):
+            queryset = queryset.filter(status__in=filters["status"])
+        if "date_of_birth_after" in filters:
+            queryset = queryset.filter(
+                date_of_birth__gte=filters["date_of_birth_after"]
+            )
+        if "date_of_birth_before" in filters:
+            queryset = queryset.filter(
+                date_of_birth__lte=filters["date_of_birth_before"]
+            )
+        if "created_after" in filters:
+            queryset = queryset.filter(created_at__gte=filters["created_after"])
+        if "created_before" in filters:
+            queryset = queryset.filter(created_at__lte=filters["created_before"])
+
+        for custom_field, operator, value in filters.get("custom_field", []):
+            queryset = self.filter_custom_field(queryset, custom_field, operator, value)
+
+        addresses = {}
+        if filters.get("state"):
+            addresses["state__in"] = filters["state"]
+        if "city" in filters:
+            addresses["city"] = filters["city"]
+        if addresses:
+            # A semi-join keeps one row per patient even with several addresses.
+            queryset = queryset.filter(
+                Exists(
+                    PatientAddress.objects.filter(
+                        patient=OuterRef("pk"), is_primary=True, **addresses
+                    )
+                )
+            )
+
+        return queryset
+
+    def filter_custom_field(self, queryset, custom_field, operator, value):
+        """
+        Filter on the custom_field_data projection. Equality is a JSON
+        containment test and every other operator is limited to patients that
+        have the key; both are served by the GIN index.
+        """
+        key = str(custom_field.pk)
+        if operator == "eq":
+            return queryset.filter(custom_field_data__contains={key: value})
+
+        alias = f"custom_field_{custom_field.pk}"
+        return (
+            queryset.filter(custom_field_data__has_key=key)
+            .alias(**{alias: custom_field_value(custom_field)})
+            .filter(**{f"{alias}__{self.lookups[operator]}": value})
+        )
+
+
+class PatientOrderingFilter(OrderingFilter):
+    """
+    Orders patients by any list column. Each term maps to one or more model
+    columns and the primary key is always appended, so page boundaries are
+    stable across requests.
+    """
+
+    orderings = {
+        "id": ("id",),
+        "name": ("last_name", "first_name"),
+        "full_name": ("first_name", "middle_name", "last_name"),
+        "first_name": ("first_name",),
+        "middle_name": ("middle_name",),
+        "last_name": ("last_name",),
+        "date_of_birth": ("date_of_birth",),
+        "status": ("status",),
+        "created_at": ("created_at",),
+        "city": ("primary_city",),
+        "state": ("primary_state",),
+    }
+
+    # Columns of the primary address, looked up when ordered by.
+    address_columns = {
+        "primary_city": "city",
+        "primary_state": "state",
+    }
+
+    ordering_description = _(
+        "Which field to use when ordering the results: id, name, full_name, "
+        "first_name, middle_name, last_name, date_of_birth, status, created_at, "
+        "city or state (of the primary address), optionally prefixed with '-'. "
+        "With pagination=cursor only id, created_at and name are supported."
+    )
+
+    def get_valid_fields(self, queryset, view, context=None):
+        return [(name, name) for name in self.orderings]
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+
+        columns = []
+        for term in ordering:
+            prefix = "-" if term.startswith("-") else ""
+            columns.extend(
+                f"{prefix}{column}" for column in self.orderings[term.lstrip("-")]
+            )
+        if not {"id", "-id"} & set(columns):
+            columns.append("-id" if columns[0].startswith("-") else "id")
+
+        for column in columns:
+            name = column.lstrip("-")
+            if name in self.address_columns:
+                queryset = queryset.alias(
+                    **{
+                        name: Subquery(
+                            PatientAddress.objects.filter(
+                                patient=OuterRef("pk"), is_primary=True
+                            ).values(self.address_columns[name])[:1]
+                        )
+                    }
+                )
+        return queryset.order_by(*columns)
+
+
+class PatientSearchFilter(SearchFilter):
+    """
+    Fuzzy name search backed by pg_trgm. Every search term has to be
+    word-similar to the patient's full name, so partial ("jon" for "Jonathan")
+    and misspelled ("smth" for "Smith") names match. The ``%>`` operator and
+    the provider are served together by the GIN index on the provider and
+    PATIENT_SEARCH_NAME trigrams.
+
+    Results are ranked by similarity unless an explicit ordering is requested.
+    """
+
+    search_description = _("A partial or misspelled patient name.")
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        for term in terms:
+            queryset = queryset.filter(
+                TrigramWordSimilar(PATIENT_SEARCH_NAME, Value(term))
+            )
+        queryset = queryset.annotate(
+            search_rank=reduce(
+                add,
+                (TrigramWordSimilarity(term, PATIENT_SEARCH_NAME) for term in terms),
+            )
+        )
+
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return queryset
+        return queryset.order_by("-search_rank", "id")
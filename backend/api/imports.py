@@ -0,0 +1,311 @@
+from collections import Counter
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils.translation import gettext_lazy as _
+
+from .cache import invalidate_patient_cache
+from .export import ADDRESS_EXPORT_COLUMNS, CUSTOM_FIELD_COLUMN_PREFIX
+from .models import (
+    AddressType,
+    CustomField,
+    CustomFieldType,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+)
+from .stats import address_stats, patient_stats, record_patient_stats
+
+IMPORT_BATCH_SIZE = 10000
+
+PATIENT_IMPORT_COLUMNS = [
+    "external_id",
+    "first_name",
+    "middle_name",
+    "last_name",
+    "date_of_birth",
+    "status",
+]
+
+ADDRESS_IMPORT_COLUMNS = ADDRESS_EXPORT_COLUMNS
+
+# Columns of the export that are assigned by the database on import.
+IGNORED_IMPORT_COLUMNS = {"id", "created_at"}
+
+PATIENT_STAGE_SQL = """
+CREATE TEMPORARY TABLE IF NOT EXISTS import_patient_stage (
+    line integer NOT NULL,
+    external_id text NOT NULL,
+    first_name text NOT NULL,
+    middle_name text,
+    last_name text NOT NULL,
+    date_of_birth date NOT NULL,
+    status text NOT NULL,
+    address_type text,
+    street_address text,
+    city text,
+    state text,
+    postal_code text
+)
+"""
+
+VALUE_STAGE_SQL = """
+CREATE TEMPORARY TABLE IF NOT EXISTS import_value_stage (
+    line integer NOT NULL,
+    custom_field_id integer NOT NULL,
+    text_value text,
+    number_value numeric(15, 2)
+)
+"""
+
+# Patients whose external id already exists for the provider are skipped
+# together with their nested rows, which makes re-running an import safe.
+# Patient.custom_field_data is projected from the staged values, as in
+# api.projection.
+MERGE_SQL = f"""
+WITH inserted AS (
+    INSERT INTO {Patient._meta.db_table} (
+        provider_id, external_id, first_name, middle_name, last_name,
+        date_of_birth, status, custom_field_data, created_at, modified_at
+    )
+    SELECT %(provider)s, external_id, first_name, middle_name, last_name,
+        date_of_birth, status, COALESCE(
+            (
+                SELECT jsonb_object_agg(
+                    field_value.custom_field_id::text,
+                    CASE
+                        WHEN field_value.number_value IS NOT NULL
+                        THEN to_jsonb(field_value.number_value)
+                        ELSE to_jsonb(field_value.text_value)
+                    END
+                )
+                FROM import_value_stage field_value
+                WHERE field_value.line = stage.line
+            ),
+            '{{}}'::jsonb
+        ), now(), now()
+    FROM import_patient_stage stage
+    ORDER BY line
+    ON CONFLICT (provider_id, external_id) DO NOTHING
+    RETURNING id, external_id, status, created_at
+), addresses AS (
+    INSERT INTO {PatientAddress._meta.db_table} (
+        patient_id, address_type, street_address, city, state, postal_code,
+        is_primary, created_at, modified_at
+    )
+    SELECT inserted.id, stage.address_type, stage.street_address, stage.city,
+        stage.state, stage.postal_code, true, now(), now()
+    FROM inserted
+    JOIN import_patient_stage stage USING (external_id)
+    WHERE stage.street_address IS NOT NULL
+), custom_field_values AS (
+    INSERT INTO {PatientCustomFieldValue._meta.db_table} (
+        patient_id, custom_field_id, text_value, number_value, created_at, modified_at
+    )
+    SELECT inserted.id, field_value.custom_field_id, field_value.text_value,
+        field_value.number_value, now(), now()
+    FROM inserted
+    JOIN import_patient_stage stage USING (external_id)
+    JOIN import_value_stage field_value ON field_value.line = stage.line
+)
+SELECT inserted.status, inserted.created_at, stage.street_address IS NOT NULL, stage.state
+FROM inserted
+JOIN import_patient_stage stage USING (external_id)
+"""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    skipped: int = 0
+    rejected: int = 0
+
+
+class PatientImporter:
+    """
+    Loads patient rows read from a CSV file, such as the output of the patient
+    export, for one provider.
+
+    Rows are validated against the model fields, then loaded in batches with
+    COPY into temporary staging tables and merged into the patient, address
+    and custom field value tables by a single statement. Every batch commits
+    on its own and patients are matched by ``external_id``, so an interrupted
+    import can be run again from the start without duplicating patients.
+
+    Custom fields are read from ``custom:<name>`` columns, as written by the
+    export, and from any other column that is not a patient or address column.
+    Missing custom fields are created for the provider, as number fields if
+    listed in ``number_fields`` and as text fields otherwise.
+    """
+
+    def __init__(
+        self,
+        provider,
+        columns,
+        number_fields=(),
+        batch_size=IMPORT_BATCH_SIZE,
+        reject=None,
+        progress=None,
+    ):
+        self.provider = provider
+        self.batch_size = batch_size
+        self.reject = reject or (lambda line, row, error: None)
+        self.progress = progress or (lambda result: None)
+        self.result = ImportResult()
+        self.external_ids = set()
+
+        known = {
+            *PATIENT_IMPORT_COLUMNS,
+            *ADDRESS_IMPORT_COLUMNS,
+            *IGNORED_IMPORT_COLUMNS,
+        }
+        prefixed = {
+            column: column.removeprefix(CUSTOM_FIELD_COLUMN_PREFIX)
+            for column in columns
+            if column.startswith(CUSTOM_FIELD_COLUMN_PREFIX)
+        }
+        # A prefixed column takes precedence over an unprefixed one for the
+        # same field.
+        names = {
+            **{
+                column: column
+                for column in columns
+                if column not in known
+                and column not in prefixed
+                and column not in prefixed.values()
+            },
+            **prefixed,
+        }
+        self.custom_fields = self.get_custom_fields(names, set(number_fields))
+
+    def get_custom_fields(self, names, number_fields):
+        """
+        The provider's custom fields by column, for ``names`` mapping columns to
+        field names.
+        """
+        existing = {
+            custom_field.name: custom_field
+            for custom_field in CustomField.objects.filter(
+                provider=self.provider, name__in=names.values()
+            )
+        }
+        custom_fields = {}
+        for column, name in names.items():
+            if name not in existing:
+                field_type = (
+                    CustomFieldType.NUMBER
+                    if name in number_fields
+                    else CustomFieldType.TEXT
+                )
+                existing[name], _created = CustomField.objects.get_or_create(
+                    provider=self.provider,
+                    name=name,
+                    defaults={"field_type": field_type},
+                )
+            custom_fields[column] = existing[name]
+        return custom_fields
+
+    def run(self, rows):
+        """
+        Import ``rows``, an iterable of ``(line, row)`` pairs with each row a
+        dict keyed by column, and return the totals.
+        """
+        batch = []
+        for line, row in rows:
+            self.result.rows += 1
+            try:
+                batch.append((line, *self.clean_row(row)))
+            except ValidationError as e:
+                self.result.rejected += 1
+                self.reject(
+                    line, row, "; ".join(str(message) for message in e.messages)
+                )
+                continue
+
+            if len(batch) >= self.batch_size:
+                self.load(batch)
+                batch = []
+
+        if batch:
+            self.load(batch)
+        return self.result
+
+    def clean_row(self, row):
+        patient = [
+            self.clean_field(Patient, name, row.get(name))
+            for name in PATIENT_IMPORT_COLUMNS
+        ]
+        external_id = patient[0]
+        if not external_id:
+            raise ValidationError(
+                _("external_id: an external id is required to import.")
+            )
+        if external_id in self.external_ids:
+            raise ValidationError(_("external_id: duplicate external id in this file."))
+
+        address = [None] * len(ADDRESS_IMPORT_COLUMNS)
+        if any(row.get(name) for name in ADDRESS_IMPORT_COLUMNS):
+            values = dict(row)
+            values["address_type"] = values.get("address_type") or AddressType.HOME
+            address = [
+                self.clean_field(PatientAddress, name, values.get(name))
+                for name in ADDRESS_IMPORT_COLUMNS
+            ]
+
+        custom_field_values = []
+        for column, custom_field in self.custom_fields.items():
+            if not row.get(column):
+                continue
+            if custom_field.field_type == CustomFieldType.NUMBER:
+                number_value = self.clean_field(
+                    PatientCustomFieldValue, "number_value", row[column], column=column
+                )
+                custom_field_values.append((custom_field.pk, None, number_value))
+            else:
+                custom_field_values.append((custom_field.pk, row[column], None))
+
+        self.external_ids.add(external_id)
+        return [*patient, *address], custom_field_values
+
+    def clean_field(self, model, name, value, column=None):
+        try:
+            return model._meta.get_field(name).clean(value or None, None)
+        except ValidationError as e:
+            raise ValidationError(f"{column or name}: {' '.join(e.messages)}") from e
+
+    def load(self, batch):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(PATIENT_STAGE_SQL)
+            cursor.execute(VALUE_STAGE_SQL)
+            cursor.execute("TRUNCATE import_patient_stage, import_value_stage")
+
+            with cursor.copy(
+                "COPY import_patient_stage (line, {}) FROM STDIN".format(
+                    ", ".join([*PATIENT_IMPORT_COLUMNS, *ADDRESS_IMPORT_COLUMNS])
+                )
+            ) as copy:
+                for line, patient, _values in batch:
+                    copy.write_row((line, *patient))
+            with cursor.copy(
+                "COPY import_value_stage "
+                "(line, custom_field_id, text_value, number_value) FROM STDIN"
+            ) as copy:
+                for line, _patient, values in batch:
+                    for value in values:
+                        copy.write_row((line, *value))
+
+            cursor.execute(MERGE_SQL, {"provider": self.provider.pk})
+            inserted = cursor.fetchall()
+            stats = Counter()
+            for status, created_at, has_address, state in inserted:
+                stats.update(patient_stats(self.provider.pk, status, created_at))
+                stats.update(address_stats(self.provider.pk, [(has_address, state)]))
+            record_patient_stats(stats)
+            invalidate_patient_cache(provider_ids=[self.provider.pk])
+        created = len(inserted)
+
+        self.result.created += created
+        self.result.skipped += len(batch) - created
+        self.progress(self.result)
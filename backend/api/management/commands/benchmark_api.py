@@ -0,0 +1,116 @@
+import json
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.benchmark import PatientBenchmark, seed_benchmark_provider
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps", "queries_per_request"]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the patient and custom field endpoints against providers seeded "
+        "with the given numbers of patients and write the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1000,100000,1000000",
+            help="Comma-separated numbers of patients to benchmark with.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Measured requests per scenario."
+        )
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument(
+            "--workers", type=int, default=1, help="Processes used for seeding."
+        )
+        parser.add_argument("--output", help="Defaults to benchmark-<revision>.json.")
+        parser.add_argument(
+            "--compare", help="Results of an earlier run to print the change against."
+        )
+
+    def handle(self, *args, **options):
+        revision = git_revision()
+        results = []
+        for size in [int(size) for size in options["sizes"].split(",")]:
+            self.stdout.write(f"Seeding {size} patients...")
+            provider = seed_benchmark_provider(size, workers=options["workers"])
+            benchmark = PatientBenchmark(
+                provider,
+                size,
+                requests=options["requests"],
+                concurrency=options["concurrency"],
+                warmup=options["warmup"],
+            )
+            for result in benchmark.run():
+                results.append(result)
+                self.stdout.write(
+                    f"{size:>9} {result['scenario']:<28} "
+                    f"p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                    f"p99 {result['p99_ms']:>8.2f}ms  {result['throughput_rps']:>8.1f} rps  "
+                    f"{result['queries_per_request']:>5.1f} queries  "
+                    f"{result['errors']} errors"
+                )
+
+        output = Path(options["output"] or f"benchmark-{revision or 'local'}.json")
+        output.write_text(
+            json.dumps(
+                {
+                    "revision": revision,
+                    "created_at": timezone.now().isoformat(),
+                    "requests": options["requests"],
+                    "concurrency": options["concurrency"],
+                    "database": {
+                        "conn_max_age": settings.DATABASES["default"]["CONN_MAX_AGE"],
+                        "pool": settings.DATABASES["default"]["OPTIONS"].get("pool"),
+                    },
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}."))
+
+        if options["compare"]:
+            self.compare(json.loads(Path(options["compare"]).read_text()), results)
+
+    def compare(self, baseline, results):
+        previous = {
+            (result["size"], result["scenario"]): result
+            for result in baseline["results"]
+        }
+        self.stdout.write(f"Change against {baseline.get('revision') or 'baseline'}:")
+        for result in results:
+            before = previous.get((result["size"], result["scenario"]))
+            if before is None:
+                continue
+            changes = "  ".join(
+                f"{metric} {self.change(before[metric], result[metric])}"
+                for metric in METRICS
+            )
+            self.stdout.write(f"{result['size']:>9} {result['scenario']:<28} {changes}")
+
+    def change(self, before, after):
+        if not before:
+            return "n/a"
+        return f"{(after - before) / before:+.0%}"
@@ -0,0 +1,93 @@
+import csv
+import time
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import IMPORT_BATCH_SIZE, PatientImporter
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a CSV roster of patients for a provider. Rows need an external_id; "
+        "patients that were already imported are skipped, so an interrupted "
+        "import can be run again. Invalid rows are written to a rejects file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header row.")
+        parser.add_argument(
+            "--provider", required=True, help="Username of the provider."
+        )
+        parser.add_argument(
+            "--number-field",
+            action="append",
+            default=[],
+            dest="number_fields",
+            help="Create this custom field as a number field if it does not "
+            "exist yet. Can be repeated.",
+        )
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--rejects",
+            help="Where to write rejected rows. Defaults to <path>.rejects.csv.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            provider = User.objects.get(username=options["provider"])
+        except User.DoesNotExist as e:
+            raise CommandError(f"Unknown provider {options['provider']!r}.") from e
+
+        path = Path(options["path"])
+        rejects_path = Path(options["rejects"] or f"{path}.rejects.csv")
+        started = time.monotonic()
+
+        with (
+            path.open(newline="", encoding="utf-8-sig") as source,
+            rejects_path.open("w", newline="", encoding="utf-8") as rejects,
+        ):
+            reader = csv.DictReader(source)
+            if not reader.fieldnames:
+                raise CommandError(f"{path} has no header row.")
+            rejects_writer = csv.writer(rejects)
+            rejects_writer.writerow(["line", "error", *reader.fieldnames])
+
+            def reject(line, row, error):
+                rejects_writer.writerow(
+                    [line, error, *(row.get(name) for name in reader.fieldnames)]
+                )
+
+            def progress(result):
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{result.rows} rows, {result.created} created, "
+                    f"{result.skipped} skipped, {result.rejected} rejected "
+                    f"({result.rows / elapsed:.0f} rows/s)"
+                )
+
+            importer = PatientImporter(
+                provider,
+                reader.fieldnames,
+                number_fields=options["number_fields"],
+                batch_size=options["batch_size"],
+                reject=reject,
+                progress=progress,
+            )
+            result = importer.run((reader.line_num, row) for row in reader)
+
+        if not result.rejected:
+            rejects_path.unlink()
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.created} of {result.rows} rows in {elapsed:.1f}s "
+                f"({result.rows / elapsed:.0f} rows/s), {result.skipped} already "
+                f"imported, {result.rejected} rejected."
+            )
+        )
+        if result.rejected:
+            self.stdout.write(f"Rejected rows were written to {rejects_path}.")
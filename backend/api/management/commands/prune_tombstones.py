@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.changes import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the tombstones of deleted patients and custom fields older than "
+        "CHANGES_TOMBSTONE_RETENTION_DAYS. Change feed cursors that old are "
+        "already refused, so the command is safe to run at any time."
+    )
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} tombstones."))
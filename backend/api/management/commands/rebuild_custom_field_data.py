@@ -0,0 +1,57 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import invalidate_patient_cache
+from api.projection import REBUILD_BATCH_SIZE, rebuild_custom_field_data
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerate the custom_field_data projection of patients from their "
+        "custom field values. Only patients whose projection is out of date are "
+        "written, so the command is safe to run on a live database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--provider",
+            action="append",
+            default=[],
+            dest="providers",
+            help="Username of a provider to rebuild. Can be repeated. Defaults "
+            "to all providers.",
+        )
+        parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        provider_ids = []
+        for username in options["providers"]:
+            try:
+                provider_ids.append(User.objects.get(username=username).pk)
+            except User.DoesNotExist as e:
+                raise CommandError(f"Unknown provider {username!r}.") from e
+
+        started = time.monotonic()
+
+        def progress(checked, changed):
+            self.stdout.write(f"{checked} patients checked, {changed} changed")
+
+        checked, changed = rebuild_custom_field_data(
+            provider_ids or None, batch_size=options["batch_size"], progress=progress
+        )
+        if changed:
+            invalidate_patient_cache(
+                provider_ids=provider_ids or User.objects.values_list("pk", flat=True)
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {checked} patients in {elapsed:.1f}s, "
+                f"{changed} projections rebuilt."
+            )
+        )
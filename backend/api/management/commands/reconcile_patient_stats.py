@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Patient
+from api.stats import rebuild_patient_stats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the patient statistics counters from scratch and report the "
+        "counters that had drifted. Writes wait while a provider is recounted, "
+        "so the command is safe to run on a live database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--provider",
+            action="append",
+            default=[],
+            dest="providers",
+            help="Username of a provider to reconcile. Can be repeated. Defaults "
+            "to every provider with patients or counters.",
+        )
+
+    def handle(self, *args, **options):
+        if options["providers"]:
+            providers = list(User.objects.filter(username__in=options["providers"]))
+            unknown = set(options["providers"]) - {user.username for user in providers}
+            if unknown:
+                raise CommandError(f"Unknown provider {sorted(unknown)[0]!r}.")
+            provider_ids = [provider.pk for provider in providers]
+        else:
+            provider_ids = sorted(
+                set(Patient.objects.values_list("provider_id", flat=True).distinct())
+                | set(
+                    User.objects.filter(patient_statistics__isnull=False).values_list(
+                        "pk", flat=True
+                    )
+                )
+            )
+
+        corrected = 0
+        for provider_id in provider_ids:
+            differences = rebuild_patient_stats(provider_id)
+            corrected += len(differences)
+            for (_provider_id, dimension, key), difference in sorted(
+                differences.items()
+            ):
+                self.stdout.write(
+                    f"Provider {provider_id}: {dimension} {key} was off by {-difference:+d}"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reconciled {len(provider_ids)} providers, {corrected} counters corrected."
+            )
+        )
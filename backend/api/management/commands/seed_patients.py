@@ -1,76 +1,148 @@
-from django.core.management.base import BaseCommand
+import argparse
+import os
+import time
+from datetime import UTC
+
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from api.models import Patient, CustomField, PatientCustomFieldValue, PatientStatus, StateChoices, PatientAddress, AddressType, CustomFieldType
-from django.contrib.auth import get_user_model
-import random
-from datetime import datetime, timedelta
-import faker
+from django.utils.dateparse import parse_datetime
 
-User = get_user_model()
-fake = faker.Faker()
+from api.models import PatientStatus
+from api.seed import (
+    SEED_ADDRESS_WEIGHTS,
+    SEED_AS_OF,
+    SEED_CHUNK_SIZE,
+    SeedOptions,
+    run_seed_chunks,
+    seed_chunks,
+    seed_provider,
+)
 
-class Command(BaseCommand):
 
-    def handle(self, *args, **options):
-        # Get the providers
-        provider1 = User.objects.get(id=1)
-        provider2 = User.objects.get(id=2)
+def parse_weights(value, choices, cast=str):
+    """
+    Parse ``name=weight,...`` into a dict, e.g. ``ACTIVE=6,CHURNED=1``.
+    """
+    weights = {}
+    for item in value.split(","):
+        name, _sep, weight = item.partition("=")
+        try:
+            name = cast(name.strip())
+            weights[name] = float(weight)
+        except ValueError as e:
+            raise CommandError(f"Invalid weight {item!r}.") from e
+        if name not in choices:
+            raise CommandError(f"Invalid choice {name!r}, expected one of {choices}.")
+    return weights
+
+
+def parse_as_of(value):
+    """
+    Parse an ISO 8601 date or date and time, in UTC unless it has an offset.
+    """
+    try:
+        as_of = parse_datetime(value)
+    except ValueError:
+        as_of = None
+    if as_of is None:
+        raise argparse.ArgumentTypeError(
+            f"Invalid date {value!r}, expected e.g. 2025-01-01."
+        )
+    if timezone.is_naive(as_of):
+        as_of = timezone.make_aware(as_of, UTC)
+    return as_of
+
 
-        # Create custom fields for providers
-        referred_by_field = CustomField.objects.create(
-            provider=provider1,
-            name="Referred By",
-            field_type=CustomFieldType.TEXT,
-            description="Name of the person who referred the patient"
+class Command(BaseCommand):
+    help = (
+        "Seed providers with generated patients, addresses and custom field values. "
+        "The data only depends on the options, --seed and --as-of, and seeding "
+        "again skips patients that already exist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--providers", type=int, default=2)
+        parser.add_argument(
+            "--patients", type=int, default=10, help="Patients per provider."
+        )
+        parser.add_argument(
+            "--custom-fields", type=int, default=2, help="Custom fields per provider."
+        )
+        parser.add_argument(
+            "--status-weights",
+            default=",".join(f"{status}=1" for status in PatientStatus.values),
+            help="Relative frequency of each status, e.g. ACTIVE=6,CHURNED=1.",
+        )
+        parser.add_argument(
+            "--address-weights",
+            default=",".join(
+                f"{count}={weight}" for count, weight in SEED_ADDRESS_WEIGHTS.items()
+            ),
+            help="Relative frequency of the number of addresses per patient.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--as-of",
+            type=parse_as_of,
+            default=SEED_AS_OF,
+            help="Patients are created over the three years before this date "
+            f"(default {SEED_AS_OF.date()}).",
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE)
+        parser.add_argument(
+            "--password",
+            default="password",
+            help="Password of the providers that are created.",
         )
 
-        visits_field = CustomField.objects.create(
-            provider=provider2,
-            name="Number of Visits",
-            field_type=CustomFieldType.NUMBER,
-            description="Total number of visits by the patient"
+    def handle(self, *args, **options):
+        seed_options = SeedOptions(
+            seed=options["seed"],
+            status_weights=parse_weights(
+                options["status_weights"], PatientStatus.values
+            ),
+            address_weights=parse_weights(options["address_weights"], range(10), int),
+            as_of=options["as_of"],
         )
 
-        # Generate 20 patients (10 for each provider)
-        providers = [(provider1, referred_by_field), (provider2, visits_field)]
-        
-        for provider, custom_field in providers:
-            for _ in range(10):
-                # Generate random patient data
-                dob = fake.date_of_birth(minimum_age=18, maximum_age=90)
-                
-                patient = Patient.objects.create(
-                    provider=provider,
-                    first_name=fake.first_name(),
-                    last_name=fake.last_name(),
-                    middle_name=fake.first_name() if random.random() > 0.5 else None,
-                    date_of_birth=dob,
-                    status=random.choice(list(PatientStatus.choices))[0]
+        chunks = []
+        for index in range(1, options["providers"] + 1):
+            provider, custom_fields = seed_provider(
+                index, options["custom_fields"], options["password"]
+            )
+            chunks.extend(
+                seed_chunks(
+                    index,
+                    provider.pk,
+                    custom_fields,
+                    options["patients"],
+                    options["chunk_size"],
                 )
+            )
 
-                # Create address for patient
-                PatientAddress.objects.create(
-                    patient=patient,
-                    address_type=AddressType.HOME,
-                    street_address=fake.street_address(),
-                    city=fake.city(),
-                    state=random.choice(list(StateChoices.choices))[0],
-                    postal_code=fake.postcode(),
-                    is_primary=True
-                )
+        total = options["providers"] * options["patients"]
+        started = time.monotonic()
+
+        results = run_seed_chunks(chunks, seed_options, options["workers"])
+        created = self.report(results, len(chunks), started)
 
-                # Add custom field values
-                if provider.id == 1:
-                    # For provider 1: Referred By (text)
-                    PatientCustomFieldValue.objects.create(
-                        patient=patient,
-                        custom_field=custom_field,
-                        text_value=f"Dr. {fake.last_name()}"
-                    )
-                else:
-                    # For provider 2: Number of Visits (number)
-                    PatientCustomFieldValue.objects.create(
-                        patient=patient,
-                        custom_field=custom_field,
-                        number_value=random.randint(1, 20)
-                    )
\ No newline at end of file
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {created} of {total} patients in {elapsed:.1f}s "
+                f"({created / max(elapsed, 1e-9):.0f} patients/s)."
+            )
+        )
+
+    def report(self, results, chunk_count, started):
+        created = 0
+        for number, result in enumerate(results, start=1):
+            created += result
+            if number % 10 == 0 or number == chunk_count:
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{number}/{chunk_count} chunks, {created} patients created "
+                    f"({created / max(elapsed, 1e-9):.0f} patients/s)"
+                )
+        return created
@@ -0,0 +1,416 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_current_metrics = ContextVar("request_metrics", default=None)
+
+
+class Histogram:
+    """
+    Cumulative Prometheus histogram with one series per label value.
+    """
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            series = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self.series.items()
+            )
+        for labels, counts, total in series:
+            label_text = format_labels(self.labels, labels)
+            count = 0
+            for bound, bucket_count in zip(
+                [*self.buckets, "+Inf"], counts, strict=True
+            ):
+                count += bucket_count
+                le = format_labels([*self.labels, "le"], [*labels, bound])
+                yield f"{self.name}_bucket{le} {count}"
+            yield f"{self.name}_sum{label_text} {total}"
+            yield f"{self.name}_count{label_text} {count}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            series = sorted(self.series.items())
+        for labels, value in series:
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label(value)}"'
+        for name, value in zip(names, values, strict=True)
+    )
+    return f"{{{pairs}}}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUESTS = Counter(
+    "api_requests_total",
+    "Requests by view, method and status.",
+    ["view", "method", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "api_request_duration_seconds", "Total request time.", ["view"], DURATION_BUCKETS
+)
+DB_DURATION = Histogram(
+    "api_request_db_duration_seconds",
+    "Time spent in database queries per request.",
+    ["view"],
+    DURATION_BUCKETS,
+)
+SERIALIZER_DURATION = Histogram(
+    "api_request_serializer_duration_seconds",
+    "Time spent serializing the response per request.",
+    ["view"],
+    DURATION_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "api_request_db_queries", "Database queries per request.", ["view"], QUERY_BUCKETS
+)
+REPLICA_READS = Counter(
+    "api_replica_reads_total",
+    "Requests eligible for a read replica, by database read and reason.",
+    ["database", "reason"],
+)
+PATIENT_EVENTS = Counter(
+    "api_patient_events_total",
+    "Patient change events sent to event stream clients, by event.",
+    ["event"],
+)
+
+
+def database_pools():
+    """
+    The connection pools of the databases configured with one, by alias.
+    """
+    pools = {}
+    for alias in connections:
+        if connections.settings[alias]["OPTIONS"].get("pool"):
+            pools[alias] = connections[alias].pool
+    return pools
+
+
+class PoolMetrics:
+    """
+    Utilisation, wait time and health check counts of the connection pools of
+    this process, read from ``ConnectionPool.get_stats()`` when collected.
+    """
+
+    # Name, type, documentation, stats key and scale of each metric.
+    metrics = [
+        (
+            "api_db_pool_max_connections",
+            "gauge",
+            "Maximum size of the pool.",
+            "pool_max",
+            1,
+        ),
+        (
+            "api_db_pool_connections",
+            "gauge",
+            "Connections open in the pool.",
+            "pool_size",
+            1,
+        ),
+        (
+            "api_db_pool_idle_connections",
+            "gauge",
+            "Connections open in the pool and not in use.",
+            "pool_available",
+            1,
+        ),
+        (
+            "api_db_pool_waiting_requests",
+            "gauge",
+            "Requests waiting for a connection.",
+            "requests_waiting",
+            1,
+        ),
+        (
+            "api_db_pool_requests_total",
+            "counter",
+            "Connections requested from the pool.",
+            "requests_num",
+            1,
+        ),
+        (
+            "api_db_pool_queued_requests_total",
+            "counter",
+            "Requests that had to wait for a connection.",
+            "requests_queued",
+            1,
+        ),
+        (
+            "api_db_pool_wait_seconds_total",
+            "counter",
+            "Time requests spent waiting for a connection.",
+            "requests_wait_ms",
+            0.001,
+        ),
+        (
+            "api_db_pool_timeouts_total",
+            "counter",
+            "Requests that timed out waiting for a connection.",
+            "requests_errors",
+            1,
+        ),
+        (
+            "api_db_pool_opened_connections_total",
+            "counter",
+            "Connections opened by the pool.",
+            "connections_num",
+            1,
+        ),
+        (
+            "api_db_pool_lost_connections_total",
+            "counter",
+            "Connections that failed the health check on checkout.",
+            "connections_lost",
+            1,
+        ),
+    ]
+
+    def __init__(self, pools=database_pools):
+        self.pools = pools
+
+    def collect(self):
+        stats = {alias: pool.get_stats() for alias, pool in self.pools().items()}
+        if not stats:
+            return
+        for name, kind, documentation, key, scale in self.metrics:
+            yield f"# HELP {name} {documentation}"
+            yield f"# TYPE {name} {kind}"
+            for alias, values in sorted(stats.items()):
+                # Counters are only reported once they are not 0.
+                value = values.get(key, 0) * scale
+                yield f"{name}{format_labels(['database'], [alias])} {value}"
+
+
+REGISTRY = [
+    REQUESTS,
+    REQUEST_DURATION,
+    DB_DURATION,
+    SERIALIZER_DURATION,
+    DB_QUERIES,
+    REPLICA_READS,
+    PATIENT_EVENTS,
+    PoolMetrics(),
+]
+
+
+class RequestMetrics:
+    __slots__ = ("view", "queries", "db_time", "serializer_time", "serializing")
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper, see connection.execute_wrapper().
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def view_name(view_func, method):
+    """
+    ``ViewSet.action`` for DRF viewsets, the class of other class-based
+    views, otherwise the name of the view.
+    """
+    cls = getattr(view_func, "cls", None) or getattr(view_func, "view_class", None)
+    if cls is None:
+        return getattr(view_func, "__name__", type(view_func).__name__)
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(method.lower())
+    return f"{cls.__name__}.{action}" if action else cls.__name__
+
+
+@contextmanager
+def wrap_connections(metrics):
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(metrics))
+        yield
+
+
+class PerformanceMiddleware:
+    """
+    Records the query count, database time, serializer time and total time
+    of every request. They are sent back in a ``Server-Timing`` header and fed
+    to the histograms served by ``metrics_view``.
+
+    Queries are counted with a database execute wrapper, which only adds a
+    couple of clock reads per query.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            with wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        started = time.perf_counter()
+        # The async ORM runs queries in the request's thread sensitive
+        # executor, so the wrappers are installed on that thread's connections.
+        stack = ExitStack()
+        try:
+            await sync_to_async(stack.enter_context)(wrap_connections(metrics))
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current_metrics.reset(token)
+        return self.record(request, response, metrics, time.perf_counter() - started)
+
+    def record(self, request, response, metrics, total):
+        view = metrics.view or "unresolved"
+        REQUESTS.inc((view, request.method, response.status_code))
+        REQUEST_DURATION.observe((view,), total)
+        DB_DURATION.observe((view,), metrics.db_time)
+        SERIALIZER_DURATION.observe((view,), metrics.serializer_time)
+        DB_QUERIES.observe((view,), metrics.queries)
+
+        response["Server-Timing"] = (
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries", '
+            f"serializer;dur={metrics.serializer_time * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current_metrics.get()
+        if metrics is not None:
+            metrics.view = view_name(view_func, request.method)
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Add the time spent in the block to the serializer time of the current
+    request. Nested blocks are counted once, as part of the outermost one.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+
+    metrics.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - started
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    # Adds the time spent in to_representation() to the serializer time of the
+    # current request. A comment rather than a docstring, as drf-spectacular
+    # would use a docstring to describe every serializer without its own.
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+def metrics_view(request):
+    """
+    Serve the request histograms of this process in the Prometheus text
+    format to staff users and to ``Authorization: Bearer <METRICS_TOKEN>``.
+    Without a METRICS_TOKEN setting the endpoint is hidden from everyone else.
+    """
+    if not (request.user.is_staff or has_metrics_token(request)):
+        if not settings.METRICS_TOKEN:
+            raise Http404
+        return HttpResponseForbidden()
+
+    lines = [line for metric in REGISTRY for line in metric.collect()]
+    return HttpResponse(
+        "\n".join(lines) + "\n", content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def has_metrics_token(request):
+    if not settings.METRICS_TOKEN:
+        return False
+    return hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+    )
@@ -0,0 +1,54 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so that existing rosters stay writable.
+    atomic = False
+
+    dependencies = [
+        ("api", "0003_add_provider_id_to_patient"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["provider", "status"], name="patients_provider_status_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["provider", "last_name", "first_name", "id"],
+                name="patients_provider_name_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["provider", "created_at", "id"],
+                name="patients_provider_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patientaddress",
+            index=models.Index(
+                condition=models.Q(("is_primary", True)),
+                fields=["patient"],
+                name="patient_addr_primary_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patientcustomfieldvalue",
+            index=models.Index(
+                fields=["custom_field", "number_value"], name="cfv_field_number_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patientcustomfieldvalue",
+            index=models.Index(
+                fields=["custom_field", "text_value"], name="cfv_field_text_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("api", "0004_provider_scoped_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["provider", "first_name", "id"],
+                name="patients_provider_first_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["provider", "date_of_birth", "id"],
+                name="patients_provider_dob_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patientaddress",
+            index=models.Index(
+                condition=models.Q(("is_primary", True)),
+                fields=["state", "city", "patient"],
+                name="patient_addr_primary_loc_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0006_patient_name_trigram_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patient",
+            name="external_id",
+            field=models.CharField(
+                blank=True,
+                help_text="Identifier of the patient in the provider's own systems.",
+                max_length=100,
+                null=True,
+                verbose_name="external id",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="patient",
+            constraint=models.UniqueConstraint(
+                fields=("provider", "external_id"),
+                name="patients_provider_external_id_uniq",
+            ),
+        ),
+    ]
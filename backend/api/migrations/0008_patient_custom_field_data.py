@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+import api.models
+
+# Same projection as api.projection.PROJECTION_SQL, for all patients.
+POPULATE_SQL = """
+UPDATE patients patient
+SET custom_field_data = projected.data
+FROM (
+    SELECT patient_id, jsonb_object_agg(
+        custom_field_id::text,
+        CASE
+            WHEN number_value IS NOT NULL THEN to_jsonb(number_value)
+            ELSE to_jsonb(text_value)
+        END
+    ) AS data
+    FROM patient_custom_field_values
+    GROUP BY patient_id
+) projected
+WHERE patient.id = projected.patient_id
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0007_patient_external_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patient",
+            name="custom_field_data",
+            field=models.JSONField(
+                blank=True,
+                db_default={},
+                decoder=api.models.CustomFieldDataDecoder,
+                default=dict,
+                editable=False,
+                encoder=api.models.CustomFieldDataEncoder,
+                help_text="Custom field values by custom field id, projected from the patient's custom field values. See api.projection.",
+                verbose_name="custom field data",
+            ),
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,20 @@
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("api", "0008_patient_custom_field_data"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["custom_field_data"], name="patients_custom_data_idx"
+            ),
+        ),
+    ]
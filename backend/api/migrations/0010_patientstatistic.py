@@ -0,0 +1,75 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Same counts as api.stats.count_patient_stats, for all providers.
+POPULATE_SQL = """
+INSERT INTO patient_statistics (provider_id, dimension, key, count)
+SELECT provider_id, 'status', status, count(*)
+FROM patients
+GROUP BY provider_id, status
+UNION ALL
+SELECT patient.provider_id, 'state', address.state, count(*)
+FROM patient_addresses address
+JOIN patients patient ON patient.id = address.patient_id
+WHERE address.is_primary
+GROUP BY patient.provider_id, address.state
+UNION ALL
+SELECT provider_id, 'week',
+    date_trunc('week', created_at AT TIME ZONE %s)::date::text, count(*)
+FROM patients
+GROUP BY 1, 2, 3
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0009_patient_custom_field_data_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientStatistic",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "dimension",
+                    models.CharField(
+                        choices=[
+                            ("status", "Status"),
+                            ("state", "Primary address state"),
+                            ("week", "Week created"),
+                        ],
+                        max_length=10,
+                        verbose_name="dimension",
+                    ),
+                ),
+                ("key", models.CharField(max_length=20, verbose_name="key")),
+                ("count", models.IntegerField(default=0, verbose_name="count")),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="patient_statistics",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="provider",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "patient statistic",
+                "verbose_name_plural": "patient statistics",
+                "db_table": "patient_statistics",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("provider", "dimension", "key"),
+                        name="patient_statistics_key_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(
+            [(POPULATE_SQL, [settings.TIME_ZONE])], migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,55 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0010_patientstatistic"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "object_type",
+                    models.CharField(
+                        choices=[
+                            ("patient", "Patient"),
+                            ("customfield", "Custom field"),
+                        ],
+                        max_length=20,
+                        verbose_name="object type",
+                    ),
+                ),
+                ("object_id", models.IntegerField(verbose_name="object id")),
+                ("deleted_at", models.DateTimeField(verbose_name="deleted at")),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tombstones",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="provider",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "tombstone",
+                "verbose_name_plural": "tombstones",
+                "db_table": "tombstones",
+                "indexes": [
+                    models.Index(
+                        fields=["provider", "object_type", "deleted_at", "id"],
+                        name="tombstones_provider_idx",
+                    ),
+                    models.Index(
+                        fields=["deleted_at"], name="tombstones_deleted_at_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("api", "0011_tombstone"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["provider", "modified_at", "id"],
+                name="patients_provider_modified_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,98 @@
+from django.db import migrations
+
+# Statement triggers NOTIFY the patient_changes channel once per statement and
+# provider, with the ids of the patients whose rows the statement wrote, so
+# that every write path is covered, bulk and raw SQL included. Patient ids are
+# left out above 500, to stay under the 8000 byte payload limit. Identical
+# notifications are sent once per transaction. See api.events.
+FUNCTIONS_SQL = """
+CREATE FUNCTION notify_patient_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    event text := CASE WHEN TG_OP = 'DELETE' THEN 'deleted' ELSE 'changed' END;
+    changes record;
+BEGIN
+    FOR changes IN
+        SELECT provider_id, count(*) AS count, array_agg(id ORDER BY id) AS ids
+        FROM changed_rows
+        GROUP BY provider_id
+    LOOP
+        PERFORM pg_notify('patient_changes', json_build_object(
+            'provider', changes.provider_id,
+            'event', event,
+            'patients', CASE WHEN changes.count <= 500 THEN changes.ids END
+        )::text);
+    END LOOP;
+    RETURN NULL;
+END;
+$$;
+
+CREATE FUNCTION notify_patient_row_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    changes record;
+BEGIN
+    FOR changes IN
+        SELECT patient.provider_id, count(*) AS count,
+            array_agg(patient.id ORDER BY patient.id) AS ids
+        FROM patients patient
+        WHERE patient.id IN (SELECT patient_id FROM changed_rows)
+        GROUP BY patient.provider_id
+    LOOP
+        PERFORM pg_notify('patient_changes', json_build_object(
+            'provider', changes.provider_id,
+            'event', 'changed',
+            'patients', CASE WHEN changes.count <= 500 THEN changes.ids END
+        )::text);
+    END LOOP;
+    RETURN NULL;
+END;
+$$;
+"""
+
+DROP_FUNCTIONS_SQL = """
+DROP FUNCTION notify_patient_row_changes();
+DROP FUNCTION notify_patient_changes();
+"""
+
+TRIGGER_SQL = """
+CREATE TRIGGER {table}_notify_{operation}
+AFTER {operation} ON {table}
+REFERENCING {transition} TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+"""
+
+TRIGGERS = [
+    (table, operation, "OLD" if operation == "DELETE" else "NEW", function)
+    for table, function in [
+        ("patients", "notify_patient_changes"),
+        ("patient_addresses", "notify_patient_row_changes"),
+        ("patient_custom_field_values", "notify_patient_row_changes"),
+    ]
+    for operation in ["INSERT", "UPDATE", "DELETE"]
+]
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0012_patient_modified_index"),
+    ]
+
+    operations = [
+        migrations.RunSQL(FUNCTIONS_SQL, DROP_FUNCTIONS_SQL),
+        migrations.RunSQL(
+            [
+                TRIGGER_SQL.format(
+                    table=table,
+                    operation=operation,
+                    transition=transition,
+                    function=function,
+                )
+                for table, operation, transition, function in TRIGGERS
+            ],
+            [
+                f"DROP TRIGGER {table}_notify_{operation} ON {table};"
+                for table, operation, _transition, _function in TRIGGERS
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    BtreeGinExtension,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("api", "0013_patient_change_notifications"),
+    ]
+
+    operations = [
+        BtreeGinExtension(),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                models.F("provider"),
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Concat(
+                        "first_name",
+                        models.Value(" "),
+                        "middle_name",
+                        models.Value(" "),
+                        "last_name",
+                        output_field=models.TextField(),
+                    ),
+                    name="gin_trgm_ops",
+                ),
+                name="patients_prov_name_trgm_idx",
+            ),
+        ),
+        RemoveIndexConcurrently(
+            model_name="patient",
+            name="patients_name_trgm_idx",
+        ),
+    ]
@@ -1,5 +1,13 @@
+import json
+from decimal import Decimal
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Concat
 from django.utils.translation import gettext_lazy as _
 
 
@@ -15,29 +23,34 @@ class User(AbstractUser):
     def __str__(self):
         return self.email if self.email else self.username
 
+
 class PatientStatus(models.TextChoices):
-    INQUIRY = 'INQUIRY', _('Inquiry')
-    ONBOARDING = 'ONBOARDING', _('Onboarding')
-    ACTIVE = 'ACTIVE', _('Active')
-    CHURNED = 'CHURNED', _('Churned')
+    INQUIRY = "INQUIRY", _("Inquiry")
+    ONBOARDING = "ONBOARDING", _("Onboarding")
+    ACTIVE = "ACTIVE", _("Active")
+    CHURNED = "CHURNED", _("Churned")
+
 
 class StateChoices(models.TextChoices):
-    CA = 'CA', _('California')
-    NY = 'NY', _('New York')
-    TX = 'TX', _('Texas')
-    FL = 'FL', _('Florida')
-    IL = 'IL', _('Illinois')
-    MA = 'MA', _('Massachusetts')
-    WA = 'WA', _('Washington')
+    CA = "CA", _("California")
+    NY = "NY", _("New York")
+    TX = "TX", _("Texas")
+    FL = "FL", _("Florida")
+    IL = "IL", _("Illinois")
+    MA = "MA", _("Massachusetts")
+    WA = "WA", _("Washington")
     # Add more states as needed for your MVP
 
+
 class AddressType(models.TextChoices):
-    HOME = 'HOME', _('Home')
-    WORK = 'WORK', _('Work')
+    HOME = "HOME", _("Home")
+    WORK = "WORK", _("Work")
+
 
 class CustomFieldType(models.TextChoices):
-    TEXT = 'TEXT', _('Text')
-    NUMBER = 'NUMBER', _('Number')
+    TEXT = "TEXT", _("Text")
+    NUMBER = "NUMBER", _("Number")
+
 
 class CustomField(models.Model):
     id = models.AutoField(primary_key=True)
@@ -45,13 +58,11 @@ class CustomField(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name="custom_fields",
-        verbose_name=_("provider")
+        verbose_name=_("provider"),
     )
     name = models.CharField(_("field name"), max_length=100)
     field_type = models.CharField(
-        _("field type"),
-        max_length=20,
-        choices=CustomFieldType.choices
+        _("field type"), max_length=20, choices=CustomFieldType.choices
     )
     description = models.TextField(_("description"), blank=True, null=True)
     created_at = models.DateTimeField(_("created at"), auto_now_add=True)
@@ -61,28 +72,108 @@ class CustomField(models.Model):
         db_table = "custom_fields"
         verbose_name = _("custom field")
         verbose_name_plural = _("custom fields")
-        unique_together = ['provider', 'name']
+        unique_together = ["provider", "name"]
 
     def __str__(self):
         return f"{self.name} ({self.get_field_type_display()})"
 
+    def save(self, *args, **kwargs):
+        # Receivers touch the patients showing a renamed field in the same
+        # transaction.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored name, so that renames can be told apart on save.
+        instance._stored_name = instance.__dict__.get("name")
+        return instance
+
+
+# Searched with pg_trgm by the patient search filter. The expression has to stay
+# identical to the one in patients_prov_name_trgm_idx for the index to be
+# used.
+PATIENT_SEARCH_NAME = Concat(
+    "first_name",
+    models.Value(" "),
+    "middle_name",
+    models.Value(" "),
+    "last_name",
+    output_field=models.TextField(),
+)
+
+
+class CustomFieldDataEncoder(DjangoJSONEncoder):
+    """
+    Writes numbers as JSON numbers so that they compare numerically in SQL.
+    Number values have at most 15 digits, which a float holds exactly.
+    """
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return super().default(o)
+
+
+CUSTOM_FIELD_NUMBER_PLACES = Decimal("0.01")
+
+
+def parse_custom_field_number(text):
+    return Decimal(text).quantize(CUSTOM_FIELD_NUMBER_PLACES)
+
+
+class CustomFieldDataDecoder(json.JSONDecoder):
+    """
+    Reads numbers back as Decimal with two decimal places, like
+    PatientCustomFieldValue.number_value.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("parse_float", parse_custom_field_number)
+        kwargs.setdefault("parse_int", parse_custom_field_number)
+        super().__init__(*args, **kwargs)
+
+
 class Patient(models.Model):
     id = models.AutoField(primary_key=True)
     provider = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="patients",
-        verbose_name=_("provider")
+        verbose_name=_("provider"),
     )
     first_name = models.CharField(_("first name"), max_length=100)
-    middle_name = models.CharField(_("middle name"), max_length=100, blank=True, null=True)
+    middle_name = models.CharField(
+        _("middle name"), max_length=100, blank=True, null=True
+    )
     last_name = models.CharField(_("last name"), max_length=100)
+    external_id = models.CharField(
+        _("external id"),
+        max_length=100,
+        blank=True,
+        null=True,
+        help_text=_("Identifier of the patient in the provider's own systems."),
+    )
     date_of_birth = models.DateField(_("date of birth"))
     status = models.CharField(
         _("status"),
         max_length=20,
         choices=PatientStatus.choices,
     )
+    custom_field_data = models.JSONField(
+        _("custom field data"),
+        default=dict,
+        db_default={},
+        blank=True,
+        editable=False,
+        encoder=CustomFieldDataEncoder,
+        decoder=CustomFieldDataDecoder,
+        help_text=_(
+            "Custom field values by custom field id, projected from the patient's "
+            "custom field values. See api.projection."
+        ),
+    )
     created_at = models.DateTimeField(_("created at"), auto_now_add=True)
     modified_at = models.DateTimeField(_("modified at"), auto_now=True)
 
@@ -90,35 +181,83 @@ class Patient(models.Model):
         db_table = "patients"
         verbose_name = _("patient")
         verbose_name_plural = _("patients")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["provider", "external_id"],
+                name="patients_provider_external_id_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["provider", "status"], name="patients_provider_status_idx"
+            ),
+            models.Index(
+                fields=["provider", "last_name", "first_name", "id"],
+                name="patients_provider_name_idx",
+            ),
+            models.Index(
+                fields=["provider", "created_at", "id"],
+                name="patients_provider_created_idx",
+            ),
+            models.Index(
+                fields=["provider", "first_name", "id"],
+                name="patients_provider_first_idx",
+            ),
+            models.Index(
+                fields=["provider", "date_of_birth", "id"],
+                name="patients_provider_dob_idx",
+            ),
+            models.Index(
+                fields=["provider", "modified_at", "id"],
+                name="patients_provider_modified_idx",
+            ),
+            # With btree_gin, so that a search only matches the provider's
+            # patients rather than every provider's and filtering them.
+            GinIndex(
+                F("provider"),
+                OpClass(PATIENT_SEARCH_NAME, name="gin_trgm_ops"),
+                name="patients_prov_name_trgm_idx",
+            ),
+            GinIndex(fields=["custom_field_data"], name="patients_custom_data_idx"),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        # Receivers record the patient statistics in the same transaction.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored status, so that status changes can be counted on save.
+        instance._stored_status = instance.__dict__.get("status")
+        return instance
+
     @property
     def full_name(self):
-        if self.middle_name:
-            return f"{self.first_name} {self.middle_name} {self.last_name}"
-        return f"{self.first_name} {self.last_name}"
+        return self.format_full_name(self.first_name, self.middle_name, self.last_name)
+
+    @staticmethod
+    def format_full_name(first_name, middle_name, last_name):
+        if middle_name:
+            return f"{first_name} {middle_name} {last_name}"
+        return f"{first_name} {last_name}"
+
 
 class PatientAddress(models.Model):
     id = models.AutoField(primary_key=True)
     patient = models.ForeignKey(
-        Patient,
-        on_delete=models.CASCADE,
-        related_name="addresses"
+        Patient, on_delete=models.CASCADE, related_name="addresses"
     )
     address_type = models.CharField(
-        _("address type"),
-        max_length=4,
-        choices=AddressType.choices
+        _("address type"), max_length=4, choices=AddressType.choices
     )
     street_address = models.CharField(_("street address"), max_length=255)
     city = models.CharField(_("city"), max_length=100)
-    state = models.CharField(
-        _("state"),
-        max_length=2,
-        choices=StateChoices.choices
-    )
+    state = models.CharField(_("state"), max_length=2, choices=StateChoices.choices)
     postal_code = models.CharField(_("postal code"), max_length=20)
     is_primary = models.BooleanField(_("primary address"))
     created_at = models.DateTimeField(_("created at"), auto_now_add=True)
@@ -128,33 +267,49 @@ class PatientAddress(models.Model):
         db_table = "patient_addresses"
         verbose_name = _("patient address")
         verbose_name_plural = _("patient addresses")
+        indexes = [
+            models.Index(
+                fields=["patient"],
+                condition=models.Q(is_primary=True),
+                name="patient_addr_primary_idx",
+            ),
+            models.Index(
+                fields=["state", "city", "patient"],
+                condition=models.Q(is_primary=True),
+                name="patient_addr_primary_loc_idx",
+            ),
+        ]
 
     @property
     def full_address(self):
-        return f"{self.street_address}, {self.city}, {self.state} {self.postal_code}"
+        return self.format_full_address(
+            self.street_address, self.city, self.state, self.postal_code
+        )
+
+    @staticmethod
+    def format_full_address(street_address, city, state, postal_code):
+        return f"{street_address}, {city}, {state} {postal_code}"
 
     def __str__(self):
         return f"{self.street_address}, {self.city}, {self.state} {self.postal_code}"
 
+    def save(self, *args, **kwargs):
+        # Receivers record the patient statistics in the same transaction.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+
 class PatientCustomFieldValue(models.Model):
     id = models.AutoField(primary_key=True)
     patient = models.ForeignKey(
-        Patient,
-        on_delete=models.CASCADE,
-        related_name="custom_field_values"
+        Patient, on_delete=models.CASCADE, related_name="custom_field_values"
     )
     custom_field = models.ForeignKey(
-        CustomField,
-        on_delete=models.CASCADE,
-        related_name="field_values"
+        CustomField, on_delete=models.CASCADE, related_name="field_values"
     )
     text_value = models.TextField(_("text value"), blank=True, null=True)
     number_value = models.DecimalField(
-        _("number value"),
-        max_digits=15,
-        decimal_places=2,
-        null=True,
-        blank=True
+        _("number value"), max_digits=15, decimal_places=2, null=True, blank=True
     )
     created_at = models.DateTimeField(_("created at"), auto_now_add=True)
     modified_at = models.DateTimeField(_("modified at"), auto_now=True)
@@ -163,29 +318,142 @@ class PatientCustomFieldValue(models.Model):
         db_table = "patient_custom_field_values"
         verbose_name = _("patient custom field value")
         verbose_name_plural = _("patient custom field values")
-        unique_together = ['patient', 'custom_field']
+        unique_together = ["patient", "custom_field"]
+        indexes = [
+            models.Index(
+                fields=["custom_field", "number_value"], name="cfv_field_number_idx"
+            ),
+            models.Index(
+                fields=["custom_field", "text_value"], name="cfv_field_text_idx"
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.custom_field.name}: {self.get_value()}"
+        return f"{self.get_custom_field().name}: {self.value}"
+
+    def get_custom_field(self):
+        """
+        The custom field, taken from custom_field_cache unless it is already
+        loaded on this instance.
+        """
+        if PatientCustomFieldValue.custom_field.is_cached(self):
+            return self.custom_field
+        from .cache import custom_field_cache
+
+        return custom_field_cache.get(self.custom_field_id) or self.custom_field
 
     def clean(self):
-        if self.custom_field.field_type == CustomFieldType.TEXT:
+        field_type = self.get_custom_field().field_type
+        if field_type == CustomFieldType.TEXT:
             if not self.text_value:
-                raise ValidationError(_('Text value is required for text custom fields.'))
+                raise ValidationError(
+                    _("Text value is required for text custom fields.")
+                )
             if self.number_value is not None:
-                raise ValidationError(_('Number value should be null for text custom fields.'))
-        elif self.custom_field.field_type == CustomFieldType.NUMBER:
+                raise ValidationError(
+                    _("Number value should be null for text custom fields.")
+                )
+        elif field_type == CustomFieldType.NUMBER:
             if self.number_value is None:
-                raise ValidationError(_('Number value is required for number custom fields.'))
+                raise ValidationError(
+                    _("Number value is required for number custom fields.")
+                )
             if self.text_value:
-                raise ValidationError(_('Text value should be null for number custom fields.'))
+                raise ValidationError(
+                    _("Text value should be null for number custom fields.")
+                )
 
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        # The post_save receiver refreshes Patient.custom_field_data, which
+        # has to happen in the same transaction.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
 
     @property
     def value(self):
-        if self.custom_field.field_type == CustomFieldType.NUMBER:
+        if self.get_custom_field().field_type == CustomFieldType.NUMBER:
             return self.number_value
         return self.text_value
+
+
+class PatientStatisticDimension(models.TextChoices):
+    STATUS = "status", _("Status")
+    STATE = "state", _("Primary address state")
+    WEEK = "week", _("Week created")
+
+
+class PatientStatistic(models.Model):
+    """
+    Number of a provider's patients with one value of one dimension: a status,
+    the state of the primary address or the week the patient was created,
+    keyed by the date of its Monday. Kept up to date by api.stats.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    provider = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="patient_statistics",
+        verbose_name=_("provider"),
+    )
+    dimension = models.CharField(
+        _("dimension"), max_length=10, choices=PatientStatisticDimension.choices
+    )
+    key = models.CharField(_("key"), max_length=20)
+    count = models.IntegerField(_("count"), default=0)
+
+    class Meta:
+        db_table = "patient_statistics"
+        verbose_name = _("patient statistic")
+        verbose_name_plural = _("patient statistics")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["provider", "dimension", "key"],
+                name="patient_statistics_key_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.key}: {self.count}"
+
+
+class TombstoneObjectType(models.TextChoices):
+    PATIENT = "patient", _("Patient")
+    CUSTOM_FIELD = "customfield", _("Custom field")
+
+
+class Tombstone(models.Model):
+    """
+    A deleted patient or custom field, reported by the change feeds of
+    api.changes until it is pruned. ``object_type`` is the model name of the
+    deleted row.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    provider = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="tombstones",
+        verbose_name=_("provider"),
+    )
+    object_type = models.CharField(
+        _("object type"), max_length=20, choices=TombstoneObjectType.choices
+    )
+    object_id = models.IntegerField(_("object id"))
+    deleted_at = models.DateTimeField(_("deleted at"))
+
+    class Meta:
+        db_table = "tombstones"
+        verbose_name = _("tombstone")
+        verbose_name_plural = _("tombstones")
+        indexes = [
+            models.Index(
+                fields=["provider", "object_type", "deleted_at", "id"],
+                name="tombstones_provider_idx",
+            ),
+            models.Index(fields=["deleted_at"], name="tombstones_deleted_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.object_type} {self.object_id}"
@@ -0,0 +1,171 @@
+"""
+Set-based changes of every patient in a selection: status transitions, custom
+field value backfills and deletes.
+
+The selection is read in primary key chunks of MUTATION_CHUNK_SIZE, each
+changed with a few statements in its own transaction, so that large
+selections neither hold locks for long nor cost one request per patient. The
+selection is re-read after the last id of each chunk, so patients that leave
+it on the way are not revisited. Chunks record the patient statistics, the
+projection, tombstones and cache invalidation like the other bulk writes,
+and the triggers of api.events notify listeners.
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from .cache import invalidate_patient_cache
+from .models import CustomFieldType, Patient, PatientCustomFieldValue
+from .projection import refresh_custom_field_data
+from .stats import delete_patients, record_patient_stats, status_stats
+
+MUTATION_CHUNK_SIZE = 1000
+
+SET_STATUS = "set_status"
+SET_CUSTOM_FIELD_VALUE = "set_custom_field_value"
+DELETE = "delete"
+
+OPERATIONS = [
+    (SET_STATUS, _("Set the status")),
+    (SET_CUSTOM_FIELD_VALUE, _("Set a custom field value")),
+    (DELETE, _("Delete")),
+]
+
+# Locks the patients whose status changes and returns their previous status,
+# for the statistics.
+SET_STATUS_SQL = f"""
+WITH changed AS (
+    SELECT id, status
+    FROM {Patient._meta.db_table}
+    WHERE id = ANY(%(ids)s) AND status <> %(status)s
+    FOR UPDATE
+)
+UPDATE {Patient._meta.db_table} patient
+SET status = %(status)s, modified_at = %(now)s
+FROM changed
+WHERE patient.id = changed.id
+RETURNING changed.status
+"""
+
+# Values that are already set are left alone, so that the row count is the
+# number of patients whose value changed.
+UPSERT_VALUE_SQL = f"""
+INSERT INTO {PatientCustomFieldValue._meta.db_table} AS field_value (
+    patient_id, custom_field_id, text_value, number_value, created_at, modified_at
+)
+SELECT patient.id, %(custom_field)s, %(text_value)s, %(number_value)s, %(now)s, %(now)s
+FROM {Patient._meta.db_table} patient
+WHERE patient.id = ANY(%(ids)s)
+ON CONFLICT (patient_id, custom_field_id) DO UPDATE
+SET text_value = EXCLUDED.text_value,
+    number_value = EXCLUDED.number_value,
+    modified_at = EXCLUDED.modified_at
+WHERE (field_value.text_value, field_value.number_value)
+    IS DISTINCT FROM (EXCLUDED.text_value, EXCLUDED.number_value)
+"""
+
+
+@dataclass
+class MutationResult:
+    matched: int = 0
+    affected: int = 0
+    dry_run: bool = False
+
+
+def mutate_patients(
+    patients,
+    provider_id,
+    operation,
+    status=None,
+    custom_field_value=None,
+    dry_run=False,
+    chunk_size=MUTATION_CHUNK_SIZE,
+):
+    """
+    Apply ``operation`` to the provider's ``patients``: set their ``status``,
+    set the ``custom_field_value`` (a dict with the custom field and its text
+    or number value), or delete them. Returns the number of patients matched
+    and the number actually changed. With ``dry_run`` both are counted and
+    nothing is written.
+    """
+    patients = patients.order_by("pk")
+    if dry_run:
+        affected = affected_patients(patients, operation, status, custom_field_value)
+        return MutationResult(
+            matched=patients.count(), affected=affected.count(), dry_run=True
+        )
+
+    result = MutationResult()
+    last_id = 0
+    while True:
+        ids = list(
+            patients.filter(pk__gt=last_id).values_list("pk", flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            if operation == SET_STATUS:
+                result.affected += set_status(provider_id, ids, status)
+            elif operation == SET_CUSTOM_FIELD_VALUE:
+                result.affected += set_custom_field_value(ids, custom_field_value)
+            else:
+                _deleted, deleted = delete_patients(Patient.objects.filter(pk__in=ids))
+                result.affected += deleted.get(Patient._meta.label, 0)
+            invalidate_patient_cache(provider_ids=[provider_id])
+        result.matched += len(ids)
+        last_id = ids[-1]
+    return result
+
+
+def affected_patients(patients, operation, status=None, custom_field_value=None):
+    """
+    The ``patients`` that ``operation`` would change.
+    """
+    if operation == SET_STATUS:
+        return patients.exclude(status=status)
+    if operation == SET_CUSTOM_FIELD_VALUE:
+        custom_field = custom_field_value["custom_field"]
+        if custom_field.field_type == CustomFieldType.NUMBER:
+            value = custom_field_value["number_value"]
+        else:
+            value = custom_field_value["text_value"]
+        return patients.exclude(
+            custom_field_data__contains={str(custom_field.pk): value}
+        )
+    return patients
+
+
+def set_status(provider_id, ids, status):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SET_STATUS_SQL, {"ids": ids, "status": status, "now": timezone.now()}
+        )
+        previous = Counter(row[0] for row in cursor.fetchall())
+
+    stats = Counter()
+    for previous_status, count in previous.items():
+        stats.update(status_stats(provider_id, previous_status, -count))
+        stats.update(status_stats(provider_id, status, count))
+    record_patient_stats(stats)
+    return previous.total()
+
+
+def set_custom_field_value(ids, custom_field_value):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPSERT_VALUE_SQL,
+            {
+                "ids": ids,
+                "custom_field": custom_field_value["custom_field"].pk,
+                "text_value": custom_field_value["text_value"],
+                "number_value": custom_field_value["number_value"],
+                "now": timezone.now(),
+            },
+        )
+        changed = cursor.rowcount
+    refresh_custom_field_data(ids)
+    return changed
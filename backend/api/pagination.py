@@ -0,0 +1,273 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a fixed set of stable sort orders.
+
+    Each page filters on the sort key of the last row of the previous page
+    instead of using OFFSET, and no COUNT(*) is issued, so every page costs
+    the same regardless of how deep it is. Cursors are opaque to clients.
+    """
+
+    page_size = None
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+
+    # Every key ends with the primary key so that it is unique and stable.
+    orderings = {
+        "id": ("id",),
+        "created_at": ("created_at", "id"),
+        "name": ("last_name", "first_name", "id"),
+    }
+    default_ordering = "id"
+
+    invalid_cursor_message = _("Invalid cursor")
+    invalid_ordering_message = _(
+        "Ordering by {ordering} is not supported with keyset pagination. "
+        "Use one of {orderings}, optionally prefixed with '-'."
+    )
+
+    def __init__(self, page_size=None):
+        if page_size is not None:
+            self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page([obj async for obj in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """
+        The rows of the requested page, plus one to tell whether there is a
+        next page.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request)
+        name, descending = self.parse_ordering(self.ordering)
+        self.fields = self.orderings[name]
+        self.descending = descending
+        self.model = queryset.model
+
+        queryset = queryset.order_by(
+            *(f"-{field}" if descending else field for field in self.fields)
+        )
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position))
+
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {
+                    "type": "string",
+                    "nullable": True,
+                    "format": "uri",
+                },
+                "results": schema,
+            },
+        }
+
+    def get_ordering(self, request):
+        return request.query_params.get(
+            self.ordering_query_param, self.default_ordering
+        )
+
+    def parse_ordering(self, ordering):
+        descending = ordering.startswith("-")
+        name = ordering.lstrip("-")
+        if name not in self.orderings:
+            raise exceptions.ValidationError(
+                {
+                    self.ordering_query_param: [
+                        self.invalid_ordering_message.format(
+                            ordering=name, orderings=", ".join(self.orderings)
+                        )
+                    ]
+                }
+            )
+        return name, descending
+
+    def get_seek_filter(self, position):
+        """
+        Expand ``(f1, f2, ..., fn) > (v1, v2, ..., vn)`` into a disjunction of
+        equalities. The leading ``f1 >= v1`` term lets Postgres bound the
+        index range scan on the first column.
+        """
+        op = "lt" if self.descending else "gt"
+        equal = Q()
+        seek = Q()
+        for field, value in zip(self.fields, position, strict=True):
+            seek |= equal & Q(**{f"{field}__{op}": value})
+            equal &= Q(**{field: value})
+        return Q(**{f"{self.fields[0]}__{op}e": position[0]}) & seek
+
+    def encode_cursor(self, obj):
+        if isinstance(obj, dict):
+            # A values() row, as served by the fast read path.
+            obj = self.model(**{field: obj[field] for field in self.fields})
+        values = [
+            obj._meta.get_field(field).value_to_string(obj) for field in self.fields
+        ]
+        payload = json.dumps({"o": self.ordering, "v": values}, separators=(",", ":"))
+        return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            payload = json.loads(urlsafe_b64decode(padded.encode()).decode())
+            if payload["o"] != self.ordering or len(payload["v"]) != len(self.fields):
+                raise ValueError
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, payload["v"], strict=True)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError) as e:
+            raise NotFound(self.invalid_cursor_message) from e
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+
+class PatientPagination(PageNumberPagination):
+    """
+    Page-number pagination by default, with an opt-in keyset mode selected by
+    ``?pagination=cursor`` for large rosters.
+
+    Keyset mode only supports the orderings of KeysetPagination, and replaces
+    the similarity ranking of a search, so other orderings and a search
+    without an ordering are rejected rather than silently reordered.
+    """
+
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    mode_query_param = "pagination"
+    cursor_mode = "cursor"
+
+    search_without_ordering_message = _(
+        "Search results are ranked by similarity, which is not supported with "
+        "keyset pagination. Pass an ordering of {orderings}."
+    )
+
+    def __init__(self):
+        self.keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) == self.cursor_mode:
+            self.keyset = self.get_keyset(request)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_keyset(self, request):
+        params = request.query_params
+        if params.get(api_settings.SEARCH_PARAM) and not params.get(
+            KeysetPagination.ordering_query_param
+        ):
+            raise exceptions.ValidationError(
+                {
+                    api_settings.SEARCH_PARAM: [
+                        self.search_without_ordering_message.format(
+                            orderings=", ".join(KeysetPagination.orderings)
+                        )
+                    ]
+                }
+            )
+        return KeysetPagination(page_size=self.get_page_size(request))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views, reading the count and the page
+        with the async ORM.
+        """
+        if request.query_params.get(self.mode_query_param) == self.cursor_mode:
+            self.keyset = self.get_keyset(request)
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            ) from exc
+
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        self.request = request
+        return self.page.object_list
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            *super().get_schema_operation_parameters(view),
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to 'cursor' to use keyset pagination, ordered "
+                "by id, created_at or name (optionally prefixed with '-'). "
+                "Other orderings, and a search without an ordering, are "
+                "rejected with 400. The response then has only 'next' and "
+                "'results'.",
+                "schema": {"type": "string", "enum": [self.cursor_mode]},
+            },
+            {
+                "name": KeysetPagination.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value (cursor mode only).",
+                "schema": {"type": "string"},
+            },
+        ]
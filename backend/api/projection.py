@@ -0,0 +1,186 @@
+"""
+Patient.custom_field_data is a read projection of the patient's rows in
+patient_custom_field_values: one key per custom field id, holding the number
+value as a JSON number or else the text value.
+
+The value table stays the source of truth. Writes that know the patient's
+complete set of values set the projection in the same statement as the
+patient, other writes refresh it from the value table in the same
+transaction, and ``rebuild_custom_field_data`` regenerates it. Changes of the
+projection bump ``Patient.modified_at``, for the change feeds of api.changes.
+"""
+
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Func, JSONField, TextField, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import CustomFieldType, Patient, PatientCustomFieldValue
+
+REBUILD_BATCH_SIZE = 5000
+
+PROJECTION_SQL = """
+WITH projected AS (
+    SELECT patient.id, COALESCE(
+        jsonb_object_agg(
+            field_value.custom_field_id::text,
+            CASE
+                WHEN field_value.number_value IS NOT NULL
+                THEN to_jsonb(field_value.number_value)
+                ELSE to_jsonb(field_value.text_value)
+            END
+        ) FILTER (WHERE field_value.id IS NOT NULL),
+        '{{}}'::jsonb
+    ) AS data
+    FROM {patients} patient
+    LEFT JOIN {custom_field_values} field_value ON field_value.patient_id = patient.id
+    WHERE {where}
+    GROUP BY patient.id
+)
+UPDATE {patients} patient
+SET custom_field_data = projected.data, modified_at = statement_timestamp()
+FROM projected
+WHERE patient.id = projected.id
+    AND patient.custom_field_data IS DISTINCT FROM projected.data
+"""
+
+
+def projection_sql(where):
+    return PROJECTION_SQL.format(
+        patients=Patient._meta.db_table,
+        custom_field_values=PatientCustomFieldValue._meta.db_table,
+        where=where,
+    )
+
+
+def project_custom_field_values(values):
+    """
+    The projection of ``values``, PatientCustomFieldValue instances or dicts
+    with ``custom_field`` and the text and number values.
+    """
+    data = {}
+    for value in values:
+        if isinstance(value, dict):
+            custom_field_id = value["custom_field"]
+            custom_field_id = getattr(custom_field_id, "pk", custom_field_id)
+            text_value = value.get("text_value")
+            number_value = value.get("number_value")
+        else:
+            custom_field_id = value.custom_field_id
+            text_value = value.text_value
+            number_value = value.number_value
+        data[str(custom_field_id)] = (
+            Decimal(number_value) if number_value is not None else text_value
+        )
+    return data
+
+
+def represent_custom_field_data(data, custom_fields):
+    """
+    The projected values in ``data`` as ``{"custom_field": name, "value":
+    value}`` dicts ordered by custom field id, given the provider's custom
+    fields by id. Keys of fields that no longer exist are skipped.
+    """
+    values = []
+    for custom_field_id, value in sorted(
+        (int(key), value) for key, value in data.items()
+    ):
+        custom_field = custom_fields.get(custom_field_id)
+        if custom_field is not None:
+            values.append({"custom_field": custom_field.name, "value": value})
+    return values
+
+
+def refresh_custom_field_data(patient_ids):
+    """
+    Recompute the projection of the given patients from their custom field
+    values. Returns the number of patients whose projection changed.
+    """
+    patient_ids = list(patient_ids)
+    if not patient_ids:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(projection_sql("patient.id = ANY(%s)"), [patient_ids])
+        return cursor.rowcount
+
+
+def remove_custom_field_data(custom_field):
+    """
+    Drop a deleted custom field from the projection of its provider's patients.
+    """
+    Patient.objects.filter(
+        provider_id=custom_field.provider_id,
+        custom_field_data__has_key=str(custom_field.pk),
+    ).update(
+        custom_field_data=Func(
+            F("custom_field_data"),
+            Cast(Value(str(custom_field.pk)), TextField()),
+            arg_joiner=" - ",
+            template="(%(expressions)s)",
+            output_field=JSONField(),
+        ),
+        modified_at=timezone.now(),
+    )
+
+
+def touch_custom_field_data(custom_field):
+    """
+    Mark the patients that have a value of ``custom_field`` as modified, as
+    their representation shows its name.
+    """
+    Patient.objects.filter(
+        provider_id=custom_field.provider_id,
+        custom_field_data__has_key=str(custom_field.pk),
+    ).update(modified_at=timezone.now())
+
+
+def custom_field_value(custom_field):
+    """
+    Expression for the patient's value of ``custom_field`` in the projection,
+    as numeric for number fields and as text otherwise.
+
+    JSON key transforms treat numeric keys as array indexes, hence ``->>``
+    with an explicit text key.
+    """
+    value = Func(
+        F("custom_field_data"),
+        Cast(Value(str(custom_field.pk)), TextField()),
+        arg_joiner=" ->> ",
+        template="(%(expressions)s)",
+        output_field=TextField(),
+    )
+    if custom_field.field_type == CustomFieldType.NUMBER:
+        return Cast(value, DecimalField(max_digits=15, decimal_places=2))
+    return value
+
+
+def rebuild_custom_field_data(
+    provider_ids=None, batch_size=REBUILD_BATCH_SIZE, progress=None
+):
+    """
+    Regenerate the projection of all patients, or of the given providers'
+    patients, in primary key batches of ``batch_size``, each in its own
+    transaction. Only patients whose projection differs are written. Returns
+    the number of patients checked and the number that changed.
+    """
+    patients = Patient.objects.order_by("id")
+    if provider_ids:
+        patients = patients.filter(provider_id__in=provider_ids)
+
+    checked = changed = 0
+    last_id = 0
+    while True:
+        ids = list(
+            patients.filter(id__gt=last_id).values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            changed += refresh_custom_field_data(ids)
+        checked += len(ids)
+        last_id = ids[-1]
+        if progress is not None:
+            progress(checked, changed)
+    return checked, changed
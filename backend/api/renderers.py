@@ -0,0 +1,121 @@
+import csv
+import json
+from abc import ABCMeta, abstractmethod
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class Echo:
+    """
+    File-like object whose ``write`` returns what it was given, so csv.writer
+    output can be yielded instead of buffered.
+    """
+
+    def write(self, value):
+        return value
+
+
+class StreamingRenderer(BaseRenderer, metaclass=ABCMeta):
+    """
+    Renders a list of flat rows. ``stream`` yields the output in batches of
+    rows for a StreamingHttpResponse, and ``astream`` does the same for an
+    asynchronous iterable of rows; ``render`` is used for regular responses,
+    such as errors.
+    """
+
+    charset = "utf-8"
+    batch_size = 500
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        columns = list(rows[0]) if rows else []
+        return "".join(self.stream(columns, rows)).encode(self.charset)
+
+    def stream(self, columns, rows):
+        batch = [self.render_header(columns)]
+        for row in rows:
+            batch.append(self.render_row(columns, row))
+            if len(batch) >= self.batch_size:
+                yield "".join(batch)
+                batch = []
+        if batch:
+            yield "".join(batch)
+
+    async def astream(self, columns, rows):
+        batch = [self.render_header(columns)]
+        async for row in rows:
+            batch.append(self.render_row(columns, row))
+            if len(batch) >= self.batch_size:
+                yield "".join(batch)
+                batch = []
+        if batch:
+            yield "".join(batch)
+
+    def render_header(self, columns):
+        return ""
+
+    @abstractmethod
+    def render_row(self, columns, row):
+        """
+        The output of one row, with its values in ``columns`` order.
+        """
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def __init__(self):
+        self.writer = csv.writer(Echo())
+
+    def render_header(self, columns):
+        return self.writer.writerow(columns)
+
+    def render_row(self, columns, row):
+        return self.writer.writerow([row.get(column) for column in columns])
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render_row(self, columns, row):
+        return json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + "\n"
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson, producing the same bytes several
+    times faster. Values orjson does not handle the same way, such as dates
+    and times, go through the DRF encoder. Indented and non-compact output,
+    and data orjson rejects, are rendered by JSONRenderer.
+    """
+
+    options = (
+        orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default, option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like JSONRenderer, so the output is a strict JavaScript subset.
+        return ret.replace("\u2028".encode(), b"\\u2028").replace(
+            "\u2029".encode(), b"\\u2029"
+        )
@@ -0,0 +1,175 @@
+"""
+Routing of provider read traffic to the read replicas in DATABASE_REPLICAS.
+
+Views with ReplicaReadMixin choose a replica for their safe, read-only
+actions, and ReplicaRouter sends the reads made while serving them there.
+Everything else, including authentication, uses the default database.
+
+A provider's requests stay on the primary for DATABASE_REPLICA_STICKINESS
+seconds after it writes, so that it reads its own writes, and replicas
+lagging more than DATABASE_REPLICA_MAX_LAG seconds are skipped. The writes
+are recorded in the patient cache, so that every worker sharing it sees them.
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .cache import patient_cache
+from .metrics import REPLICA_READS
+
+_read_database = ContextVar("read_database", default=None)
+
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+
+class ReplicaRouter:
+    """
+    Reads from the replica chosen for the current request, if any, and
+    migrates the default database only.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaLag:
+    """
+    Replication lag of each replica in seconds, checked at most every
+    DATABASE_REPLICA_CHECK_INTERVAL seconds per process. None for a replica
+    that could not be reached.
+    """
+
+    def __init__(self):
+        self.checked = {}
+        self.lock = threading.Lock()
+
+    def get(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked_at, lag = self.checked.get(alias, (None, None))
+        interval = settings.DATABASE_REPLICA_CHECK_INTERVAL
+        if checked_at is None or now - checked_at >= interval:
+            lag = self.check(alias)
+            with self.lock:
+                self.checked[alias] = (now, lag)
+        return lag
+
+    def check(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            return None
+
+    def clear(self):
+        with self.lock:
+            self.checked.clear()
+
+
+replica_lag = ReplicaLag()
+
+
+def sticky_key(provider_id):
+    return f"replica-sticky:{provider_id}"
+
+
+def record_write(provider_id):
+    """
+    Keep the provider's reads on the primary until its write has reached
+    the replicas.
+    """
+    if settings.DATABASE_REPLICAS:
+        patient_cache().set(
+            sticky_key(provider_id), True, settings.DATABASE_REPLICA_STICKINESS
+        )
+
+
+def choose_read_database(provider_id):
+    """
+    The replica the provider's reads go to, or None for the primary when the
+    provider wrote recently or every replica lags. Each provider reads from
+    the same replica while it is healthy, so that its reads do not go back in
+    time between requests.
+    """
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas:
+        return None
+
+    if patient_cache().get(sticky_key(provider_id)):
+        REPLICA_READS.inc((DEFAULT_DB_ALIAS, "sticky"))
+        return None
+
+    healthy = []
+    for alias in replicas:
+        lag = replica_lag.get(alias)
+        if lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG:
+            healthy.append(alias)
+    if not healthy:
+        REPLICA_READS.inc((DEFAULT_DB_ALIAS, "lag"))
+        return None
+
+    alias = healthy[provider_id % len(healthy)]
+    REPLICA_READS.inc((alias, "replica"))
+    return alias
+
+
+class ReplicaReadMixin:
+    # Serves the safe replica_actions from the replica chosen for the
+    # requesting provider, and records the provider's writes for stickiness.
+    # Filtered querysets are bound to that replica, so that responses
+    # streamed after the view returns read from it too.
+
+    replica_actions = ["list", "retrieve"]
+    read_database = None
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _read_database.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_database.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and self.action in self.replica_actions:
+            self.read_database = choose_read_database(request.user.pk)
+            _read_database.set(self.read_database)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # After the write, so that the whole stickiness period follows it.
+        if request.method not in SAFE_METHODS and request.user.is_authenticated:
+            record_write(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.read_database is not None:
+            queryset = queryset.using(self.read_database)
+        return queryset
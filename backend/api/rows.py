@@ -0,0 +1,193 @@
+"""
+Fast read path for the patient list and detail responses.
+
+``patient_rows`` builds the representation of PatientListSerializer from
+``values()`` rows and the addresses of the whole page, loaded with one
+``values_list()`` query and grouped by patient, without instantiating models,
+serializers or fields per row. PatientListSerializer remains the schema of
+the responses, and api/tests/test_rows.py checks that both render the same
+bytes.
+"""
+
+from rest_framework import serializers
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from .metrics import timed_serialization
+from .models import Patient, PatientAddress
+from .projection import represent_custom_field_data
+from .serializers import PatientListSerializer
+
+PATIENT_ROW_COLUMNS = [
+    "id",
+    "external_id",
+    "first_name",
+    "middle_name",
+    "last_name",
+    "date_of_birth",
+    "status",
+    "created_at",
+]
+
+ADDRESS_ROW_COLUMNS = [
+    "patient_id",
+    "id",
+    "address_type",
+    "street_address",
+    "city",
+    "state",
+    "postal_code",
+    "is_primary",
+]
+
+date_field = serializers.DateField()
+datetime_field = serializers.DateTimeField()
+
+
+def patient_row_columns(selected=None):
+    """
+    The patient columns that ``patient_rows`` reads for the selected fields.
+    """
+    if selected is None or "custom_field_values" in selected:
+        return [*PATIENT_ROW_COLUMNS, "custom_field_data"]
+    return PATIENT_ROW_COLUMNS
+
+
+def address_rows(patient_ids):
+    """
+    PatientAddressListSerializer representations of the addresses of the
+    given patients, as lists by patient id.
+    """
+    return group_address_rows(address_queryset(patient_ids))
+
+
+async def aaddress_rows(patient_ids):
+    """
+    address_rows() for async views.
+    """
+    return group_address_rows([row async for row in address_queryset(patient_ids)])
+
+
+def address_queryset(patient_ids):
+    return PatientAddress.objects.filter(patient_id__in=patient_ids).values_list(
+        *ADDRESS_ROW_COLUMNS
+    )
+
+
+def group_address_rows(rows):
+    addresses = {}
+    for (
+        patient_id,
+        address_id,
+        address_type,
+        street_address,
+        city,
+        state,
+        postal_code,
+        is_primary,
+    ) in rows:
+        addresses.setdefault(patient_id, []).append(
+            {
+                "id": address_id,
+                "address_type": address_type,
+                "full_address": PatientAddress.format_full_address(
+                    street_address, city, state, postal_code
+                ),
+                "street_address": street_address,
+                "city": city,
+                "state": state,
+                "postal_code": postal_code,
+                "is_primary": is_primary,
+            }
+        )
+    return addresses
+
+
+def selected_row_fields(selected=None):
+    """
+    The PatientListSerializer fields ``patient_rows`` returns, in order.
+    """
+    fields = PatientListSerializer.Meta.fields
+    if selected is None:
+        return fields
+    return [name for name in fields if name in selected]
+
+
+def patient_rows(patients, custom_fields=None, selected=None, addresses=None):
+    """
+    PatientListSerializer representations of ``patients``, dicts with the
+    ``patient_row_columns(selected)``, limited to the ``selected`` field names
+    when given. ``custom_fields`` are the provider's custom fields by id,
+    required when custom field values are selected. ``addresses`` are loaded
+    with address_rows() when selected and not given.
+    """
+    fields = selected_row_fields(selected)
+    with_addresses = "addresses" in fields
+    with_custom_field_values = "custom_field_values" in fields
+    if with_addresses and addresses is None:
+        addresses = address_rows([patient["id"] for patient in patients])
+
+    with timed_serialization():
+        rows = []
+        for patient in patients:
+            row = {
+                "id": patient["id"],
+                "external_id": patient["external_id"],
+                "full_name": Patient.format_full_name(
+                    patient["first_name"], patient["middle_name"], patient["last_name"]
+                ),
+                "first_name": patient["first_name"],
+                "middle_name": patient["middle_name"],
+                "last_name": patient["last_name"],
+                "date_of_birth": date_field.to_representation(patient["date_of_birth"]),
+                "status": patient["status"],
+                "created_at": datetime_field.to_representation(patient["created_at"]),
+            }
+            if with_addresses:
+                row["addresses"] = addresses.get(patient["id"], [])
+            if with_custom_field_values:
+                row["custom_field_values"] = represent_custom_field_data(
+                    patient["custom_field_data"], custom_fields
+                )
+            if selected is not None:
+                row = {name: row[name] for name in fields}
+            rows.append(row)
+        return rows
+
+
+class PatientRowsMixin:
+    # Serves list and retrieve with patient_rows() instead of the serializer.
+    # Expects SparseFieldsetMixin for the field selection.
+
+    def list(self, request, *args, **kwargs):
+        selected = self.get_selected_fields()
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.values(*patient_row_columns(selected)))
+        return self.get_paginated_response(self.get_rows(page, selected))
+
+    def retrieve(self, request, *args, **kwargs):
+        selected = self.get_selected_fields()
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        patient = get_object_or_404(
+            queryset.values(*patient_row_columns(selected)),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        self.check_object_permissions(request, patient)
+        return Response(self.get_rows([patient], selected)[0])
+
+    def get_rows(self, patients, selected):
+        custom_fields = None
+        if self.is_field_selected("custom_field_values"):
+            custom_fields = self.get_custom_fields()
+        return patient_rows(patients, custom_fields, selected)
+
+
+async def apatient_rows(patients, custom_fields=None, selected=None):
+    """
+    patient_rows() for async views, loading the addresses with the async ORM.
+    """
+    addresses = None
+    if "addresses" in selected_row_fields(selected):
+        addresses = await aaddress_rows([patient["id"] for patient in patients])
+    return patient_rows(patients, custom_fields, selected, addresses)
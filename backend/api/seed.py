@@ -0,0 +1,316 @@
+import json
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import UTC, date, datetime, timedelta
+from functools import cache
+from itertools import accumulate
+
+import faker
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+
+from .cache import invalidate_patient_cache
+from .models import (
+    AddressType,
+    CustomField,
+    CustomFieldDataEncoder,
+    CustomFieldType,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+    StateChoices,
+)
+from .projection import project_custom_field_values
+from .stats import address_stats, patient_stats, record_patient_stats
+
+User = get_user_model()
+
+SEED_CHUNK_SIZE = 5000
+
+# Size of the pools names and addresses are drawn from. Faker is too slow to
+# call for every row at millions of rows.
+SEED_POOL_SIZE = 1000
+
+# Relative frequency of the number of addresses per patient.
+SEED_ADDRESS_WEIGHTS = {0: 1, 1: 16, 2: 3}
+
+SEED_CUSTOM_FIELDS = [
+    ("Referred By", CustomFieldType.TEXT),
+    ("Number of Visits", CustomFieldType.NUMBER),
+]
+
+# Patients are created over the three years before this time, rather than
+# before now, so that the data does not depend on when it is seeded.
+SEED_AS_OF = datetime(2025, 1, 1, tzinfo=UTC)
+
+
+@dataclass(frozen=True)
+class SeedOptions:
+    seed: int
+    status_weights: dict
+    address_weights: dict
+    as_of: datetime = SEED_AS_OF
+
+
+@dataclass(frozen=True)
+class SeedChunk:
+    provider_index: int
+    provider_id: int
+    custom_fields: tuple
+    start: int
+    count: int
+
+
+def seed_provider(index, custom_field_count, password, username=None):
+    """
+    Get or create the provider ``index`` and its first ``custom_field_count``
+    custom fields.
+    """
+    provider, created = User.objects.get_or_create(
+        username=username or f"provider{index}@example.com"
+    )
+    if created:
+        provider.set_password(password)
+        provider.save(update_fields=["password"])
+
+    custom_fields = []
+    for number in range(custom_field_count):
+        if number < len(SEED_CUSTOM_FIELDS):
+            name, field_type = SEED_CUSTOM_FIELDS[number]
+        else:
+            name = f"Custom Field {number + 1}"
+            field_type = list(CustomFieldType)[number % len(CustomFieldType)]
+        custom_field, _created = CustomField.objects.get_or_create(
+            provider=provider, name=name, defaults={"field_type": field_type}
+        )
+        custom_fields.append((custom_field.pk, custom_field.field_type))
+    return provider, tuple(custom_fields)
+
+
+def seed_chunks(provider_index, provider_id, custom_fields, patients, chunk_size):
+    for start in range(0, patients, chunk_size):
+        yield SeedChunk(
+            provider_index,
+            provider_id,
+            custom_fields,
+            start,
+            min(chunk_size, patients - start),
+        )
+
+
+@cache
+def seed_pools(seed):
+    fake = faker.Faker()
+    fake.seed_instance(seed)
+    return {
+        "first_name": [fake.first_name() for _ in range(SEED_POOL_SIZE)],
+        "last_name": [fake.last_name() for _ in range(SEED_POOL_SIZE)],
+        "street_address": [fake.street_address() for _ in range(SEED_POOL_SIZE)],
+        "city": [fake.city() for _ in range(SEED_POOL_SIZE)],
+        "postal_code": [fake.postcode() for _ in range(SEED_POOL_SIZE)],
+    }
+
+
+def generate_chunk(chunk, options):
+    """
+    Generate the rows of a chunk. The random state only depends on the seed,
+    the provider and the chunk, so the data does not depend on how chunks are
+    spread over workers.
+    """
+    rng = random.Random(f"{options.seed}:{chunk.provider_index}:{chunk.start}")
+    pools = seed_pools(options.seed)
+
+    statuses = rng.choices(
+        list(options.status_weights),
+        cum_weights=list(accumulate(options.status_weights.values())),
+        k=chunk.count,
+    )
+    address_counts = rng.choices(
+        list(options.address_weights),
+        cum_weights=list(accumulate(options.address_weights.values())),
+        k=chunk.count,
+    )
+
+    patients = []
+    for offset in range(chunk.count):
+        first_name = rng.choice(pools["first_name"])
+        last_name = rng.choice(pools["last_name"])
+        created_at = options.as_of - timedelta(
+            seconds=rng.randrange(3 * 365 * 24 * 3600)
+        )
+        patient = {
+            "external_id": f"seed-{chunk.provider_index}-{chunk.start + offset}",
+            "first_name": first_name,
+            "middle_name": rng.choice(pools["first_name"])
+            if rng.random() < 0.5
+            else None,
+            "last_name": last_name,
+            "date_of_birth": date(1930, 1, 1) + timedelta(days=rng.randrange(75 * 365)),
+            "status": statuses[offset],
+            "created_at": created_at,
+            "addresses": [
+                (
+                    AddressType.HOME if number == 0 else AddressType.WORK,
+                    rng.choice(pools["street_address"]),
+                    rng.choice(pools["city"]),
+                    rng.choice(StateChoices.values),
+                    rng.choice(pools["postal_code"]),
+                    number == 0,
+                )
+                for number in range(address_counts[offset])
+            ],
+            "custom_field_values": [
+                (custom_field_id, f"Dr. {rng.choice(pools['last_name'])}", None)
+                if field_type == CustomFieldType.TEXT
+                else (custom_field_id, None, rng.randint(0, 100))
+                for custom_field_id, field_type in chunk.custom_fields
+            ],
+        }
+        patients.append(patient)
+    return patients
+
+
+def seed_chunk(chunk, options):
+    """
+    Generate and COPY one chunk of patients with their addresses and custom
+    field values in one transaction. Patients that already exist are left out,
+    so seeding can be re-run. Returns the number of patients created.
+    """
+    patients = generate_chunk(chunk, options)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = set(
+            Patient.objects.filter(
+                provider_id=chunk.provider_id,
+                external_id__in=[patient["external_id"] for patient in patients],
+            ).values_list("external_id", flat=True)
+        )
+        patients = [
+            patient for patient in patients if patient["external_id"] not in existing
+        ]
+        if not patients:
+            return 0
+
+        # Reserve primary keys up front so that all three tables can be COPYed.
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [Patient._meta.db_table, len(patients)],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+        with cursor.copy(
+            f"COPY {Patient._meta.db_table} (id, provider_id, external_id, first_name, "
+            "middle_name, last_name, date_of_birth, status, custom_field_data, "
+            "created_at, modified_at) FROM STDIN"
+        ) as copy:
+            for patient_id, patient in zip(ids, patients, strict=True):
+                copy.write_row(
+                    (
+                        patient_id,
+                        chunk.provider_id,
+                        patient["external_id"],
+                        patient["first_name"],
+                        patient["middle_name"],
+                        patient["last_name"],
+                        patient["date_of_birth"],
+                        patient["status"],
+                        seed_custom_field_data(patient["custom_field_values"]),
+                        patient["created_at"],
+                        patient["created_at"],
+                    )
+                )
+        with cursor.copy(
+            f"COPY {PatientAddress._meta.db_table} (patient_id, address_type, "
+            "street_address, city, state, postal_code, is_primary, created_at, "
+            "modified_at) FROM STDIN"
+        ) as copy:
+            for patient_id, patient in zip(ids, patients, strict=True):
+                for address in patient["addresses"]:
+                    copy.write_row(
+                        (
+                            patient_id,
+                            *address,
+                            patient["created_at"],
+                            patient["created_at"],
+                        )
+                    )
+        with cursor.copy(
+            f"COPY {PatientCustomFieldValue._meta.db_table} (patient_id, "
+            "custom_field_id, text_value, number_value, created_at, modified_at) "
+            "FROM STDIN"
+        ) as copy:
+            for patient_id, patient in zip(ids, patients, strict=True):
+                for value in patient["custom_field_values"]:
+                    copy.write_row(
+                        (
+                            patient_id,
+                            *value,
+                            patient["created_at"],
+                            patient["created_at"],
+                        )
+                    )
+
+        stats = Counter()
+        for patient in patients:
+            stats.update(
+                patient_stats(
+                    chunk.provider_id, patient["status"], patient["created_at"]
+                )
+            )
+            stats.update(
+                address_stats(
+                    chunk.provider_id,
+                    [
+                        (is_primary, state)
+                        for _type, _street, _city, state, _code, is_primary in patient[
+                            "addresses"
+                        ]
+                    ],
+                )
+            )
+        record_patient_stats(stats)
+        invalidate_patient_cache(provider_ids=[chunk.provider_id])
+
+    return len(patients)
+
+
+def seed_custom_field_data(custom_field_values):
+    data = project_custom_field_values(
+        {
+            "custom_field": custom_field_id,
+            "text_value": text_value,
+            "number_value": number_value,
+        }
+        for custom_field_id, text_value, number_value in custom_field_values
+    )
+    return json.dumps(data, cls=CustomFieldDataEncoder)
+
+
+def init_seed_worker():
+    import django
+
+    django.setup()
+
+
+def run_seed_chunks(chunks, options, workers):
+    """
+    Seed ``chunks`` over a pool of ``workers`` processes, or in this process
+    if ``workers`` is 1, and yield the number of patients created per chunk
+    as chunks complete.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield seed_chunk(chunk, options)
+        return
+
+    # Workers open their own database connections, and connection pools, as
+    # the pool threads and connections of this process do not survive a fork.
+    connections.close_all()
+    for conn in connections.all(initialized_only=True):
+        conn.close_pool()
+    with ProcessPoolExecutor(workers, initializer=init_seed_worker) as executor:
+        futures = [executor.submit(seed_chunk, chunk, options) for chunk in chunks]
+        for future in as_completed(futures):
+            yield future.result()
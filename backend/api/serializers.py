@@ -2,10 +2,26 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import exceptions, serializers
 
-from .models import Patient, PatientAddress, PatientCustomFieldValue, CustomField
+from .cache import custom_field_cache
+from .changes import CHANGES_MAX_PAGE_SIZE, CHANGES_PAGE_SIZE, decode_change_cursor
+from .fieldsets import SparseFieldsetSerializerMixin
+from .metrics import TimedSerializerMixin
+from .models import (
+    CustomField,
+    CustomFieldType,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+    PatientStatus,
+)
+from .mutations import OPERATIONS, SET_CUSTOM_FIELD_VALUE, SET_STATUS
+from .projection import project_custom_field_values, represent_custom_field_data
+from .stats import STATS_MAX_WEEKS, STATS_WEEKS, address_stats, record_patient_stats
 
 User = get_user_model()
 
@@ -67,6 +83,11 @@ class UserChangePasswordSerializer(serializers.ModelSerializer):
             )
         return super().validate(attrs)
 
+    def update(self, instance, validated_data):
+        instance.set_password(validated_data["password_new"])
+        instance.save()
+        return instance
+
 
 class UserChangePasswordErrorSerializer(serializers.Serializer):
     password = serializers.ListSerializer(child=serializers.CharField(), required=False)
@@ -120,103 +141,578 @@ class UserCreateErrorSerializer(serializers.Serializer):
         child=serializers.CharField(), required=False
     )
 
-    
-class PatientCustomFieldSerializer(serializers.ModelSerializer):
+
+class PatientCustomFieldSerializer(
+    SparseFieldsetSerializerMixin, TimedSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = CustomField
-        fields = ['id', 'name', 'field_type', 'description']
+        fields = ["id", "name", "field_type", "description"]
 
-class PatientCustomFieldCreateSerializer(serializers.ModelSerializer):
+
+class PatientCustomFieldCreateSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = CustomField
-        fields = ['name', 'field_type', 'description']
+        fields = ["name", "field_type", "description"]
+
 
 class PatientAddressListSerializer(serializers.ModelSerializer):
     class Meta:
         model = PatientAddress
-        fields = ['address_type', 'full_address', 'street_address', 'city', 'state', 'postal_code', 'is_primary']
+        fields = [
+            "id",
+            "address_type",
+            "full_address",
+            "street_address",
+            "city",
+            "state",
+            "postal_code",
+            "is_primary",
+        ]
+
 
 class PatientAddressCreateSerializer(serializers.ModelSerializer):
+    """
+    Addresses sent with an ``id`` update that address of the patient. Addresses
+    without one reuse the patient's remaining addresses in order before new
+    rows are inserted.
+    """
+
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = PatientAddress
-        fields = ['address_type', 'street_address', 'city', 'state', 'postal_code', 'is_primary']
+        fields = [
+            "id",
+            "address_type",
+            "street_address",
+            "city",
+            "state",
+            "postal_code",
+            "is_primary",
+        ]
+
+
+class CustomFieldValueTypeMixin:
+    """
+    Checks that a custom field value matches the type of its custom field, as
+    PatientCustomFieldValue.clean() does for single saves.
+    """
+
+    value_type_error_messages = {
+        "text_required": _("Text value is required for text custom fields."),
+        "number_not_allowed": _("Number value should be null for text custom fields."),
+        "number_required": _("Number value is required for number custom fields."),
+        "text_not_allowed": _("Text value should be null for number custom fields."),
+    }
+
+    def validate_value_type(self, custom_field, attrs):
+        text_value = attrs.get("text_value")
+        number_value = attrs.get("number_value")
+        error = None
+        if custom_field.field_type == CustomFieldType.TEXT:
+            if not text_value:
+                error = "text_required"
+            elif number_value is not None:
+                error = "number_not_allowed"
+        elif custom_field.field_type == CustomFieldType.NUMBER:
+            if number_value is None:
+                error = "number_required"
+            elif text_value:
+                error = "text_not_allowed"
+        if error:
+            raise serializers.ValidationError(self.value_type_error_messages[error])
+
+
+class ProviderCustomFieldRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Only accepts custom fields of the requesting provider. They are looked up
+    in custom_field_cache instead of the database.
+    """
+
+    def get_queryset(self):
+        request = self.context.get("request", None)
+        return CustomField.objects.filter(provider=request.user)
+
+    def to_internal_value(self, data):
+        custom_fields = self.context.get("custom_fields")
+        if custom_fields is None:
+            custom_fields = custom_field_cache.for_provider(
+                self.context["request"].user.pk
+            )
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            custom_field = custom_fields.get(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if custom_field is None:
+            self.fail("does_not_exist", pk_value=data)
+        return custom_field
+
+
+class PatientCustomFieldValueCreateSerializer(
+    CustomFieldValueTypeMixin, serializers.ModelSerializer
+):
+    custom_field = ProviderCustomFieldRelatedField()
 
-class PatientCustomFieldValueCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = PatientCustomFieldValue
-        fields = ['custom_field', 'text_value', 'number_value']
+        fields = ["custom_field", "text_value", "number_value"]
+        # Uniqueness per patient is checked by PatientCreateSerializer.
+        validators = []
+
+    def validate(self, attrs):
+        self.validate_value_type(attrs["custom_field"], attrs)
+        return attrs
+
 
 class PatientCustomFieldValueListSerializer(serializers.ModelSerializer):
     """
     Simplified serializer for displaying custom field values in list view.
     """
-    custom_field = serializers.CharField(source='custom_field.name')
+
+    custom_field = serializers.CharField(source="custom_field.name")
 
     class Meta:
         model = PatientCustomFieldValue
-        fields = ['custom_field', 'value']
+        fields = ["custom_field", "value"]
+
+    def to_representation(self, instance):
+        # Use the provider's cached custom fields when the view passes them.
+        custom_fields = self.context.get("custom_fields")
+        if custom_fields is None:
+            return super().to_representation(instance)
 
-class PatientListSerializer(serializers.ModelSerializer):
+        custom_field = custom_fields[instance.custom_field_id]
+        return {
+            "custom_field": custom_field.name,
+            "value": instance.number_value
+            if custom_field.field_type == CustomFieldType.NUMBER
+            else instance.text_value,
+        }
+
+
+@extend_schema_field(PatientCustomFieldValueListSerializer(many=True))
+class ProjectedCustomFieldValuesField(serializers.Field):
+    """
+    Custom field values of a patient in the shape of
+    PatientCustomFieldValueListSerializer, read from the custom_field_data
+    projection instead of the custom field value table.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, patient):
+        custom_fields = self.context.get("custom_fields")
+        if custom_fields is None:
+            custom_fields = custom_field_cache.for_provider(patient.provider_id)
+
+        return represent_custom_field_data(patient.custom_field_data, custom_fields)
+
+
+class PatientListSerializer(
+    SparseFieldsetSerializerMixin, TimedSerializerMixin, serializers.ModelSerializer
+):
     """
     Serializer for listing patients in a table view with simplified address display.
     """
+
     addresses = PatientAddressListSerializer(many=True)
-    custom_field_values = PatientCustomFieldValueListSerializer(many=True)
+    custom_field_values = ProjectedCustomFieldValuesField()
 
     class Meta:
         model = Patient
-        fields = ['id', 'full_name', 'first_name', 'middle_name', 'last_name', 'date_of_birth', 'status', 'created_at', 'addresses', 'custom_field_values']
+        fields = [
+            "id",
+            "external_id",
+            "full_name",
+            "first_name",
+            "middle_name",
+            "last_name",
+            "date_of_birth",
+            "status",
+            "created_at",
+            "addresses",
+            "custom_field_values",
+        ]
+        expandable_fields = ["addresses", "custom_field_values"]
+
 
-class PatientCreateSerializer(serializers.ModelSerializer):
+class PatientCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for creating/updating patients with detailed address fields.
     """
+
     addresses = PatientAddressCreateSerializer(many=True)
-    custom_field_values = PatientCustomFieldValueCreateSerializer(many=True, required=False)
+    custom_field_values = PatientCustomFieldValueCreateSerializer(
+        many=True, required=False
+    )
 
     class Meta:
         model = Patient
         fields = [
-            'first_name', 
-            'middle_name',
-            'last_name', 
-            'date_of_birth', 
-            'status',
-            'addresses',
-            'custom_field_values'
+            "external_id",
+            "first_name",
+            "middle_name",
+            "last_name",
+            "date_of_birth",
+            "status",
+            "addresses",
+            "custom_field_values",
         ]
 
+    default_error_messages = {
+        "external_id_exists": _("A patient with this external id already exists."),
+    }
+
+    def validate_external_id(self, value):
+        if not value:
+            return None
+
+        request = self.context.get("request", None)
+        patients = Patient.objects.filter(provider=request.user, external_id=value)
+        if self.instance is not None:
+            patients = patients.exclude(pk=self.instance.pk)
+        if patients.exists():
+            self.fail("external_id_exists")
+        return value
+
+    def validate_addresses(self, value):
+        ids = [address["id"] for address in value if "id" in address]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(_("Duplicate address id."))
+        if ids:
+            owned = set()
+            if self.instance is not None:
+                owned = set(
+                    self.instance.addresses.filter(pk__in=ids).values_list(
+                        "pk", flat=True
+                    )
+                )
+            if set(ids) - owned:
+                raise serializers.ValidationError(
+                    _("Address ids must refer to addresses of this patient.")
+                )
+        return value
+
+    def validate_custom_field_values(self, value):
+        custom_fields = [field_value["custom_field"] for field_value in value]
+        if len(custom_fields) != len(set(custom_fields)):
+            raise serializers.ValidationError(_("Duplicate custom field."))
+        return value
+
     def create(self, validated_data):
-        addresses_data = validated_data.pop('addresses')
-        custom_field_values_data = validated_data.pop('custom_field_values', [])
-        
-        patient = Patient.objects.create(**validated_data)
-        
-        for address_data in addresses_data:
-            PatientAddress.objects.create(patient=patient, **address_data)
-            
-        for field_value_data in custom_field_values_data:
-            PatientCustomFieldValue.objects.create(patient=patient, **field_value_data)
-            
+        addresses_data = validated_data.pop("addresses")
+        custom_field_values_data = validated_data.pop("custom_field_values", [])
+
+        with transaction.atomic():
+            patient = Patient.objects.create(
+                **validated_data,
+                custom_field_data=project_custom_field_values(custom_field_values_data),
+            )
+            addresses = PatientAddress.objects.bulk_create(
+                PatientAddress(patient=patient, **address_data)
+                for address_data in addresses_data
+            )
+            record_patient_stats(address_stats(patient.provider_id, addresses))
+            PatientCustomFieldValue.objects.bulk_create(
+                PatientCustomFieldValue(patient=patient, **field_value_data)
+                for field_value_data in custom_field_values_data
+            )
+
         return patient
 
     def update(self, instance, validated_data):
-        addresses_data = validated_data.pop('addresses', [])
-        custom_field_values_data = validated_data.pop('custom_field_values', [])
-        
-        # Update patient fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # Update addresses
-        instance.addresses.all().delete()  # Remove existing addresses
+        # Nested collections left out of a PATCH are not touched.
+        addresses_data = validated_data.pop("addresses", None)
+        custom_field_values_data = validated_data.pop("custom_field_values", None)
+        if not self.partial and custom_field_values_data is None:
+            custom_field_values_data = []
+
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            if custom_field_values_data is not None:
+                instance.custom_field_data = project_custom_field_values(
+                    custom_field_values_data
+                )
+            instance.save()
+
+            if addresses_data is not None:
+                self.sync_addresses(instance, addresses_data)
+            if custom_field_values_data is not None:
+                self.sync_custom_field_values(instance, custom_field_values_data)
+
+        return instance
+
+    def sync_addresses(self, instance, addresses_data):
+        existing = {
+            address.pk: address
+            for address in PatientAddress.objects.filter(patient=instance).order_by(
+                "pk"
+            )
+        }
+        stats = address_stats(instance.provider_id, existing.values(), -1)
+        matched = []
+        unmatched = []
         for address_data in addresses_data:
-            PatientAddress.objects.create(patient=instance, **address_data)
-            
-        # Update custom field values
-        instance.custom_field_values.all().delete()  # Remove existing values
+            address_data = dict(address_data)
+            pk = address_data.pop("id", None)
+            if pk is None:
+                unmatched.append(address_data)
+            else:
+                matched.append((existing.pop(pk), address_data))
+
+        remaining = list(existing.values())
+        created = []
+        for address_data in unmatched:
+            if remaining:
+                matched.append((remaining.pop(0), address_data))
+            else:
+                created.append(PatientAddress(patient=instance, **address_data))
+
+        write_child_changes(PatientAddress, matched, created, remaining)
+        stats.update(
+            address_stats(
+                instance.provider_id, [obj for obj, _data in matched] + created
+            )
+        )
+        record_patient_stats(stats)
+
+    def sync_custom_field_values(self, instance, custom_field_values_data):
+        existing = {
+            field_value.custom_field_id: field_value
+            for field_value in PatientCustomFieldValue.objects.filter(patient=instance)
+        }
+        matched = []
+        created = []
         for field_value_data in custom_field_values_data:
-            PatientCustomFieldValue.objects.create(patient=instance, **field_value_data)
-            
-        return instance
+            field_value = existing.pop(field_value_data["custom_field"].pk, None)
+            if field_value is None:
+                created.append(
+                    PatientCustomFieldValue(patient=instance, **field_value_data)
+                )
+            else:
+                # Matched on the custom field, so only the values can differ.
+                field_value_data = dict(field_value_data)
+                field_value_data.pop("custom_field")
+                matched.append((field_value, field_value_data))
+
+        write_child_changes(
+            PatientCustomFieldValue, matched, created, list(existing.values())
+        )
+
+
+def write_child_changes(model, matched, created, deleted):
+    """
+    Apply a diff of child rows with at most one DELETE, one UPDATE and one
+    INSERT. Matched rows are only written when one of their fields changed.
+    """
+    fields = set()
+    updated = []
+    for obj, data in matched:
+        changed = [name for name, value in data.items() if getattr(obj, name) != value]
+        if changed:
+            for name in changed:
+                setattr(obj, name, data[name])
+            obj.modified_at = timezone.now()
+            fields.update(changed)
+            updated.append(obj)
+
+    if deleted:
+        model.objects.filter(pk__in=[obj.pk for obj in deleted]).delete()
+    if updated:
+        model.objects.bulk_update(updated, [*fields, "modified_at"])
+    if created:
+        model.objects.bulk_create(created)
+
+
+class PatientBulkCustomFieldValueSerializer(
+    CustomFieldValueTypeMixin, serializers.Serializer
+):
+    """
+    Custom field value of a bulk row. The custom field is resolved against the
+    provider's fields passed in the ``custom_fields`` context, so validating a
+    batch does not query the database.
+    """
+
+    custom_field = serializers.IntegerField()
+    text_value = serializers.CharField(
+        required=False, allow_null=True, allow_blank=True
+    )
+    number_value = serializers.DecimalField(
+        max_digits=15, decimal_places=2, required=False, allow_null=True
+    )
+
+    default_error_messages = {
+        "custom_field_invalid": _("Invalid custom field."),
+    }
+
+    def validate(self, attrs):
+        custom_field = self.context["custom_fields"].get(attrs["custom_field"])
+        if custom_field is None:
+            raise serializers.ValidationError(
+                {"custom_field": self.error_messages["custom_field_invalid"]}
+            )
+        self.validate_value_type(custom_field, attrs)
+
+        return {
+            "custom_field": custom_field,
+            "text_value": attrs.get("text_value") or None,
+            "number_value": attrs.get("number_value"),
+        }
+
+
+class PatientBulkSerializer(PatientCreateSerializer):
+    """
+    One row of a bulk create/upsert. External ids are checked for the whole
+    batch at once when the rows are written.
+    """
+
+    custom_field_values = PatientBulkCustomFieldValueSerializer(
+        many=True, required=False
+    )
+
+    def validate_external_id(self, value):
+        return value or None
+
+
+class PatientBulkErrorSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    errors = serializers.DictField()
+
+
+class PatientBulkResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    updated = serializers.IntegerField()
+    errors = PatientBulkErrorSerializer(many=True)
+
+
+class PatientMutationSerializer(serializers.Serializer):
+    """
+    One change applied to every patient selected by the list filters in the
+    query string and by ``ids``. Without either, ``all`` has to be set to
+    change every patient.
+    """
+
+    operation = serializers.ChoiceField(choices=OPERATIONS)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        help_text="Limit the change to these patients.",
+    )
+    all = serializers.BooleanField(
+        default=False, help_text="Change every patient when no filter or ids are given."
+    )
+    status = serializers.ChoiceField(
+        choices=PatientStatus.choices,
+        required=False,
+        help_text="The new status, for set_status.",
+    )
+    custom_field_value = PatientBulkCustomFieldValueSerializer(
+        required=False, help_text="The value to set, for set_custom_field_value."
+    )
+    dry_run = serializers.BooleanField(
+        default=False,
+        help_text="Count the patients that would change, without changing them.",
+    )
+
+    operation_fields = {
+        SET_STATUS: "status",
+        SET_CUSTOM_FIELD_VALUE: "custom_field_value",
+    }
+
+    default_error_messages = {
+        "selection_required": _("Select patients with filters or ids, or set all."),
+        "operation_field_required": _("This field is required for {operation}."),
+    }
+
+    def validate(self, attrs):
+        if not (attrs.get("ids") or attrs["all"] or self.context.get("filtered")):
+            raise serializers.ValidationError(
+                {"non_field_errors": [self.error_messages["selection_required"]]}
+            )
+        field_name = self.operation_fields.get(attrs["operation"])
+        if field_name is not None and field_name not in attrs:
+            message = self.error_messages["operation_field_required"]
+            raise serializers.ValidationError(
+                {field_name: [message.format(operation=attrs["operation"])]}
+            )
+        return attrs
+
+
+class PatientMutationResultSerializer(serializers.Serializer):
+    matched = serializers.IntegerField(help_text="Patients selected.")
+    affected = serializers.IntegerField(
+        help_text="Patients changed or deleted, or that would be on a dry run."
+    )
+    dry_run = serializers.BooleanField()
+
+
+class PatientStatsQuerySerializer(serializers.Serializer):
+    weeks = serializers.IntegerField(
+        min_value=1,
+        max_value=STATS_MAX_WEEKS,
+        default=STATS_WEEKS,
+        help_text="Number of weeks covered by new_per_week, including this one.",
+    )
+
+
+class PatientStatsWeekSerializer(serializers.Serializer):
+    week = serializers.DateField(help_text="Monday of the week.")
+    count = serializers.IntegerField()
+
+
+class PatientStatsSerializer(serializers.Serializer):
+    total = serializers.IntegerField()
+    by_status = serializers.DictField(child=serializers.IntegerField())
+    by_state = serializers.DictField(
+        child=serializers.IntegerField(),
+        help_text="Patients by the state of their primary address.",
+    )
+    new_per_week = PatientStatsWeekSerializer(many=True)
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    cursor = serializers.CharField(
+        required=False,
+        help_text="The cursor of the previous response. Without it, every row "
+        "is returned as changed.",
+    )
+    page_size = serializers.IntegerField(
+        min_value=1, max_value=CHANGES_MAX_PAGE_SIZE, default=CHANGES_PAGE_SIZE
+    )
+
+    def validate_cursor(self, value):
+        try:
+            return decode_change_cursor(value)
+        except ValueError as e:
+            raise serializers.ValidationError(_("Invalid cursor.")) from e
+
+
+class ChangesSerializer(serializers.Serializer):
+    deleted = serializers.ListField(
+        child=serializers.IntegerField(), help_text="Ids of the rows deleted."
+    )
+    cursor = serializers.CharField(help_text="The cursor of the next request.")
+    more = serializers.BooleanField(
+        help_text="Whether more changes can be fetched right away with the cursor. "
+        "Changes made in the last seconds may be returned again."
+    )
+
+
+class PatientChangesSerializer(ChangesSerializer):
+    changed = PatientListSerializer(many=True, help_text="Patients created or changed.")
+
+
+class CustomFieldChangesSerializer(ChangesSerializer):
+    changed = PatientCustomFieldSerializer(
+        many=True, help_text="Custom fields created or changed."
+    )
@@ -33,6 +33,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "drf_spectacular",
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ######################################################################
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.metrics.PerformanceMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -105,6 +107,22 @@ TEMPLATES = [
 ######################################################################
 # Database
 ######################################################################
+# Keep connections in a psycopg pool shared by the threads of the process,
+# which also serves the async views, whose requests each run on a thread of
+# their own. Sizes are per process, so Postgres needs max_connections of at
+# least DATABASE_POOL_MAX_SIZE times the number of workers.
+DATABASE_POOL = environ.get("DATABASE_POOL", "") == "1"
+
+# Without a pool, seconds a thread keeps its connection open between
+# requests: 0 closes it after each request, "none" never does. Only for
+# WSGI workers, as the threads of async requests do not outlive them.
+DATABASE_CONN_MAX_AGE = environ.get("DATABASE_CONN_MAX_AGE", "0")
+
+# Check reused and pooled connections before handing them out, so that a
+# connection closed by Postgres or the network is replaced rather than failing
+# the request's first query.
+DATABASE_HEALTH_CHECKS = environ.get("DATABASE_HEALTH_CHECKS", "1") == "1"
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -113,12 +131,65 @@ DATABASES = {
         "NAME": environ.get("POSTGRES_DB", "db"),
         "HOST": environ.get("POSTGRES_HOST", "db"),
         "PORT": environ.get("POSTGRES_PORT", "5432"),
+        "OPTIONS": {
+            # Lower bound of pg_trgm word similarity for the patient name search.
+            "options": "-c pg_trgm.word_similarity_threshold="
+            + environ.get("PATIENT_SEARCH_THRESHOLD", "0.4"),
+        },
+        "CONN_MAX_AGE": None
+        if DATABASE_CONN_MAX_AGE == "none"
+        else int(DATABASE_CONN_MAX_AGE),
+        "CONN_HEALTH_CHECKS": DATABASE_HEALTH_CHECKS,
         "TEST": {
             "NAME": "test",
         },
     }
 }
 
+if DATABASE_POOL:
+    # Connections go back to the pool at the end of each request.
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(environ.get("DATABASE_POOL_MIN_SIZE", "2")),
+        "max_size": int(environ.get("DATABASE_POOL_MAX_SIZE", "10")),
+        # Seconds a request waits for a free connection before failing.
+        "timeout": float(environ.get("DATABASE_POOL_TIMEOUT", "10")),
+        # Seconds after which connections are replaced, and idle connections
+        # above min_size are closed.
+        "max_lifetime": float(environ.get("DATABASE_POOL_MAX_LIFETIME", "1800")),
+        "max_idle": float(environ.get("DATABASE_POOL_MAX_IDLE", "300")),
+    }
+
+# Read replicas of the default database, as comma-separated host or host:port.
+# Safe reads of the patient and custom field endpoints go to them, see
+# api/routers.py. A host may also be the primary itself.
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, environ.get("DATABASE_REPLICA_HOSTS", "").split(",")), 1
+):
+    host, port = address.partition(":")[::2]
+    DATABASE_REPLICAS.append(f"replica{number}")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["api.routers.ReplicaRouter"]
+
+# Seconds of replication lag above which a replica is skipped, and how often
+# the lag of each replica is checked.
+DATABASE_REPLICA_MAX_LAG = float(environ.get("DATABASE_REPLICA_MAX_LAG", "5"))
+DATABASE_REPLICA_CHECK_INTERVAL = float(
+    environ.get("DATABASE_REPLICA_CHECK_INTERVAL", "5")
+)
+
+# Seconds a provider's reads stay on the primary after it writes, so that it
+# reads its own writes. Should exceed DATABASE_REPLICA_MAX_LAG. Writes are
+# recorded in the patient cache, which the workers must share.
+DATABASE_REPLICA_STICKINESS = float(environ.get("DATABASE_REPLICA_STICKINESS", "10"))
+
 ######################################################################
 # Authentication
 ######################################################################
@@ -162,15 +233,104 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 100,
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
 }
 
+######################################################################
+# Caches
+######################################################################
+# Backend of the patient cache, which holds the list responses and the data
+# versions that invalidate them and the in-process caches: "memcached",
+# "file", "locmem" or "dummy" to turn caching off, with its default location.
+# Every worker process must share it, so that a write in one invalidates the
+# others' cached lists and users. The default "locmem" is only shared within
+# a process and suits a single worker, such as runserver and the tests;
+# docker-compose runs memcached, and "manage.py check --deploy" warns while
+# the cache is per process.
+PATIENT_CACHE_BACKENDS = {
+    "memcached": (
+        "django.core.cache.backends.memcached.PyMemcacheCache",
+        "127.0.0.1:11211",
+    ),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", "patients"),
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "patients"),
+    "dummy": ("django.core.cache.backends.dummy.DummyCache", ""),
+}
+
+PATIENT_CACHE_ALIAS = "patients"
+
+PATIENT_CACHE_BACKEND, PATIENT_CACHE_LOCATION = PATIENT_CACHE_BACKENDS[
+    environ.get("PATIENT_CACHE_BACKEND", "locmem")
+]
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    PATIENT_CACHE_ALIAS: {
+        "BACKEND": PATIENT_CACHE_BACKEND,
+        # Directory for "file", host:port for "memcached".
+        "LOCATION": environ.get("PATIENT_CACHE_LOCATION", PATIENT_CACHE_LOCATION),
+        "TIMEOUT": int(environ.get("PATIENT_CACHE_TIMEOUT", "300")),
+    },
+}
+
+# Providers whose custom field definitions are kept in memory per process.
+CUSTOM_FIELD_CACHE_SIZE = int(environ.get("CUSTOM_FIELD_CACHE_SIZE", "1024"))
+
+# Authenticated users kept in memory per process, and for how many seconds.
+# Saving or deleting a user invalidates it in every process sharing the
+# patient cache, and the timeout bounds how long other changes take effect.
+USER_CACHE_SIZE = int(environ.get("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TIMEOUT = float(environ.get("USER_CACHE_TIMEOUT", "60"))
+
+######################################################################
+# Change feeds
+######################################################################
+# Seconds the cursor of the last page of a change feed stays behind the
+# clock, so that rows committed late are not missed. Should exceed the
+# longest write transaction and DATABASE_REPLICA_MAX_LAG.
+CHANGES_SETTLE_SECONDS = float(environ.get("CHANGES_SETTLE_SECONDS", "10"))
+
+# Days deletions are kept for the change feeds. Older cursors are refused,
+# and prune_tombstones deletes older tombstones.
+CHANGES_TOMBSTONE_RETENTION_DAYS = float(
+    environ.get("CHANGES_TOMBSTONE_RETENTION_DAYS", "30")
+)
+
+# Patient change events, see api/events.py: events queued per client before
+# it is told to resync, seconds between keep-alive comments, the reconnection
+# delay suggested to clients, and seconds between attempts to reconnect the
+# listener.
+PATIENT_EVENTS_QUEUE_SIZE = int(environ.get("PATIENT_EVENTS_QUEUE_SIZE", "100"))
+PATIENT_EVENTS_KEEPALIVE_SECONDS = float(
+    environ.get("PATIENT_EVENTS_KEEPALIVE_SECONDS", "15")
+)
+PATIENT_EVENTS_RETRY_SECONDS = float(environ.get("PATIENT_EVENTS_RETRY_SECONDS", "5"))
+PATIENT_EVENTS_RECONNECT_SECONDS = float(
+    environ.get("PATIENT_EVENTS_RECONNECT_SECONDS", "1")
+)
+
+######################################################################
+# Performance metrics
+######################################################################
+# Server-Timing headers and the histograms served at /api/metrics.
+PERFORMANCE_METRICS = environ.get("PERFORMANCE_METRICS", "1") == "1"
+
+# /api/metrics is served to staff users and, when set, to
+# "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = environ.get("METRICS_TOKEN", "")
+
 ######################################################################
 # Unfold
 ######################################################################
@@ -0,0 +1,190 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import (
+    invalidate_custom_field_cache,
+    invalidate_patient_cache,
+    invalidate_user_cache,
+)
+from .models import (
+    CustomField,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+    Tombstone,
+    User,
+)
+from .projection import (
+    refresh_custom_field_data,
+    remove_custom_field_data,
+    touch_custom_field_data,
+)
+from .stats import address_stats, patient_stats, record_patient_stats, status_stats
+
+# Bulk writes do not send these signals. Code that writes patients in bulk
+# calls invalidate_patient_cache(), keeps Patient.custom_field_data in sync,
+# records patient statistics and tombstones, and sets modified_at itself.
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    # Password changes, deactivation and deletion, through any code path
+    # that saves or deletes the user, reach every process sharing the
+    # patient cache. Queryset updates only apply after USER_CACHE_TIMEOUT.
+    invalidate_user_cache(instance.pk)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=CustomField)
+@receiver(post_delete, sender=CustomField)
+def invalidate_provider(sender, instance, **kwargs):
+    invalidate_patient_cache(provider_ids=[instance.provider_id])
+
+
+@receiver(post_save, sender=CustomField)
+@receiver(post_delete, sender=CustomField)
+def invalidate_custom_fields(sender, instance, **kwargs):
+    invalidate_custom_field_cache(instance.provider_id)
+
+
+@receiver(post_save, sender=PatientAddress)
+@receiver(post_delete, sender=PatientAddress)
+@receiver(post_save, sender=PatientCustomFieldValue)
+@receiver(post_delete, sender=PatientCustomFieldValue)
+def invalidate_patient(sender, instance, **kwargs):
+    if sender.patient.is_cached(instance):
+        invalidate_patient_cache(provider_ids=[instance.patient.provider_id])
+    else:
+        invalidate_patient_cache(patient_ids=[instance.patient_id])
+
+
+@receiver(post_save, sender=PatientCustomFieldValue)
+@receiver(post_delete, sender=PatientCustomFieldValue)
+def refresh_projection(sender, instance, signal, origin=None, **kwargs):
+    # Values deleted along with their patient or custom field, or by a
+    # queryset delete, are handled by whatever deleted them.
+    if signal is post_save or origin is instance:
+        refresh_custom_field_data([instance.patient_id])
+
+
+@receiver(post_delete, sender=CustomField)
+def remove_from_projection(sender, instance, **kwargs):
+    remove_custom_field_data(instance)
+
+
+@receiver(post_save, sender=CustomField)
+def touch_renamed_custom_field(sender, instance, created, **kwargs):
+    # Patients show the names of their custom fields.
+    if not created and instance.name != getattr(instance, "_stored_name", None):
+        touch_custom_field_data(instance)
+    instance._stored_name = instance.name
+
+
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=CustomField)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    # Rows deleted along with their provider need none, and queryset deletes
+    # record their own.
+    if origin is instance:
+        Tombstone.objects.create(
+            provider_id=instance.provider_id,
+            object_type=sender._meta.model_name,
+            object_id=instance.pk,
+            deleted_at=timezone.now(),
+        )
+
+
+@receiver(post_save, sender=PatientAddress)
+@receiver(post_delete, sender=PatientAddress)
+def touch_patient(sender, instance, signal, origin=None, **kwargs):
+    # Addresses are part of their patient in the change feed. Addresses
+    # deleted with their patient, or by a queryset delete, are handled by
+    # whatever deleted them.
+    if signal is post_save or origin is instance:
+        Patient.objects.filter(pk=instance.patient_id).update(
+            modified_at=timezone.now()
+        )
+
+
+@receiver(pre_save, sender=Patient)
+def load_stored_status(sender, instance, **kwargs):
+    if instance.pk is not None and getattr(instance, "_stored_status", None) is None:
+        instance._stored_status = (
+            Patient.objects.filter(pk=instance.pk)
+            .values_list("status", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Patient)
+def count_patient(sender, instance, created, **kwargs):
+    if created:
+        stats = patient_stats(
+            instance.provider_id, instance.status, instance.created_at
+        )
+    else:
+        stats = status_stats(instance.provider_id, instance.status)
+        stats.update(status_stats(instance.provider_id, instance._stored_status, -1))
+    record_patient_stats(stats)
+    instance._stored_status = instance.status
+
+
+@receiver(pre_delete, sender=Patient)
+def uncount_patient(sender, instance, origin=None, **kwargs):
+    # Counts of patients deleted along with their provider go with it, and
+    # queryset deletes are recorded by whatever deleted them.
+    if origin is not instance:
+        return
+    stats = patient_stats(
+        instance.provider_id, instance.status, instance.created_at, -1
+    )
+    stats.update(
+        address_stats(
+            instance.provider_id,
+            instance.addresses.values_list("is_primary", "state"),
+            -1,
+        )
+    )
+    record_patient_stats(stats)
+
+
+def address_provider_id(address):
+    if PatientAddress.patient.is_cached(address):
+        return address.patient.provider_id
+    return (
+        Patient.objects.filter(pk=address.patient_id)
+        .values_list("provider_id", flat=True)
+        .first()
+    )
+
+
+@receiver(pre_save, sender=PatientAddress)
+def load_stored_address(sender, instance, **kwargs):
+    instance._stored_address = None
+    if instance.pk is not None:
+        instance._stored_address = (
+            PatientAddress.objects.filter(pk=instance.pk)
+            .values_list("is_primary", "state")
+            .first()
+        )
+
+
+@receiver(post_save, sender=PatientAddress)
+def count_address(sender, instance, **kwargs):
+    provider_id = address_provider_id(instance)
+    stats = address_stats(provider_id, [instance])
+    if instance._stored_address is not None:
+        stats.update(address_stats(provider_id, [instance._stored_address], -1))
+    record_patient_stats(stats)
+
+
+@receiver(post_delete, sender=PatientAddress)
+def uncount_address(sender, instance, origin=None, **kwargs):
+    # Addresses deleted with their patient were uncounted with it.
+    if origin is instance:
+        record_patient_stats(
+            address_stats(address_provider_id(instance), [instance], -1)
+        )
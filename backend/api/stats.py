@@ -0,0 +1,238 @@
+"""
+Per-provider patient counts by status, by primary address state and by week
+created, stored in PatientStatistic and updated incrementally.
+
+Each patient row counts once for its status and once for its week, and each
+primary address once for its state. Writes turn the rows they add, change and
+remove into a ``Counter`` of deltas keyed by ``(provider_id, dimension, key)``
+and apply it with ``record_patient_stats`` in the same transaction. Single
+saves and deletes are recorded by the receivers in api.signals; bulk writes
+record their own deltas.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from .changes import record_tombstones
+from .models import (
+    Patient,
+    PatientAddress,
+    PatientStatistic,
+    PatientStatisticDimension,
+    PatientStatus,
+    StateChoices,
+)
+
+STATS_WEEKS = 12
+STATS_MAX_WEEKS = 104
+
+# Plain strings, as choice members do not hash like their values.
+STATUS = PatientStatisticDimension.STATUS.value
+STATE = PatientStatisticDimension.STATE.value
+WEEK = PatientStatisticDimension.WEEK.value
+
+# Advisory lock on a provider's counts, keyed by the table and the provider.
+# Writers share it and rebuild_patient_stats() takes it exclusively.
+STATS_LOCK_CLASS = f"'{PatientStatistic._meta.db_table}'::regclass::oid::integer"
+
+# Takes the shared locks of the providers in order before adding the deltas.
+RECORD_SQL = f"""
+WITH locks AS (
+    SELECT pg_advisory_xact_lock_shared({STATS_LOCK_CLASS}, provider_id)
+    FROM (SELECT DISTINCT unnest(%s::integer[]) AS provider_id ORDER BY 1) providers
+)
+INSERT INTO {PatientStatistic._meta.db_table} (provider_id, dimension, key, count)
+SELECT * FROM unnest(%s::integer[], %s::text[], %s::text[], %s::integer[])
+WHERE (SELECT count(*) FROM locks) > 0
+ON CONFLICT (provider_id, dimension, key)
+DO UPDATE SET count = {PatientStatistic._meta.db_table}.count + EXCLUDED.count
+"""
+
+
+def week_key(created_at):
+    """
+    Date of the Monday of the week of ``created_at``, in the current time
+    zone like TruncWeek.
+    """
+    day = timezone.localdate(created_at)
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def status_stats(provider_id, status, sign=1):
+    return Counter({(provider_id, STATUS, str(status)): sign})
+
+
+def patient_stats(provider_id, status, created_at, sign=1):
+    stats = status_stats(provider_id, status, sign)
+    stats[(provider_id, WEEK, week_key(created_at))] += sign
+    return stats
+
+
+def address_stats(provider_id, addresses, sign=1):
+    """
+    Counts of ``addresses``, PatientAddress instances or ``(is_primary,
+    state)`` pairs.
+    """
+    stats = Counter()
+    for address in addresses:
+        if isinstance(address, PatientAddress):
+            address = (address.is_primary, address.state)
+        is_primary, state = address
+        if is_primary:
+            stats[(provider_id, STATE, str(state))] += sign
+    return stats
+
+
+def record_patient_stats(stats):
+    """
+    Add a Counter of deltas to the stored counts with a single upsert.
+    """
+    rows = sorted((key, delta) for key, delta in stats.items() if delta)
+    if not rows:
+        return
+    # Sorted so that concurrent writers lock counter rows in the same order.
+    columns = [
+        list(column)
+        for column in zip(*((*key, delta) for key, delta in rows), strict=True)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_SQL, [columns[0], *columns])
+
+
+def count_patient_stats(patients):
+    """
+    Count the statistics of a patient queryset from scratch, as a Counter.
+    """
+    stats = Counter()
+    for row in (
+        patients.order_by().values("provider_id", "status").annotate(count=Count("id"))
+    ):
+        stats[(row["provider_id"], STATUS, row["status"])] = row["count"]
+    for row in (
+        patients.order_by()
+        .annotate(week=TruncWeek("created_at"))
+        .values("provider_id", "week")
+        .annotate(count=Count("id"))
+    ):
+        key = timezone.localdate(row["week"]).isoformat()
+        stats[(row["provider_id"], WEEK, key)] = row["count"]
+    for row in (
+        PatientAddress.objects.filter(patient__in=patients, is_primary=True)
+        .values("patient__provider_id", "state")
+        .annotate(count=Count("id"))
+    ):
+        key = (row["patient__provider_id"], STATE, row["state"])
+        stats[key] = row["count"]
+    return stats
+
+
+def delete_patients(patients):
+    """
+    Delete a patient queryset, uncount it and record tombstones for the change
+    feeds in one transaction. Returns what QuerySet.delete() returns.
+    """
+    with transaction.atomic():
+        stats = count_patient_stats(patients)
+        record_tombstones(patients)
+        deleted = patients.delete()
+        record_patient_stats(Counter({key: -count for key, count in stats.items()}))
+    return deleted
+
+
+def rebuild_patient_stats(provider_id):
+    """
+    Replace the provider's counts with a recount. Returns the keys whose count
+    was wrong, with the difference.
+
+    The provider's counts are locked against writes for the recount. Writers
+    that have already recorded a delta finish before the recount starts, and
+    the others record theirs after it, so no concurrent change is lost or
+    counted twice. Writes of other providers go on.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT pg_advisory_xact_lock({STATS_LOCK_CLASS}, %s)", [provider_id]
+            )
+        stored = Counter(
+            {
+                (provider_id, dimension, key): count
+                for dimension, key, count in PatientStatistic.objects.filter(
+                    provider_id=provider_id
+                ).values_list("dimension", "key", "count")
+            }
+        )
+        counted = count_patient_stats(Patient.objects.filter(provider_id=provider_id))
+
+        PatientStatistic.objects.filter(provider_id=provider_id).delete()
+        PatientStatistic.objects.bulk_create(
+            PatientStatistic(
+                provider_id=provider_id, dimension=dimension, key=key, count=count
+            )
+            for (_provider_id, dimension, key), count in sorted(counted.items())
+            if count
+        )
+
+    return {
+        key: counted[key] - stored[key]
+        for key in stored.keys() | counted.keys()
+        if counted[key] != stored[key]
+    }
+
+
+def get_patient_stats(provider_id, weeks=STATS_WEEKS):
+    """
+    The provider's counts, read with one query. Every status and state is
+    listed, and ``new_per_week`` covers the last ``weeks`` weeks, oldest
+    first, including weeks without new patients.
+    """
+    counters, week_keys = stored_patient_stats(provider_id, weeks)
+    return summarize_patient_stats(counters, week_keys)
+
+
+async def aget_patient_stats(provider_id, weeks=STATS_WEEKS):
+    """
+    get_patient_stats() for async views.
+    """
+    counters, week_keys = stored_patient_stats(provider_id, weeks)
+    return summarize_patient_stats([row async for row in counters], week_keys)
+
+
+def stored_patient_stats(provider_id, weeks):
+    """
+    A queryset of the ``(dimension, key, count)`` counters get_patient_stats
+    reads, and the keys of the weeks it covers.
+    """
+    today = timezone.localdate()
+    this_week = today - timedelta(days=today.weekday())
+    week_keys = [
+        (this_week - timedelta(weeks=number)).isoformat()
+        for number in reversed(range(weeks))
+    ]
+    counters = (
+        PatientStatistic.objects.filter(provider_id=provider_id)
+        .exclude(dimension=WEEK, key__lt=week_keys[0])
+        .values_list("dimension", "key", "count")
+    )
+    return counters, week_keys
+
+
+def summarize_patient_stats(counters, week_keys):
+    counts = {dimension: Counter() for dimension in PatientStatisticDimension.values}
+    for dimension, key, count in counters:
+        counts[dimension][key] = count
+
+    by_status = counts[STATUS]
+    by_state = counts[STATE]
+    by_week = counts[WEEK]
+    return {
+        "total": sum(by_status.values()),
+        "by_status": {status: by_status[status] for status in PatientStatus.values},
+        "by_state": {state: by_state[state] for state in StateChoices.values},
+        "new_per_week": [{"week": week, "count": by_week[week]} for week in week_keys],
+    }
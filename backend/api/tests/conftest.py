@@ -1,6 +1,16 @@
 from pytest_factoryboy import register
 
-from api.tests.factories import UserFactory
+from api.tests.factories import (
+    CustomFieldFactory,
+    PatientAddressFactory,
+    PatientCustomFieldValueFactory,
+    PatientFactory,
+    UserFactory,
+)
 from api.tests.fixtures import *  # noqa: F403
 
 register(UserFactory)
+register(CustomFieldFactory)
+register(PatientFactory)
+register(PatientAddressFactory)
+register(PatientCustomFieldValueFactory)
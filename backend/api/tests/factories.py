@@ -1,6 +1,18 @@
+import factory
 from django.contrib.auth import get_user_model
 from factory.django import DjangoModelFactory
 
+from api.models import (
+    AddressType,
+    CustomField,
+    CustomFieldType,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+    PatientStatus,
+    StateChoices,
+)
+
 
 class UserFactory(DjangoModelFactory):
     username = "sample@example.com"
@@ -8,3 +20,45 @@ class UserFactory(DjangoModelFactory):
 
     class Meta:
         model = get_user_model()
+
+
+class CustomFieldFactory(DjangoModelFactory):
+    provider = factory.SubFactory(UserFactory)
+    name = factory.Sequence(lambda n: f"Field {n}")
+    field_type = CustomFieldType.TEXT
+
+    class Meta:
+        model = CustomField
+
+
+class PatientFactory(DjangoModelFactory):
+    provider = factory.SubFactory(UserFactory)
+    first_name = factory.Sequence(lambda n: f"First{n}")
+    last_name = factory.Sequence(lambda n: f"Last{n}")
+    date_of_birth = "1980-01-01"
+    status = PatientStatus.ACTIVE
+
+    class Meta:
+        model = Patient
+
+
+class PatientAddressFactory(DjangoModelFactory):
+    patient = factory.SubFactory(PatientFactory)
+    address_type = AddressType.HOME
+    street_address = "1 Main St"
+    city = "Springfield"
+    state = StateChoices.CA
+    postal_code = "90001"
+    is_primary = True
+
+    class Meta:
+        model = PatientAddress
+
+
+class PatientCustomFieldValueFactory(DjangoModelFactory):
+    patient = factory.SubFactory(PatientFactory)
+    custom_field = factory.SubFactory(CustomFieldFactory)
+    text_value = "value"
+
+    class Meta:
+        model = PatientCustomFieldValue
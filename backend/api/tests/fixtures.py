@@ -1,6 +1,46 @@
 import pytest
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
+from api.cache import custom_field_cache, user_cache
+from api.models import (
+    AddressType,
+    CustomField,
+    CustomFieldType,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+    PatientStatus,
+    StateChoices,
+)
+from api.projection import refresh_custom_field_data
+from api.stats import count_patient_stats, record_patient_stats
+
+
+@pytest.fixture(autouse=True)
+def clear_caches(settings):
+    # The tests run in one process, which a per-process patient cache serves.
+    settings.CACHES = {
+        **settings.CACHES,
+        settings.PATIENT_CACHE_ALIAS: {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "patients",
+        },
+    }
+    for cache in caches.all():
+        cache.clear()
+    custom_field_cache.clear()
+    user_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def primary_reads(settings):
+    # Replicas only see committed rows, so tests read from the primary even
+    # when DATABASE_REPLICA_HOSTS is set.
+    settings.DATABASE_REPLICAS = []
+
 
 @pytest.fixture
 def api_client():
@@ -10,3 +50,123 @@ def api_client():
 @pytest.fixture
 def regular_user(user_factory):
     return user_factory.create(is_active=False)
+
+
+@pytest.fixture
+def provider(user_factory):
+    return user_factory.create(username="provider@example.com")
+
+
+@pytest.fixture
+def provider_client(api_client, provider):
+    api_client.force_authenticate(user=provider)
+    return api_client
+
+
+@pytest.fixture
+def make_patients(provider):
+    """
+    Bulk-create ``count`` patients for the provider, each with a primary
+    address and one text and one number custom field value.
+    """
+
+    def _make_patients(count, provider=provider):
+        text_field, _ = CustomField.objects.get_or_create(
+            provider=provider,
+            name="Referred By",
+            defaults={"field_type": CustomFieldType.TEXT},
+        )
+        number_field, _ = CustomField.objects.get_or_create(
+            provider=provider,
+            name="Number of Visits",
+            defaults={"field_type": CustomFieldType.NUMBER},
+        )
+        statuses = PatientStatus.values
+        states = StateChoices.values
+
+        patients = Patient.objects.bulk_create(
+            Patient(
+                provider=provider,
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                date_of_birth="1980-01-01",
+                status=statuses[i % len(statuses)],
+            )
+            for i in range(count)
+        )
+        PatientAddress.objects.bulk_create(
+            PatientAddress(
+                patient=patient,
+                address_type=AddressType.HOME,
+                street_address=f"{i} Main St",
+                city="Springfield",
+                state=states[i % len(states)],
+                postal_code="90001",
+                is_primary=True,
+            )
+            for i, patient in enumerate(patients)
+        )
+        PatientCustomFieldValue.objects.bulk_create(
+            value
+            for i, patient in enumerate(patients)
+            for value in (
+                PatientCustomFieldValue(
+                    patient=patient, custom_field=text_field, text_value=f"Dr. {i}"
+                ),
+                PatientCustomFieldValue(
+                    patient=patient, custom_field=number_field, number_value=i
+                ),
+            )
+        )
+        refresh_custom_field_data(patient.pk for patient in patients)
+        record_patient_stats(
+            count_patient_stats(Patient.objects.filter(pk__in=[p.pk for p in patients]))
+        )
+        for patient in patients:
+            patient.refresh_from_db(fields=["custom_field_data"])
+        return patients
+
+    return _make_patients
+
+
+@pytest.fixture
+def explain():
+    """
+    Return the plan for ``sql`` with sequential scans disabled, so that the
+    planner picks an index whenever one matches even on tiny test tables.
+    """
+
+    def _explain(sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    return _explain
+
+
+@pytest.fixture
+def explain_queryset(explain):
+    def _explain_queryset(queryset):
+        return explain(*queryset.query.sql_with_params())
+
+    return _explain_queryset
+
+
+@pytest.fixture
+def patient_page_sql():
+    """
+    The SQL of the patient page query made by a GET of ``url``.
+    """
+
+    def _patient_page_sql(client, url):
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        return next(
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith('SELECT "patients"')
+        )
+
+    return _patient_page_sql
@@ -0,0 +1,106 @@
+import re
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.cache import custom_field_cache
+
+
+@pytest.fixture
+def token(provider):
+    return str(AccessToken.for_user(provider))
+
+
+@pytest.fixture
+def async_get(token):
+    """
+    GET through the ASGI request handler, with the provider's token.
+    """
+
+    def _get(url, data=None, **headers):
+        headers.setdefault("Authorization", f"Bearer {token}")
+        return async_to_sync(AsyncClient().get)(url, data, headers=headers)
+
+    return _get
+
+
+@pytest.fixture
+def sync_get(api_client, token):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+    return api_client.get
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params",
+    [{}, {"fields": "id,full_name", "expand": "addresses"}, {"status": "ACTIVE"}],
+)
+def test_async_patient_endpoints_answer_like_sync(
+    provider, make_patients, async_get, sync_get, params
+):
+    patients = make_patients(6)
+
+    for name, args, query in [
+        ("list", [], params),
+        ("detail", [patients[2].pk], {"fields": params.get("fields", "")}),
+        ("stats", [], {"weeks": 3}),
+    ]:
+        response = async_get(reverse(f"api-async-patients-{name}", args=args), query)
+        expected = sync_get(reverse(f"api-patients-{name}", args=args), query)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/json"
+        assert response.content == expected.content
+
+
+@pytest.mark.django_db
+def test_async_patient_list_pages_and_caches(provider, make_patients, async_get):
+    make_patients(3)
+    url = reverse("api-async-patients-list")
+
+    first = async_get(url, {"page_size": 2})
+    assert first.json()["next"].endswith("/api/async/patients/?page=2&page_size=2")
+    cursor = async_get(url, {"page_size": 2, "pagination": "cursor"})
+    assert [patient["id"] for patient in cursor.json()["results"]] == [
+        patient["id"] for patient in first.json()["results"]
+    ]
+
+    again = async_get(url, {"page_size": 2}, If_None_Match=first["ETag"])
+    assert again.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db
+def test_async_patient_endpoints_errors(
+    provider, make_patients, user_factory, async_get
+):
+    other = make_patients(1, provider=user_factory.create(username="other@example.com"))
+
+    response = async_get(reverse("api-async-patients-list"), Authorization="")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response["WWW-Authenticate"] == 'Bearer realm="api"'
+
+    response = async_get(reverse("api-async-patients-stats"), Authorization="Bearer x")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json()["code"] == "token_not_valid"
+
+    response = async_get(reverse("api-async-patients-detail", args=[other[0].pk]))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = async_get(reverse("api-async-patients-list"), {"status": "NOPE"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "status" in response.json()
+
+
+@pytest.mark.django_db
+def test_async_patient_list_metrics(provider, make_patients, async_get):
+    make_patients(2)
+    custom_field_cache.for_provider(provider.pk)
+
+    response = async_get(reverse("api-async-patients-list"))
+
+    # The user, the count, the page and the addresses.
+    assert re.search(r'db;dur=[\d.]+;desc="4 queries"', response["Server-Timing"])
@@ -0,0 +1,133 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import CachedJWTAuthentication
+from api.cache import UserCache, user_cache
+from api.checks import check_jwt_user_id_field
+
+
+@pytest.fixture
+def jwt_client(api_client, provider):
+    api_client.credentials(
+        HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(provider)}"
+    )
+    return api_client
+
+
+@pytest.mark.django_db
+def test_authentication_reuses_cached_user(
+    provider, jwt_client, django_assert_num_queries
+):
+    url = reverse("api-users-me")
+    with django_assert_num_queries(1):
+        jwt_client.get(url)
+
+    with django_assert_num_queries(0):
+        response = jwt_client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["username"] == provider.username
+    # Each request gets its own copy.
+    assert user_cache.get(provider.pk) is not user_cache.get(provider.pk)
+
+
+@pytest.mark.django_db
+def test_authentication_sees_deactivation(
+    provider, jwt_client, django_capture_on_commit_callbacks
+):
+    url = reverse("api-users-me")
+    assert jwt_client.get(url).status_code == status.HTTP_200_OK
+
+    provider.is_active = False
+    with django_capture_on_commit_callbacks(execute=True):
+        provider.save()
+
+    response = jwt_client.get(url)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.data["code"] == "user_inactive"
+
+
+@pytest.mark.django_db
+def test_authentication_sees_deactivation_in_other_processes(
+    provider, django_capture_on_commit_callbacks
+):
+    # Another worker's in-process cache, sharing the patient cache.
+    other = UserCache(maxsize=10, timeout=60)
+    assert other.get(provider.pk).is_active
+
+    provider.is_active = False
+    with django_capture_on_commit_callbacks(execute=True):
+        provider.save()
+
+    assert not other.get(provider.pk).is_active
+
+
+@pytest.mark.django_db
+def test_authentication_without_patient_cache_queries_users(
+    provider, settings, django_assert_num_queries
+):
+    settings.CACHES = {
+        **settings.CACHES,
+        settings.PATIENT_CACHE_ALIAS: {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+        },
+    }
+
+    user_cache.get(provider.pk)
+    with django_assert_num_queries(1):
+        user_cache.get(provider.pk)
+
+
+@pytest.mark.django_db
+def test_authentication_sees_password_change_and_deletion(
+    provider, jwt_client, django_capture_on_commit_callbacks
+):
+    provider.set_password("Old-passw0rd!")
+    provider.save()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = jwt_client.post(
+            reverse("api-users-change-password"),
+            {
+                "password": "Old-passw0rd!",
+                "password_new": "New-passw0rd!",
+                "password_retype": "New-passw0rd!",
+            },
+        )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert user_cache.get(provider.pk).check_password("New-passw0rd!")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = jwt_client.delete(reverse("api-users-delete-account"))
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = jwt_client.get(reverse("api-users-me"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.data["code"] == "user_not_found"
+
+
+@pytest.mark.django_db
+def test_async_authentication_reuses_cached_user(
+    provider, django_assert_num_queries, rf
+):
+    token = AccessToken.for_user(provider)
+    request = rf.get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+    authenticate = async_to_sync(CachedJWTAuthentication().aauthenticate)
+
+    user, validated_token = authenticate(request)
+    with django_assert_num_queries(0):
+        again, _ = authenticate(request)
+
+    assert user.pk == again.pk == provider.pk
+    assert validated_token["user_id"] == str(provider.pk)
+
+
+def test_authentication_requires_user_id_field(monkeypatch):
+    assert check_jwt_user_id_field(None) == []
+
+    monkeypatch.setattr(api_settings, "USER_ID_FIELD", "username")
+    assert [error.id for error in check_jwt_user_id_field(None)] == ["api.E001"]
@@ -0,0 +1,54 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+
+from api.models import CustomField, Patient
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_api(tmp_path):
+    output = tmp_path / "benchmark.json"
+
+    call_command(
+        "benchmark_api",
+        sizes="30",
+        requests=4,
+        concurrency=2,
+        warmup=1,
+        output=str(output),
+        stdout=io.StringIO(),
+    )
+    call_command(
+        "benchmark_api",
+        sizes="30",
+        requests=4,
+        concurrency=2,
+        warmup=1,
+        output=str(tmp_path / "again.json"),
+        compare=str(output),
+        stdout=io.StringIO(),
+    )
+
+    data = json.loads(output.read_text())
+    assert data["database"] == {"conn_max_age": 0, "pool": None}
+    results = data["results"]
+    assert {result["scenario"] for result in results} >= {
+        "patients_list",
+        "patients_list_async",
+        "patients_stats_async",
+        "patients_list_deep_cursor",
+        "patients_update",
+        "custom_fields_delete",
+    }
+    assert all(result["errors"] == 0 for result in results)
+    assert all(result["requests"] == 4 for result in results)
+    # Queries are counted for sync and async scenarios. Authentication and
+    # cached list responses make none.
+    queries = {result["scenario"]: result["queries_per_request"] for result in results}
+    assert queries["patients_update"] > 0
+    assert queries["patients_stats_async"] > 0
+    # Only the seeded patients are left behind.
+    assert Patient.objects.count() == 30
+    assert CustomField.objects.count() == 2
@@ -0,0 +1,261 @@
+import json
+import threading
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+
+from api import bulk
+from api.models import Patient, PatientAddress, PatientCustomFieldValue
+from api.stats import rebuild_patient_stats
+
+
+def _row(index, **overrides):
+    row = {
+        "first_name": f"First{index}",
+        "last_name": f"Last{index}",
+        "date_of_birth": "1980-01-01",
+        "status": "ACTIVE",
+        "addresses": [
+            {
+                "address_type": "HOME",
+                "street_address": f"{index} Main St",
+                "city": "Springfield",
+                "state": "CA",
+                "postal_code": "90001",
+                "is_primary": True,
+            }
+        ],
+    }
+    row.update(overrides)
+    return row
+
+
+@pytest.fixture
+def number_field(custom_field_factory, provider):
+    return custom_field_factory.create(provider=provider, field_type="NUMBER")
+
+
+@pytest.mark.django_db
+def test_patient_bulk_create_reports_row_errors(
+    provider_client, number_field, custom_field_factory, user_factory
+):
+    other_field = custom_field_factory.create(
+        provider=user_factory.create(username="other@example.com")
+    )
+    rows = [
+        _row(
+            0,
+            custom_field_values=[{"custom_field": number_field.pk, "number_value": 3}],
+        ),
+        _row(1, status="UNKNOWN"),
+        _row(
+            2, custom_field_values=[{"custom_field": other_field.pk, "text_value": "x"}]
+        ),
+        _row(
+            3,
+            custom_field_values=[{"custom_field": number_field.pk, "text_value": "x"}],
+        ),
+        _row(4),
+    ]
+
+    response = provider_client.post(reverse("api-patients-bulk"), rows, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["created"] == 2
+    assert [error["index"] for error in response.data["errors"]] == [1, 2, 3]
+    assert "status" in response.data["errors"][0]["errors"]
+    assert set(Patient.objects.values_list("first_name", flat=True)) == {
+        "First0",
+        "First4",
+    }
+    assert PatientAddress.objects.count() == 2
+    assert PatientCustomFieldValue.objects.get().number_value == 3
+
+
+@pytest.mark.django_db
+def test_patient_bulk_create_accepts_ndjson(provider_client):
+    body = "\n".join(json.dumps(_row(index)) for index in range(3)) + "\n"
+
+    response = provider_client.post(
+        reverse("api-patients-bulk"), body, content_type="application/x-ndjson"
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["created"] == 3
+
+
+@pytest.mark.django_db
+def test_patient_bulk_upsert_updates_existing_patients(provider_client, provider):
+    url = reverse("api-patients-bulk")
+    provider_client.post(
+        url, [_row(0, external_id="A"), _row(1, external_id="B")], format="json"
+    )
+
+    response = provider_client.post(
+        f"{url}?upsert=true",
+        [
+            _row(0, external_id="A", status="CHURNED"),
+            _row(2, external_id="C"),
+        ],
+        format="json",
+    )
+
+    assert response.data == {"created": 1, "updated": 1, "errors": []}
+    assert Patient.objects.filter(provider=provider).count() == 3
+    assert Patient.objects.get(external_id="A").status == "CHURNED"
+    assert PatientAddress.objects.filter(patient__external_id="A").count() == 1
+
+
+@pytest.mark.django_db
+def test_patient_bulk_rejects_duplicate_external_ids(provider_client):
+    url = reverse("api-patients-bulk")
+    provider_client.post(url, [_row(0, external_id="A")], format="json")
+
+    response = provider_client.post(
+        url,
+        [_row(1, external_id="A"), _row(2, external_id="B"), _row(3, external_id="B")],
+        format="json",
+    )
+
+    assert response.data["created"] == 1
+    assert [error["index"] for error in response.data["errors"]] == [0, 2]
+
+
+@pytest.mark.django_db
+def test_patient_bulk_hides_database_errors(
+    provider_client, provider, monkeypatch, caplog
+):
+    insert_rows = bulk.insert_rows
+
+    def racing_insert_rows(provider, chunk, upsert):
+        # As if other requests wrote the same patients concurrently.
+        written = insert_rows(provider, chunk, upsert)
+        for _index, data in chunk:
+            if data.get("external_id") == "RACE":
+                Patient.objects.create(
+                    provider=provider,
+                    external_id="RACE",
+                    first_name="Other",
+                    last_name="Writer",
+                    date_of_birth="1980-01-01",
+                )
+            if data.get("external_id") == "BOOM":
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1 / 0")
+        return written
+
+    monkeypatch.setattr(bulk, "insert_rows", racing_insert_rows)
+
+    response = provider_client.post(
+        reverse("api-patients-bulk"),
+        [_row(0, external_id="RACE"), _row(1), _row(2, external_id="BOOM")],
+        format="json",
+    )
+
+    assert response.data["created"] == 1
+    assert response.data["errors"] == [
+        {
+            "index": 0,
+            "errors": {
+                "external_id": ["A patient with this external id already exists."]
+            },
+        },
+        {
+            "index": 2,
+            "errors": {"non_field_errors": ["This patient could not be saved."]},
+        },
+    ]
+    assert "patients_provider_external_id_uniq" not in response.content.decode()
+    assert "division by zero" in caplog.text
+
+
+@pytest.mark.django_db(transaction=True)
+def test_patient_bulk_upsert_updates_patients_created_concurrently(
+    provider, monkeypatch
+):
+    project_custom_field_values = bulk.project_custom_field_values
+
+    def create_concurrently():
+        try:
+            patient = Patient.objects.create(
+                provider=provider,
+                external_id="RACE",
+                first_name="Other",
+                last_name="Writer",
+                date_of_birth="1980-01-01",
+                status="INQUIRY",
+            )
+            PatientAddress.objects.create(
+                patient=patient, street_address="2 Side St", is_primary=True
+            )
+        finally:
+            connection.close()
+
+    def racing_projection(values):
+        # Another request commits the patient after the existing ones were read.
+        if not Patient.objects.exists():
+            thread = threading.Thread(target=create_concurrently)
+            thread.start()
+            thread.join()
+        return project_custom_field_values(values)
+
+    monkeypatch.setattr(bulk, "project_custom_field_values", racing_projection)
+
+    result = bulk.bulk_upsert_patients(
+        provider, [_row(0, external_id="RACE")], upsert=True
+    )
+
+    assert (result.created, result.updated, result.errors) == (0, 1, [])
+    patient = Patient.objects.get()
+    assert patient.status == "ACTIVE"
+    assert [address.street_address for address in patient.addresses.all()] == [
+        "0 Main St"
+    ]
+    assert rebuild_patient_stats(provider.pk) == {}
+
+
+@pytest.mark.django_db
+def test_patient_bulk_create_batches_inserts(
+    provider_client, number_field, django_assert_max_num_queries
+):
+    rows = [
+        _row(
+            index,
+            external_id=str(index),
+            custom_field_values=[
+                {"custom_field": number_field.pk, "number_value": index}
+            ],
+        )
+        for index in range(300)
+    ]
+
+    # Custom fields, then per chunk: savepoint, existing external ids, one
+    # INSERT per table, the statistics upsert and savepoint release.
+    with django_assert_max_num_queries(8):
+        response = provider_client.post(
+            reverse("api-patients-bulk"), rows, format="json"
+        )
+
+    assert response.data["created"] == 300
+    assert PatientCustomFieldValue.objects.count() == 300
+
+
+@pytest.mark.django_db
+def test_patient_bulk_requires_a_list(provider_client):
+    response = provider_client.post(
+        reverse("api-patients-bulk"), _row(0), format="json"
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_patient_create_rejects_existing_external_id(provider_client):
+    url = reverse("api-patients-list")
+    provider_client.post(url, _row(0, external_id="A"), format="json")
+
+    response = provider_client.post(url, _row(1, external_id="A"), format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "external_id" in response.data
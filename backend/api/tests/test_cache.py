@@ -0,0 +1,211 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api.cache import CustomFieldCache, custom_field_cache
+from api.checks import check_patient_cache_is_shared
+from api.models import CustomField, PatientAddress, PatientCustomFieldValue
+
+
+@pytest.fixture
+def list_url():
+    return reverse("api-patients-list")
+
+
+@pytest.mark.django_db
+def test_patient_list_cache_hit(
+    provider_client, make_patients, list_url, django_assert_num_queries
+):
+    make_patients(3)
+    first = provider_client.get(list_url)
+
+    with django_assert_num_queries(0):
+        second = provider_client.get(list_url)
+
+    assert second.status_code == status.HTTP_200_OK
+    assert second.content == first.content
+    assert second["ETag"] == first["ETag"]
+    assert "private" in second["Cache-Control"]
+
+
+@pytest.mark.django_db
+def test_patient_list_not_modified(
+    provider_client, make_patients, list_url, django_assert_num_queries
+):
+    make_patients(3)
+    etag = provider_client.get(list_url)["ETag"]
+
+    with django_assert_num_queries(0):
+        response = provider_client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response["ETag"] == etag
+    assert not response.content
+
+
+@pytest.mark.django_db
+def test_patient_list_cache_key(provider_client, make_patients, user_factory, list_url):
+    make_patients(3)
+    etag = provider_client.get(list_url)["ETag"]
+
+    assert provider_client.get(list_url, {"status": "ACTIVE"})["ETag"] != etag
+
+    other = user_factory.create(username="other@example.com")
+    provider_client.force_authenticate(user=other)
+    response = provider_client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["count"] == 0
+
+
+@pytest.mark.django_db
+def test_patient_list_cache_invalidated_by_api_writes(
+    provider_client, make_patients, list_url, django_capture_on_commit_callbacks
+):
+    patient = make_patients(3)[0]
+    etag = provider_client.get(list_url)["ETag"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        provider_client.patch(
+            reverse("api-patients-detail", args=[patient.pk]),
+            {"first_name": "Renamed"},
+            format="json",
+        )
+
+    response = provider_client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+    assert response.data["results"][0]["first_name"] == "Renamed"
+
+
+@pytest.mark.django_db
+def test_patient_list_cache_invalidated_by_nested_rows(
+    provider_client, make_patients, list_url, django_capture_on_commit_callbacks
+):
+    patient = make_patients(1)[0]
+    etag = provider_client.get(list_url)["ETag"]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        address = PatientAddress.objects.get(patient_id=patient.pk)
+        address.city = "Shelbyville"
+        address.save()
+    response = provider_client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["results"][0]["addresses"][0]["city"] == "Shelbyville"
+
+    etag = response["ETag"]
+    with django_capture_on_commit_callbacks(execute=True):
+        CustomField.objects.filter(provider=patient.provider_id).first().delete()
+    assert provider_client.get(list_url, HTTP_IF_NONE_MATCH=etag)["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_patient_list_cache_invalidated_by_bulk_writes(
+    provider_client, make_patients, list_url, django_capture_on_commit_callbacks
+):
+    make_patients(1)
+    etag = provider_client.get(list_url)["ETag"]
+    row = {
+        "first_name": "Bulk",
+        "last_name": "Patient",
+        "date_of_birth": "1980-01-01",
+        "status": "ACTIVE",
+        "addresses": [],
+    }
+
+    with django_capture_on_commit_callbacks(execute=True):
+        provider_client.post(reverse("api-patients-bulk"), [row], format="json")
+
+    response = provider_client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["count"] == 2
+
+
+def _custom_field_queries(queries):
+    return [query for query in queries if 'FROM "custom_fields"' in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_custom_field_cache(
+    provider,
+    custom_field_factory,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+):
+    custom_field = custom_field_factory.create(provider=provider)
+    assert custom_field_cache.for_provider(provider.pk) == {
+        custom_field.pk: custom_field
+    }
+
+    with django_assert_num_queries(0):
+        assert custom_field_cache.for_provider(provider.pk)[custom_field.pk].name == (
+            custom_field.name
+        )
+        assert (
+            custom_field_cache.get(custom_field.pk).field_type
+            == custom_field.field_type
+        )
+
+    with django_capture_on_commit_callbacks(execute=True):
+        custom_field.name = "Renamed"
+        custom_field.save()
+    assert (
+        custom_field_cache.for_provider(provider.pk)[custom_field.pk].name == "Renamed"
+    )
+
+
+@pytest.mark.django_db
+def test_custom_field_cache_evicts_least_recently_used(
+    custom_field_factory, user_factory
+):
+    cache = CustomFieldCache(maxsize=2)
+    providers = [
+        user_factory.create(username=f"p{number}@example.com") for number in range(3)
+    ]
+    fields = [custom_field_factory.create(provider=provider) for provider in providers]
+
+    cache.for_provider(providers[0].pk)
+    cache.for_provider(providers[1].pk)
+    cache.for_provider(providers[0].pk)
+    cache.for_provider(providers[2].pk)
+
+    assert list(cache.entries) == [providers[0].pk, providers[2].pk]
+    assert fields[1].pk not in cache.providers
+
+
+@pytest.mark.django_db
+def test_patient_writes_use_custom_field_cache(
+    provider_client, provider, make_patients
+):
+    patient = make_patients(1)[0]
+    custom_field_cache.for_provider(provider.pk)
+    values = list(
+        patient.custom_field_values.values("custom_field", "text_value", "number_value")
+    )
+
+    with CaptureQueriesContext(connection) as queries:
+        response = provider_client.patch(
+            reverse("api-patients-detail", args=[patient.pk]),
+            {"custom_field_values": values},
+            format="json",
+        )
+        value = PatientCustomFieldValue.objects.filter(patient=patient).first()
+        value.save()
+        str(value)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert _custom_field_queries(queries.captured_queries) == []
+
+
+def test_patient_cache_must_be_shared(settings):
+    assert [error.id for error in check_patient_cache_is_shared(None)] == ["api.W001"]
+
+    settings.CACHES = {
+        **settings.CACHES,
+        settings.PATIENT_CACHE_ALIAS: {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": "127.0.0.1:11211",
+        },
+    }
+    assert check_patient_cache_is_shared(None) == []
@@ -0,0 +1,227 @@
+import io
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.changes import CHANGED, encode_change_cursor
+from api.models import (
+    CustomField,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+    Tombstone,
+)
+from api.stats import delete_patients
+
+
+@pytest.fixture(autouse=True)
+def settled(settings):
+    # Serve every committed change once, rather than again for a few seconds.
+    settings.CHANGES_SETTLE_SECONDS = 0
+
+
+def sync(client, url, cursor=None, page_size=100):
+    """
+    Fetch changes until there are no more. Returns the changed rows by id, the
+    deleted ids and the last cursor.
+    """
+    changed, deleted = {}, []
+    while True:
+        params = {"page_size": page_size}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get(url, params)
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        changed.update((row["id"], row) for row in data["changed"])
+        deleted += data["deleted"]
+        cursor = data["cursor"]
+        if not data["more"]:
+            return changed, deleted, cursor
+
+
+@pytest.mark.django_db
+def test_patient_changes_follow_writes(provider, provider_client, make_patients):
+    patients = make_patients(5)
+    url = reverse("api-patients-changes")
+
+    changed, deleted, cursor = sync(provider_client, url)
+    assert sorted(changed) == [patient.pk for patient in patients]
+    assert deleted == []
+    assert (
+        changed[patients[0].pk]
+        == provider_client.get(
+            reverse("api-patients-detail", args=[patients[0].pk])
+        ).json()
+    )
+
+    provider_client.patch(
+        reverse("api-patients-detail", args=[patients[0].pk]),
+        {"first_name": "Renamed"},
+        format="json",
+    )
+    PatientAddress.objects.filter(patient=patients[1]).get().delete()
+    value = PatientCustomFieldValue.objects.filter(
+        patient=patients[2], number_value__isnull=False
+    ).get()
+    value.number_value = 99
+    value.save()
+    provider_client.delete(reverse("api-patients-detail", args=[patients[3].pk]))
+
+    changed, deleted, cursor = sync(provider_client, url, cursor)
+    assert sorted(changed) == [patient.pk for patient in patients[:3]]
+    assert changed[patients[0].pk]["first_name"] == "Renamed"
+    assert changed[patients[1].pk]["addresses"] == []
+    assert {"custom_field": "Number of Visits", "value": 99.0} in changed[
+        patients[2].pk
+    ]["custom_field_values"]
+    assert deleted == [patients[3].pk]
+
+    assert sync(provider_client, url, cursor)[:2] == ({}, [])
+
+
+@pytest.mark.django_db
+def test_patient_changes_pages(provider, provider_client, make_patients, user_factory):
+    patients = make_patients(7)
+    make_patients(2, provider=user_factory.create(username="other@example.com"))
+    url = reverse("api-patients-changes")
+    cursor = sync(provider_client, url)[2]
+
+    Patient.objects.filter(pk__in=[patients[1].pk, patients[4].pk]).update(
+        modified_at=timezone.now()
+    )
+    delete_patients(Patient.objects.filter(pk__in=[patients[2].pk, patients[5].pk]))
+    Patient.objects.filter(pk=patients[6].pk).update(modified_at=timezone.now())
+
+    pages = []
+    while True:
+        data = provider_client.get(url, {"cursor": cursor, "page_size": 2}).json()
+        pages.append(([row["id"] for row in data["changed"]], data["deleted"]))
+        cursor = data["cursor"]
+        if not data["more"]:
+            break
+
+    assert pages == [
+        ([patients[1].pk, patients[4].pk], []),
+        ([], [patients[2].pk, patients[5].pk]),
+        ([patients[6].pk], []),
+    ]
+
+
+@pytest.mark.django_db
+def test_patient_changes_cursor_stays_behind_the_settle_window(
+    provider, provider_client, make_patients, settings
+):
+    settings.CHANGES_SETTLE_SECONDS = 60
+    patients = make_patients(4)
+    now = timezone.now()
+    Patient.objects.filter(pk=patients[0].pk).update(
+        modified_at=now - timedelta(minutes=5)
+    )
+    Patient.objects.filter(pk=patients[3].pk).update(
+        modified_at=now - timedelta(minutes=10)
+    )
+    url = reverse("api-patients-changes")
+    cursor = sync(provider_client, url)[2]
+    Patient.objects.filter(pk__in=[patients[1].pk, patients[2].pk]).update(
+        modified_at=now
+    )
+
+    # The full page reaches into the window, so it ends the sync there.
+    data = provider_client.get(url, {"cursor": cursor, "page_size": 1}).json()
+    assert [row["id"] for row in data["changed"]] == [patients[1].pk]
+    assert data["more"] is False
+
+    # A write committed late, with a time before the rows already served.
+    Patient.objects.filter(pk=patients[3].pk).update(
+        modified_at=now - timedelta(seconds=30)
+    )
+    changed = sync(provider_client, url, data["cursor"])[0]
+    assert sorted(changed) == [patients[1].pk, patients[2].pk, patients[3].pk]
+
+
+@pytest.mark.django_db
+def test_custom_field_changes(
+    provider, provider_client, make_patients, django_capture_on_commit_callbacks
+):
+    patient = make_patients(1)[0]
+    text_field = CustomField.objects.get(provider=provider, name="Referred By")
+    number_field = CustomField.objects.get(provider=provider, name="Number of Visits")
+    url = reverse("custom-field-changes")
+    patients_url = reverse("api-patients-changes")
+
+    changed, deleted, cursor = sync(provider_client, url)
+    assert changed[text_field.pk] == {
+        "id": text_field.pk,
+        "name": "Referred By",
+        "field_type": "TEXT",
+        "description": None,
+    }
+    patients_cursor = sync(provider_client, patients_url)[2]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        provider_client.patch(
+            reverse("custom-field-detail", args=[text_field.pk]),
+            {"name": "Referrer"},
+            format="json",
+        )
+    changed, deleted, cursor = sync(provider_client, url, cursor)
+    assert list(changed) == [text_field.pk]
+    assert deleted == []
+    changed, deleted, patients_cursor = sync(
+        provider_client, patients_url, patients_cursor
+    )
+    assert {"custom_field": "Referrer", "value": "Dr. 0"} in changed[patient.pk][
+        "custom_field_values"
+    ]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        provider_client.delete(reverse("custom-field-detail", args=[number_field.pk]))
+    changed, deleted, cursor = sync(provider_client, url, cursor)
+    assert (changed, deleted) == ({}, [number_field.pk])
+    changed, deleted, patients_cursor = sync(
+        provider_client, patients_url, patients_cursor
+    )
+    assert [
+        value["custom_field"] for value in changed[patient.pk]["custom_field_values"]
+    ] == ["Referrer"]
+
+
+@pytest.mark.django_db
+def test_changes_cursor_errors(provider_client, settings):
+    url = reverse("api-patients-changes")
+
+    response = provider_client.get(url, {"cursor": "nope"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "cursor" in response.json()
+
+    settings.CHANGES_TOMBSTONE_RETENTION_DAYS = 1
+    old = encode_change_cursor((timezone.now() - timedelta(days=2), CHANGED, 0))
+    response = provider_client.get(url, {"cursor": old})
+    assert response.status_code == status.HTTP_410_GONE
+    assert response.json()["detail"].startswith("The cursor is older")
+
+
+@pytest.mark.django_db
+def test_prune_tombstones(provider, make_patients):
+    patients = make_patients(3)
+    old, recent = patients[0].pk, patients[1].pk
+    patients[0].delete()
+    patients[1].delete()
+    Tombstone.objects.filter(object_id=old).update(
+        deleted_at=timezone.now() - timedelta(days=31)
+    )
+    stdout = io.StringIO()
+
+    call_command("prune_tombstones", stdout=stdout)
+
+    assert "Pruned 1 tombstones." in stdout.getvalue()
+    assert list(Tombstone.objects.values_list("object_id", flat=True)) == [recent]
+
+    # Deleting the provider deletes their rows without tombstones.
+    provider.delete()
+    assert not Tombstone.objects.exists()
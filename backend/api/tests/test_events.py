@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import psycopg
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.async_api import AsyncPatientEventsView
+from api.events import CHANNEL, RESYNC, PatientEventListener, listen_connection_params
+from api.models import Patient, PatientAddress, PatientCustomFieldValue
+from api.stats import delete_patients
+
+
+@pytest.fixture
+def notifications():
+    """
+    Read the patient_changes notifications sent since the fixture was set up.
+    """
+    connection = psycopg.connect(**listen_connection_params(), autocommit=True)
+    connection.execute(f"LISTEN {CHANNEL}")
+
+    def _notifications():
+        return [
+            json.loads(notify.payload) for notify in connection.notifies(timeout=0.5)
+        ]
+
+    yield _notifications
+    connection.close()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_patient_writes_notify(provider, make_patients, user_factory, notifications):
+    patients = make_patients(3)
+    other = make_patients(1, provider=user_factory.create(username="other@example.com"))
+    ids = [patient.pk for patient in patients]
+    assert {
+        "provider": provider.pk,
+        "event": "changed",
+        "patients": ids,
+    } in notifications()
+
+    PatientAddress.objects.filter(patient=patients[0]).get().delete()
+    value = PatientCustomFieldValue.objects.get(
+        patient=patients[1], text_value__isnull=False
+    )
+    value.text_value = "Dr. Who"
+    value.save()
+    delete_patients(Patient.objects.filter(pk__in=[ids[2], other[0].pk]))
+
+    sent = notifications()
+    assert {"provider": provider.pk, "event": "changed", "patients": ids[:1]} in sent
+    assert {"provider": provider.pk, "event": "changed", "patients": ids[1:2]} in sent
+    assert {"provider": provider.pk, "event": "deleted", "patients": ids[2:]} in sent
+    assert {
+        "provider": other[0].provider_id,
+        "event": "deleted",
+        "patients": [other[0].pk],
+    } in sent
+
+
+@pytest.mark.django_db(transaction=True)
+def test_large_writes_notify_without_ids(provider, make_patients, notifications):
+    make_patients(501)
+    notifications()
+
+    Patient.objects.filter(provider=provider).update(status="CHURNED")
+
+    assert notifications() == [
+        {"provider": provider.pk, "event": "changed", "patients": None}
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_event_stream(provider, make_patients, user_factory):
+    patient = make_patients(1)[0]
+    other = make_patients(1, provider=user_factory.create(username="other@example.com"))
+    request = AsyncRequestFactory().get(
+        "/api/async/patients/events/",
+        headers={"Authorization": f"Bearer {AccessToken.for_user(provider)}"},
+    )
+
+    async def stream():
+        response = await AsyncPatientEventsView.as_view()(request)
+        assert response["Content-Type"] == "text/event-stream"
+        content = aiter(response.streaming_content)
+        messages = [await anext(content)]
+
+        await sync_to_async(Patient.objects.filter(pk=other[0].pk).update)(
+            status="ACTIVE"
+        )
+        await sync_to_async(Patient.objects.filter(pk=patient.pk).update)(
+            status="ACTIVE"
+        )
+        messages.append(await asyncio.wait_for(anext(content), 5))
+        await content.aclose()
+        return messages
+
+    assert async_to_sync(stream)() == [
+        b"retry: 5000\n\n",
+        f'event: changed\ndata: {{"patients":[{patient.pk}]}}\n\n'.encode(),
+    ]
+
+
+def test_listener_queues_by_provider(settings):
+    settings.PATIENT_EVENTS_QUEUE_SIZE = 2
+    listener = PatientEventListener()
+    listener.listen = lambda: asyncio.sleep(0)
+
+    async def dispatch():
+        first, second = listener.subscribe(1), listener.subscribe(2)
+        for patient_id in [1, 2, 3]:
+            listener.dispatch(
+                json.dumps(
+                    {"provider": 1, "event": "changed", "patients": [patient_id]}
+                )
+            )
+        listener.dispatch(
+            json.dumps({"provider": 2, "event": "deleted", "patients": [4]})
+        )
+        listener.dispatch(
+            json.dumps({"provider": 3, "event": "deleted", "patients": [5]})
+        )
+        queued = [
+            [queue.get_nowait() for _ in range(queue.qsize())]
+            for queue in (first, second)
+        ]
+        listener.unsubscribe(1, first)
+        listener.unsubscribe(2, second)
+        return queued
+
+    assert async_to_sync(dispatch)() == [
+        [RESYNC],
+        [{"event": "deleted", "patients": [4]}],
+    ]
+    assert listener.subscribers == {}
+    assert listener.task is None
@@ -0,0 +1,162 @@
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import export
+from api.models import CustomField, PatientCustomFieldValue
+from api.renderers import StreamingRenderer
+
+
+def _content(response):
+    return b"".join(response.streaming_content).decode()
+
+
+@pytest.mark.django_db
+def test_patient_export_csv(provider_client, make_patients, user_factory):
+    make_patients(3)
+    make_patients(2, provider=user_factory.create(username="other@example.com"))
+
+    response = provider_client.get(reverse("api-patients-export"))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    assert 'filename="patients.csv"' in response["Content-Disposition"]
+    rows = list(csv.DictReader(io.StringIO(_content(response))))
+    assert [row["first_name"] for row in rows] == ["First0", "First1", "First2"]
+    assert rows[1]["street_address"] == "1 Main St"
+    assert rows[1]["custom:Referred By"] == "Dr. 1"
+    assert rows[1]["custom:Number of Visits"] == "1.00"
+    assert rows[1]["date_of_birth"] == "1980-01-01"
+
+
+@pytest.mark.django_db
+def test_patient_export_ndjson_applies_filters(provider_client, make_patients):
+    make_patients(6)
+
+    response = provider_client.get(
+        reverse("api-patients-export"),
+        {"format": "ndjson", "status": "ACTIVE", "ordering": "-id"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "application/x-ndjson; charset=utf-8"
+    rows = [json.loads(line) for line in _content(response).splitlines()]
+    assert rows
+    assert {row["status"] for row in rows} == {"ACTIVE"}
+    assert [row["id"] for row in rows] == sorted(
+        (row["id"] for row in rows), reverse=True
+    )
+    assert set(rows[0]) >= {
+        "city",
+        "state",
+        "custom:Referred By",
+        "custom:Number of Visits",
+    }
+
+
+@pytest.mark.django_db
+def test_patient_export_keeps_columns_named_like_custom_fields(
+    provider, provider_client, make_patients
+):
+    patient = make_patients(1)[0]
+    status_field = CustomField.objects.create(
+        provider=provider, name="status", field_type="TEXT"
+    )
+    PatientCustomFieldValue.objects.create(
+        patient=patient, custom_field=status_field, text_value="VIP"
+    )
+
+    response = provider_client.get(reverse("api-patients-export"))
+
+    reader = csv.DictReader(io.StringIO(_content(response)))
+    assert reader.fieldnames.count("status") == 1
+    [row] = list(reader)
+    assert row["status"] == patient.status
+    assert row["custom:status"] == "VIP"
+
+
+@pytest.mark.django_db
+def test_patient_export_queries_per_chunk(
+    provider_client, make_patients, monkeypatch, django_assert_max_num_queries
+):
+    make_patients(250)
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 100)
+
+    response = provider_client.get(reverse("api-patients-export"))
+    # Custom fields and the patient cursor, then two prefetches per chunk.
+    with django_assert_max_num_queries(2 + 2 * 3):
+        content = _content(response)
+
+    assert len(content.splitlines()) == 251
+
+
+@pytest.mark.django_db
+def test_patient_export_streams_under_asgi(provider, make_patients, monkeypatch):
+    make_patients(250)
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 100)
+    monkeypatch.setattr(StreamingRenderer, "batch_size", 100)
+    exported = []
+    export_row = export.export_row
+    monkeypatch.setattr(
+        export, "export_row", lambda *args: exported.append(1) or export_row(*args)
+    )
+    token = AccessToken.for_user(provider)
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": reverse("api-patients-export"),
+        "query_string": b"format=ndjson",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+    }
+    received = []
+    sent = []
+
+    async def receive():
+        if received:
+            # No disconnect while the response is sent.
+            await asyncio.Event().wait()
+        received.append(1)
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append((message, len(exported)))
+
+    # As the test client does, keep the test's connection and transaction.
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        async_to_sync(ASGIHandler())(scope, receive, send)
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+    (start, _), *body = sent
+    assert start["status"] == status.HTTP_200_OK
+    assert (
+        dict(start["headers"])[b"Content-Type"]
+        == b"application/x-ndjson; charset=utf-8"
+    )
+    # The first rows were sent before the later chunks were read.
+    assert body[0][1] < 250
+    content = b"".join(message.get("body", b"") for message, _ in body)
+    assert len(content.splitlines()) == 250
+
+
+@pytest.mark.django_db
+def test_patient_export_requires_authentication(api_client):
+    response = api_client.get(reverse("api-patients-export"))
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,84 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from api.cache import custom_field_cache
+
+
+@pytest.mark.django_db
+def test_patient_list_sparse_fields_skip_relations(
+    provider, provider_client, make_patients, django_assert_num_queries
+):
+    make_patients(5)
+
+    # COUNT(*) and the patient page, without the addresses prefetch.
+    with django_assert_num_queries(2) as context:
+        response = provider_client.get(
+            reverse("api-patients-list"), {"fields": "id,full_name,status"}
+        )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert list(response.data["results"][0]) == ["id", "full_name", "status"]
+    assert "custom_field_data" not in context.captured_queries[-1]["sql"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params,expected",
+    [
+        ({"fields": "id", "expand": "addresses"}, ["id", "addresses"]),
+        ({"fields": "id,custom_field_values"}, ["id", "custom_field_values"]),
+        (
+            {"expand": "custom_field_values"},
+            [
+                "id",
+                "external_id",
+                "full_name",
+                "first_name",
+                "middle_name",
+                "last_name",
+                "date_of_birth",
+                "status",
+                "created_at",
+                "custom_field_values",
+            ],
+        ),
+    ],
+)
+def test_patient_retrieve_expands_relations(
+    provider, provider_client, make_patients, params, expected
+):
+    patient = make_patients(1)[0]
+    custom_field_cache.for_provider(provider.pk)
+
+    response = provider_client.get(
+        reverse("api-patients-detail", args=[patient.pk]), params
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert list(response.data) == expected
+    if "custom_field_values" in expected:
+        assert len(response.data["custom_field_values"]) == 2
+
+
+@pytest.mark.django_db
+def test_patient_list_rejects_unknown_fields(provider_client):
+    response = provider_client.get(
+        reverse("api-patients-list"), {"fields": "id,ssn", "expand": "status"}
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert set(response.data) == {"fields", "expand"}
+
+
+@pytest.mark.django_db
+def test_custom_field_list_sparse_fields(provider_client, make_patients):
+    make_patients(0)
+
+    response = provider_client.get(reverse("custom-field-list"), {"fields": "id,name"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [list(custom_field) for custom_field in response.data["results"]] == [
+        ["id", "name"],
+        ["id", "name"],
+    ]
@@ -0,0 +1,132 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import (
+    AddressType,
+    Patient,
+    PatientAddress,
+    PatientStatus,
+    StateChoices,
+)
+
+
+def _ids(response):
+    assert response.status_code == status.HTTP_200_OK
+    return [patient["id"] for patient in response.data["results"]]
+
+
+@pytest.mark.django_db
+def test_patient_list_filters_by_multiple_statuses(provider_client, make_patients):
+    make_patients(12)
+
+    response = provider_client.get(
+        reverse("api-patients-list"),
+        {"status": [PatientStatus.ACTIVE, PatientStatus.CHURNED]},
+    )
+
+    expected = Patient.objects.filter(
+        status__in=[PatientStatus.ACTIVE, PatientStatus.CHURNED]
+    ).order_by("id")
+    assert _ids(response) == [patient.pk for patient in expected]
+
+
+@pytest.mark.django_db
+def test_patient_list_filters_by_primary_address(provider_client, make_patients):
+    patients = make_patients(4)
+    PatientAddress.objects.filter(patient=patients[0]).update(
+        state=StateChoices.NY, city="Albany"
+    )
+    # A secondary address in the same state must not match.
+    PatientAddress.objects.create(
+        patient=patients[1],
+        address_type=AddressType.WORK,
+        street_address="2 Side St",
+        city="Albany",
+        state=StateChoices.NY,
+        postal_code="12207",
+        is_primary=False,
+    )
+
+    response = provider_client.get(
+        reverse("api-patients-list"), {"state": StateChoices.NY, "city": "Albany"}
+    )
+
+    assert _ids(response) == [patients[0].pk]
+
+
+@pytest.mark.django_db
+def test_patient_list_filters_by_date_ranges(provider_client, make_patients):
+    patients = make_patients(3)
+    Patient.objects.filter(pk=patients[1].pk).update(date_of_birth="1990-06-01")
+
+    response = provider_client.get(
+        reverse("api-patients-list"),
+        {"date_of_birth_after": "1990-01-01", "date_of_birth_before": "1990-12-31"},
+    )
+    assert _ids(response) == [patients[1].pk]
+
+    response = provider_client.get(
+        reverse("api-patients-list"), {"created_after": "2999-01-01T00:00:00Z"}
+    )
+    assert _ids(response) == []
+
+
+@pytest.mark.django_db
+def test_patient_list_rejects_invalid_filters(provider_client):
+    response = provider_client.get(reverse("api-patients-list"), {"status": "NOPE"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "status" in response.data
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "ordering,order_by",
+    [
+        ("-date_of_birth", ["-date_of_birth", "-id"]),
+        ("status", ["status", "id"]),
+        ("full_name", ["first_name", "middle_name", "last_name", "id"]),
+        ("-last_name", ["-last_name", "-id"]),
+    ],
+)
+def test_patient_list_orders_by_column(
+    provider_client, make_patients, ordering, order_by
+):
+    patients = make_patients(8)
+    for i, patient in enumerate(patients):
+        Patient.objects.filter(pk=patient.pk).update(
+            date_of_birth=f"19{50 + i % 3}-01-01"
+        )
+
+    response = provider_client.get(reverse("api-patients-list"), {"ordering": ordering})
+
+    expected = Patient.objects.order_by(*order_by).values_list("id", flat=True)
+    assert _ids(response) == list(expected)
+
+
+@pytest.mark.django_db
+def test_patient_list_orders_by_primary_address(provider_client, make_patients):
+    patients = make_patients(4)
+    for patient, city in zip(
+        patients, ["Denver", "Austin", "Chicago", "Austin"], strict=True
+    ):
+        PatientAddress.objects.filter(patient=patient).update(city=city)
+    PatientAddress.objects.create(
+        patient=patients[0],
+        address_type=AddressType.WORK,
+        street_address="1 Work St",
+        city="Albany",
+        state=StateChoices.NY,
+        postal_code="12207",
+        is_primary=False,
+    )
+    url = reverse("api-patients-list")
+
+    response = provider_client.get(url, {"ordering": "-city"})
+    assert _ids(response) == [patients[i].pk for i in [0, 2, 3, 1]]
+
+    response = provider_client.get(url, {"ordering": "state"})
+    expected = sorted(
+        patients, key=lambda patient: patient.addresses.get(is_primary=True).state
+    )
+    assert _ids(response) == [patient.pk for patient in expected]
@@ -0,0 +1,163 @@
+import csv
+import io
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from api.models import CustomField, CustomFieldType, Patient, PatientCustomFieldValue
+
+COLUMNS = [
+    "external_id",
+    "first_name",
+    "last_name",
+    "date_of_birth",
+    "status",
+    "street_address",
+    "city",
+    "state",
+    "postal_code",
+    "Referred By",
+    "Visits",
+]
+
+
+def _row(index, **overrides):
+    row = {
+        "external_id": f"ext-{index}",
+        "first_name": f"First{index}",
+        "last_name": f"Last{index}",
+        "date_of_birth": "1980-01-01",
+        "status": "ACTIVE",
+        "street_address": f"{index} Main St",
+        "city": "Springfield",
+        "state": "CA",
+        "postal_code": "90001",
+        "Referred By": f"Dr. {index}",
+        "Visits": str(index),
+    }
+    row.update(overrides)
+    return row
+
+
+def _write_csv(path, rows, columns=COLUMNS):
+    with path.open("w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def _import(path, provider, **options):
+    call_command(
+        "import_patients",
+        str(path),
+        provider=provider.username,
+        number_fields=["Visits"],
+        stdout=io.StringIO(),
+        **options,
+    )
+
+
+@pytest.mark.django_db
+def test_import_patients(tmp_path, provider):
+    path = _write_csv(tmp_path / "roster.csv", [_row(i) for i in range(5)])
+
+    _import(path, provider, batch_size=2)
+
+    patients = Patient.objects.filter(provider=provider).order_by("external_id")
+    assert [patient.first_name for patient in patients] == [
+        f"First{i}" for i in range(5)
+    ]
+    address = patients[1].addresses.get()
+    assert (address.street_address, address.is_primary) == ("1 Main St", True)
+    visits = CustomField.objects.get(provider=provider, name="Visits")
+    assert visits.field_type == CustomFieldType.NUMBER
+    assert patients[3].custom_field_values.get(custom_field=visits).number_value == 3
+    assert PatientCustomFieldValue.objects.count() == 10
+    assert not (tmp_path / "roster.csv.rejects.csv").exists()
+
+
+@pytest.mark.django_db
+def test_import_patients_writes_rejects(tmp_path, provider):
+    rows = [
+        _row(0),
+        _row(1, date_of_birth="not a date"),
+        _row(2, status="UNKNOWN"),
+        _row(3, external_id=""),
+        _row(0, first_name="Again"),
+        _row(5, Visits="many"),
+        _row(6, street_address="", city="", state="", postal_code=""),
+    ]
+    path = _write_csv(tmp_path / "roster.csv", rows)
+
+    _import(path, provider)
+
+    assert set(Patient.objects.values_list("external_id", flat=True)) == {
+        "ext-0",
+        "ext-6",
+    }
+    assert not Patient.objects.get(external_id="ext-6").addresses.exists()
+    with (tmp_path / "roster.csv.rejects.csv").open() as f:
+        rejects = list(csv.DictReader(f))
+    assert [reject["line"] for reject in rejects] == ["3", "4", "5", "6", "7"]
+    assert rejects[0]["error"].startswith("date_of_birth:")
+    assert rejects[4]["error"].startswith("Visits:")
+
+
+@pytest.mark.django_db
+def test_import_patients_can_be_rerun(tmp_path, provider):
+    rows = [_row(i) for i in range(6)]
+    # An import that stopped halfway, then the full file again.
+    _import(_write_csv(tmp_path / "partial.csv", rows[:3]), provider)
+    _import(_write_csv(tmp_path / "roster.csv", rows), provider, batch_size=4)
+
+    assert Patient.objects.count() == 6
+    assert PatientCustomFieldValue.objects.count() == 12
+    assert CustomField.objects.filter(provider=provider).count() == 2
+
+
+@pytest.mark.django_db
+def test_import_patients_reads_export(
+    tmp_path, provider_client, provider, make_patients
+):
+    patients = make_patients(3)
+    for patient in patients:
+        Patient.objects.filter(pk=patient.pk).update(external_id=f"ext-{patient.pk}")
+    response = provider_client.get(reverse("api-patients-export"))
+    path = tmp_path / "export.csv"
+    path.write_bytes(b"".join(response.streaming_content))
+    Patient.objects.all().delete()
+
+    _import(path, provider)
+
+    assert Patient.objects.count() == 3
+    assert PatientCustomFieldValue.objects.count() == 6
+    assert CustomField.objects.filter(provider=provider).count() == 2
+
+
+@pytest.mark.django_db
+def test_import_patients_round_trips_custom_fields_named_like_columns(
+    tmp_path, provider_client, provider, make_patients
+):
+    patient = make_patients(1)[0]
+    Patient.objects.filter(pk=patient.pk).update(external_id="ext-0")
+    status_field = CustomField.objects.create(
+        provider=provider, name="status", field_type="TEXT"
+    )
+    PatientCustomFieldValue.objects.create(
+        patient=patient, custom_field=status_field, text_value="VIP"
+    )
+    response = provider_client.get(reverse("api-patients-export"))
+    path = tmp_path / "export.csv"
+    path.write_bytes(b"".join(response.streaming_content))
+    Patient.objects.all().delete()
+
+    _import(path, provider)
+
+    imported = Patient.objects.get()
+    assert imported.status == patient.status
+    assert imported.custom_field_values.get(custom_field=status_field).text_value == (
+        "VIP"
+    )
+    assert CustomField.objects.filter(provider=provider).count() == 3
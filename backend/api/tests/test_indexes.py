@@ -0,0 +1,87 @@
+import pytest
+from django.urls import reverse
+
+from api.models import CustomField, Patient, PatientAddress, PatientCustomFieldValue
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "ordering,index",
+    [
+        ("name", "patients_provider_name_idx"),
+        ("-name", "patients_provider_name_idx"),
+        ("created_at", "patients_provider_created_idx"),
+        ("-created_at", "patients_provider_created_idx"),
+    ],
+)
+def test_patient_list_page_uses_index(
+    provider_client, make_patients, ordering, index, explain, patient_page_sql
+):
+    make_patients(500)
+    first = provider_client.get(
+        reverse("api-patients-list"),
+        {"pagination": "cursor", "ordering": ordering, "page_size": 5},
+    )
+
+    sql = patient_page_sql(provider_client, first.data["next"])
+
+    assert index in explain(sql)
+
+
+@pytest.mark.django_db
+def test_patient_status_filter_uses_index(provider, make_patients, explain_queryset):
+    make_patients(20)
+    queryset = Patient.objects.filter(provider=provider, status="ACTIVE")
+    assert "patients_provider_status_idx" in explain_queryset(queryset)
+
+
+@pytest.mark.django_db
+def test_primary_address_lookup_uses_partial_index(make_patients, explain_queryset):
+    patients = make_patients(500)
+    queryset = PatientAddress.objects.filter(is_primary=True, patient__in=patients[:5])
+    assert "patient_addr_primary_idx" in explain_queryset(queryset)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "field_name,lookup,index",
+    [
+        ("Number of Visits", {"number_value__gt": 490}, "cfv_field_number_idx"),
+        ("Referred By", {"text_value": "Dr. 1"}, "cfv_field_text_idx"),
+    ],
+)
+def test_custom_field_value_filter_uses_index(
+    make_patients, field_name, lookup, index, explain_queryset
+):
+    make_patients(500)
+    custom_field = CustomField.objects.get(name=field_name)
+    queryset = PatientCustomFieldValue.objects.filter(
+        custom_field=custom_field, **lookup
+    )
+    assert index in explain_queryset(queryset)
+
+
+@pytest.mark.django_db
+def test_primary_address_filter_uses_partial_index(
+    provider_client, make_patients, explain, patient_page_sql
+):
+    make_patients(500)
+    sql = patient_page_sql(
+        provider_client, reverse("api-patients-list") + "?state=NY&city=Springfield"
+    )
+    assert "patient_addr_primary_loc_idx" in explain(sql)
+
+
+@pytest.mark.django_db
+def test_patient_changes_use_index(
+    provider_client, make_patients, explain, patient_page_sql
+):
+    make_patients(500)
+    first = provider_client.get(reverse("api-patients-changes"), {"page_size": 5})
+
+    sql = patient_page_sql(
+        provider_client,
+        reverse("api-patients-changes") + f"?page_size=5&cursor={first.data['cursor']}",
+    )
+
+    assert "patients_provider_modified_idx" in explain(sql)
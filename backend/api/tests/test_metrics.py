@@ -0,0 +1,109 @@
+import re
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+from psycopg_pool import ConnectionPool
+from rest_framework import status
+
+from api.cache import custom_field_cache
+from api.metrics import PoolMetrics
+
+
+def _timing(response):
+    return {
+        match["name"]: match
+        for match in re.finditer(
+            r'(?P<name>\w+);dur=(?P<dur>[\d.]+)(?:;desc="(?P<desc>[^"]*)")?',
+            response["Server-Timing"],
+        )
+    }
+
+
+@pytest.mark.django_db
+def test_server_timing_header(provider_client, provider, make_patients):
+    make_patients(3)
+    custom_field_cache.for_provider(provider.pk)
+
+    response = provider_client.get(reverse("api-patients-list"))
+
+    assert response.status_code == status.HTTP_200_OK
+    timing = _timing(response)
+    assert timing["db"]["desc"] == "3 queries"
+    assert float(timing["serializer"]["dur"]) > 0
+    assert float(timing["total"]["dur"]) >= float(timing["db"]["dur"])
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(provider_client, make_patients, settings):
+    settings.METRICS_TOKEN = "secret"
+    make_patients(1)
+    provider_client.get(reverse("api-patients-list"))
+    provider_client.get(reverse("api-patients-list"))
+
+    response = provider_client.get(
+        reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+    body = response.content.decode()
+    count = re.search(
+        r'^api_requests_total\{view="PatientViewSet.list",method="GET",status="200"\} (\d+)$',
+        body,
+        re.MULTILINE,
+    )
+    assert int(count[1]) >= 2
+    assert re.search(
+        r'^api_request_db_queries_bucket\{view="PatientViewSet.list",le="5"\} \d+$',
+        body,
+        re.MULTILINE,
+    )
+    assert (
+        'api_request_serializer_duration_seconds_count{view="PatientViewSet.list"}'
+        in body
+    )
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_token(client, settings, provider, user_factory):
+    url = reverse("metrics")
+    assert client.get(url).status_code == status.HTTP_404_NOT_FOUND
+    response = client.get(url, HTTP_AUTHORIZATION="Bearer ")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    settings.METRICS_TOKEN = "secret"
+    assert client.get(url).status_code == status.HTTP_403_FORBIDDEN
+    response = client.get(url, HTTP_AUTHORIZATION="Bearer wrong")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    response = client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+    assert response.status_code == status.HTTP_200_OK
+
+    settings.METRICS_TOKEN = ""
+    client.force_login(provider)
+    assert client.get(url).status_code == status.HTTP_404_NOT_FOUND
+    client.force_login(user_factory.create(username="staff@example.com", is_staff=True))
+    assert client.get(url).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_pool_metrics():
+    pool = ConnectionPool(
+        kwargs=connection.get_connection_params(),
+        min_size=1,
+        max_size=2,
+        check=ConnectionPool.check_connection,
+        open=False,
+    )
+    with pool:
+        with pool.connection(), pool.connection() as conn:
+            conn.execute("SELECT 1")
+            lines = list(PoolMetrics(lambda: {"default": pool}).collect())
+        lines += list(PoolMetrics(lambda: {"replica": pool}).collect())
+
+    assert "# TYPE api_db_pool_wait_seconds_total counter" in lines
+    assert 'api_db_pool_max_connections{database="default"} 2' in lines
+    assert 'api_db_pool_idle_connections{database="default"} 0' in lines
+    assert 'api_db_pool_requests_total{database="default"} 2' in lines
+    assert 'api_db_pool_idle_connections{database="replica"} 2' in lines
+    assert list(PoolMetrics(dict).collect()) == []
@@ -0,0 +1,163 @@
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import CustomField, Patient, PatientStatus, Tombstone
+from api.mutations import SET_STATUS, mutate_patients
+from api.stats import rebuild_patient_stats
+
+URL = reverse("api-patients-mutate")
+
+
+@pytest.mark.django_db
+def test_set_status_by_filter(provider, provider_client, make_patients):
+    make_patients(8)
+    inquiries = set(
+        Patient.objects.filter(status=PatientStatus.INQUIRY).values_list(
+            "pk", flat=True
+        )
+    )
+    body = {"operation": "set_status", "status": "CHURNED"}
+
+    response = provider_client.post(
+        f"{URL}?status=INQUIRY", {**body, "dry_run": True}, format="json"
+    )
+    assert response.json() == {"matched": 2, "affected": 2, "dry_run": True}
+    assert not Patient.objects.filter(pk__in=inquiries, status="CHURNED").exists()
+
+    response = provider_client.post(
+        f"{URL}?status=INQUIRY&status=CHURNED", body, format="json"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"matched": 4, "affected": 2, "dry_run": False}
+    assert (
+        set(Patient.objects.filter(status="CHURNED").values_list("pk", flat=True))
+        >= inquiries
+    )
+    assert rebuild_patient_stats(provider.pk) == {}
+
+
+@pytest.mark.django_db
+def test_set_custom_field_value(provider, provider_client, make_patients):
+    patients = make_patients(6)
+    number_field = CustomField.objects.get(provider=provider, name="Number of Visits")
+    new_field = CustomField.objects.create(
+        provider=provider, name="Consent", field_type="TEXT"
+    )
+    ids = [patient.pk for patient in patients[:4]]
+
+    response = provider_client.post(
+        URL,
+        {
+            "operation": "set_custom_field_value",
+            "ids": ids,
+            "custom_field_value": {
+                "custom_field": new_field.pk,
+                "text_value": "Signed",
+            },
+        },
+        format="json",
+    )
+    assert response.json() == {"matched": 4, "affected": 4, "dry_run": False}
+    assert (
+        list(
+            Patient.objects.filter(
+                custom_field_data__contains={str(new_field.pk): "Signed"}
+            )
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        == ids
+    )
+
+    body = {
+        "operation": "set_custom_field_value",
+        "all": True,
+        "custom_field_value": {"custom_field": number_field.pk, "number_value": "3"},
+    }
+    response = provider_client.post(URL, {**body, "dry_run": True}, format="json")
+    assert response.json() == {"matched": 6, "affected": 5, "dry_run": True}
+    response = provider_client.post(URL, body, format="json")
+    assert response.json() == {"matched": 6, "affected": 5, "dry_run": False}
+    response = provider_client.post(URL, body, format="json")
+    assert response.json() == {"matched": 6, "affected": 0, "dry_run": False}
+    patients[5].refresh_from_db()
+    assert patients[5].custom_field_data[str(number_field.pk)] == Decimal("3.00")
+
+
+@pytest.mark.django_db
+def test_delete_by_ids(provider, provider_client, make_patients, user_factory):
+    patients = make_patients(5)
+    other = make_patients(1, provider=user_factory.create(username="other@example.com"))
+    ids = [patients[0].pk, patients[3].pk, other[0].pk]
+
+    response = provider_client.post(
+        f"{URL}?state=CA&state=NY&state=IL",
+        {"operation": "delete", "ids": ids},
+        format="json",
+    )
+
+    assert response.json() == {"matched": 1, "affected": 1, "dry_run": False}
+    assert not Patient.objects.filter(pk=patients[0].pk).exists()
+    assert Patient.objects.filter(pk__in=[patients[3].pk, other[0].pk]).count() == 2
+    assert list(Tombstone.objects.values_list("object_id", flat=True)) == [
+        patients[0].pk
+    ]
+    assert rebuild_patient_stats(provider.pk) == {}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "query,body,field",
+    [
+        ("", {"operation": "delete"}, "non_field_errors"),
+        ("?status=ACTIVE", {"operation": "set_status"}, "status"),
+        (
+            "?status=ACTIVE",
+            {"operation": "set_custom_field_value"},
+            "custom_field_value",
+        ),
+        ("?status=ACTIVE", {"operation": "rename"}, "operation"),
+        (
+            "",
+            {
+                "operation": "set_custom_field_value",
+                "all": True,
+                "custom_field_value": {"custom_field": 0, "text_value": "x"},
+            },
+            "custom_field_value",
+        ),
+        ("?status=NOPE", {"operation": "delete"}, "status"),
+    ],
+)
+def test_mutation_errors(provider_client, make_patients, query, body, field):
+    make_patients(2)
+
+    response = provider_client.post(URL + query, body, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert field in response.json()
+    assert Patient.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_mutation_queries_per_chunk(provider, make_patients):
+    make_patients(40)
+    patients = Patient.objects.filter(provider=provider)
+
+    def chunk_queries(size):
+        with CaptureQueriesContext(connection) as queries:
+            result = mutate_patients(
+                patients, provider.pk, SET_STATUS, status="CHURNED", chunk_size=size
+            )
+        Patient.objects.update(status="ACTIVE")
+        return len(queries), result.matched
+
+    # Each chunk reads its ids, updates, records the counts and releases its
+    # savepoint. The selection is read once more to find it exhausted.
+    assert chunk_queries(40) == (6, 40)
+    assert chunk_queries(10) == (21, 40)
@@ -0,0 +1,166 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import PatientAddress, PatientCustomFieldValue
+
+
+def _address(street, **overrides):
+    address = {
+        "address_type": "HOME",
+        "street_address": street,
+        "city": "Springfield",
+        "state": "CA",
+        "postal_code": "90001",
+        "is_primary": False,
+    }
+    address.update(overrides)
+    return address
+
+
+@pytest.fixture
+def patient(provider, make_patients):
+    return make_patients(1)[0]
+
+
+def _payload(patient):
+    return {
+        "first_name": patient.first_name,
+        "last_name": patient.last_name,
+        "date_of_birth": str(patient.date_of_birth),
+        "status": patient.status,
+        "addresses": [
+            {
+                "id": address.pk,
+                "address_type": address.address_type,
+                "street_address": address.street_address,
+                "city": address.city,
+                "state": address.state,
+                "postal_code": address.postal_code,
+                "is_primary": address.is_primary,
+            }
+            for address in patient.addresses.order_by("pk")
+        ],
+        "custom_field_values": [
+            {
+                "custom_field": value.custom_field_id,
+                "text_value": value.text_value,
+                "number_value": value.number_value,
+            }
+            for value in patient.custom_field_values.order_by("pk")
+        ],
+    }
+
+
+def _writes(queries):
+    return [
+        query["sql"].split()[0]
+        for query in queries
+        if query["sql"].split()[0] in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+@pytest.mark.django_db
+def test_patient_update_unchanged_keeps_nested_rows(provider_client, patient):
+    url = reverse("api-patients-detail", args=[patient.pk])
+    addresses = set(PatientAddress.objects.values_list("pk", flat=True))
+    values = set(PatientCustomFieldValue.objects.values_list("pk", flat=True))
+
+    with CaptureQueriesContext(connection) as queries:
+        response = provider_client.put(url, _payload(patient), format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert _writes(queries.captured_queries) == ["UPDATE"]
+    assert set(PatientAddress.objects.values_list("pk", flat=True)) == addresses
+    assert set(PatientCustomFieldValue.objects.values_list("pk", flat=True)) == values
+
+
+@pytest.mark.django_db
+def test_patient_update_diffs_nested_rows(provider_client, patient):
+    url = reverse("api-patients-detail", args=[patient.pk])
+    payload = _payload(patient)
+    primary = payload["addresses"][0]
+    primary["city"] = "Shelbyville"
+    payload["addresses"].append(_address("2 Side St"))
+    removed, kept = payload["custom_field_values"]
+    payload["custom_field_values"] = [{**kept, "number_value": "42.00"}]
+
+    with CaptureQueriesContext(connection) as queries:
+        response = provider_client.put(url, payload, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    # Patient row, then one DELETE, one UPDATE and one INSERT per child table.
+    assert sorted(_writes(queries.captured_queries)) == [
+        "DELETE",
+        "INSERT",
+        "UPDATE",
+        "UPDATE",
+        "UPDATE",
+    ]
+    assert PatientAddress.objects.get(pk=primary["id"]).city == "Shelbyville"
+    assert patient.addresses.count() == 2
+    value = patient.custom_field_values.get()
+    assert value.custom_field_id == kept["custom_field"]
+    assert value.number_value == 42
+
+
+@pytest.mark.django_db
+def test_patient_update_matches_addresses_without_ids_in_order(
+    provider_client, patient
+):
+    url = reverse("api-patients-detail", args=[patient.pk])
+    address = patient.addresses.get()
+    payload = _payload(patient)
+    payload["addresses"] = [_address("9 New St", is_primary=True)]
+
+    response = provider_client.put(url, payload, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert patient.addresses.get().pk == address.pk
+    assert patient.addresses.get().street_address == "9 New St"
+
+
+@pytest.mark.django_db
+def test_patient_partial_update_leaves_nested_rows(provider_client, patient):
+    url = reverse("api-patients-detail", args=[patient.pk])
+
+    with CaptureQueriesContext(connection) as queries:
+        response = provider_client.patch(url, {"first_name": "Renamed"}, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert _writes(queries.captured_queries) == ["UPDATE"]
+    assert patient.addresses.count() == 1
+    assert patient.custom_field_values.count() == 2
+
+
+@pytest.mark.django_db
+def test_patient_update_rejects_foreign_address_id(provider_client, make_patients):
+    patient, other = make_patients(2)
+    url = reverse("api-patients-detail", args=[patient.pk])
+    payload = _payload(patient)
+    payload["addresses"][0]["id"] = other.addresses.get().pk
+
+    response = provider_client.put(url, payload, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "addresses" in response.data
+    assert (
+        other.addresses.get().street_address
+        != payload["addresses"][0]["street_address"]
+    )
+
+
+@pytest.mark.django_db
+def test_patient_update_validates_custom_field_value_type(provider_client, patient):
+    url = reverse("api-patients-detail", args=[patient.pk])
+    payload = _payload(patient)
+    text, number = payload["custom_field_values"]
+    number["number_value"] = None
+    number["text_value"] = "many"
+
+    response = provider_client.put(url, payload, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "custom_field_values" in response.data
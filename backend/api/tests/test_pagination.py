@@ -0,0 +1,110 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api.models import Patient
+
+
+def _walk(client, params):
+    ids, pages = [], 0
+    url = reverse("api-patients-list")
+    while url:
+        response = client.get(url, params)
+        assert response.status_code == status.HTTP_200_OK
+        ids.extend(patient["id"] for patient in response.data["results"])
+        url, params = response.data["next"], None
+        pages += 1
+    return ids, pages
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "ordering,order_by",
+    [
+        ("id", ["id"]),
+        ("-created_at", ["-created_at", "-id"]),
+        ("name", ["last_name", "first_name", "id"]),
+        ("-name", ["-last_name", "-first_name", "-id"]),
+    ],
+)
+def test_patient_cursor_pagination_walks_every_row_once(
+    provider_client, make_patients, ordering, order_by
+):
+    patients = make_patients(25)
+    # Force ties on the leading sort columns.
+    Patient.objects.filter(pk__in=[p.pk for p in patients[::2]]).update(
+        last_name="Smith", first_name="Ann"
+    )
+
+    ids, pages = _walk(
+        provider_client,
+        {"pagination": "cursor", "ordering": ordering, "page_size": 4},
+    )
+
+    expected = list(Patient.objects.order_by(*order_by).values_list("id", flat=True))
+    assert ids == expected
+    assert pages == 7
+
+
+@pytest.mark.django_db
+def test_patient_cursor_pagination_skips_count(provider_client, make_patients):
+    make_patients(250)
+    url = reverse("api-patients-list")
+
+    first = provider_client.get(url, {"pagination": "cursor"})
+    with CaptureQueriesContext(connection) as queries:
+        second = provider_client.get(first.data["next"])
+
+    assert set(second.data) == {"next", "results"}
+    assert len(second.data["results"]) == 100
+    assert not any("COUNT(" in query["sql"] for query in queries.captured_queries)
+
+
+@pytest.mark.django_db
+def test_patient_cursor_pagination_rejects_bad_cursor(provider_client):
+    response = provider_client.get(
+        reverse("api-patients-list"), {"pagination": "cursor", "cursor": "garbage"}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_patient_page_number_pagination_is_default(provider_client, make_patients):
+    make_patients(3)
+    response = provider_client.get(reverse("api-patients-list"))
+    assert set(response.data) == {"count", "next", "previous", "results"}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params,field",
+    [
+        ({"ordering": "status"}, "ordering"),
+        ({"ordering": "-city"}, "ordering"),
+        ({"search": "Jon"}, "search"),
+    ],
+)
+def test_patient_cursor_pagination_rejects_unsupported_orderings(
+    provider_client, params, field
+):
+    response = provider_client.get(
+        reverse("api-patients-list"), {"pagination": "cursor", **params}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "id, created_at, name" in response.data[field][0]
+
+
+@pytest.mark.django_db
+def test_patient_cursor_pagination_orders_search_results(
+    provider_client, make_patients
+):
+    make_patients(12)
+
+    ids, _pages = _walk(
+        provider_client,
+        {"pagination": "cursor", "search": "First1", "ordering": "-id"},
+    )
+
+    assert ids and ids == sorted(ids, reverse=True)
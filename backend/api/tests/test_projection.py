@@ -0,0 +1,219 @@
+import io
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+
+from api.imports import PatientImporter
+from api.models import CustomField, Patient, PatientCustomFieldValue
+from api.projection import rebuild_custom_field_data
+
+
+def _data(patient):
+    patient.refresh_from_db(fields=["custom_field_data"])
+    return patient.custom_field_data
+
+
+def _payload(text_field, number_field, text_value="Dr. Who", number_value="3.5"):
+    return {
+        "first_name": "Jane",
+        "last_name": "Doe",
+        "date_of_birth": "1980-01-01",
+        "status": "ACTIVE",
+        "addresses": [],
+        "custom_field_values": [
+            {"custom_field": text_field.pk, "text_value": text_value},
+            {"custom_field": number_field.pk, "number_value": number_value},
+        ],
+    }
+
+
+@pytest.fixture
+def fields(provider, make_patients):
+    make_patients(0)
+    return (
+        CustomField.objects.get(provider=provider, name="Referred By"),
+        CustomField.objects.get(provider=provider, name="Number of Visits"),
+    )
+
+
+@pytest.mark.django_db
+def test_nested_writes_set_projection(provider_client, fields):
+    text_field, number_field = fields
+
+    response = provider_client.post(
+        reverse("api-patients-list"), _payload(text_field, number_field), format="json"
+    )
+    patient = Patient.objects.get()
+    assert response.status_code == status.HTTP_201_CREATED
+    assert _data(patient) == {
+        str(text_field.pk): "Dr. Who",
+        str(number_field.pk): Decimal("3.50"),
+    }
+
+    url = reverse("api-patients-detail", args=[patient.pk])
+    provider_client.patch(url, {"first_name": "Janet"}, format="json")
+    assert _data(patient)[str(text_field.pk)] == "Dr. Who"
+
+    payload = _payload(text_field, number_field, number_value="4")
+    payload["custom_field_values"].pop(0)
+    provider_client.put(url, payload, format="json")
+    assert _data(patient) == {str(number_field.pk): Decimal("4.00")}
+
+
+@pytest.mark.django_db
+def test_single_value_writes_refresh_projection(fields, patient_factory, provider):
+    text_field, number_field = fields
+    patient = patient_factory.create(provider=provider)
+
+    value = PatientCustomFieldValue.objects.create(
+        patient=patient, custom_field=number_field, number_value=7
+    )
+    assert _data(patient) == {str(number_field.pk): Decimal("7.00")}
+
+    value.delete()
+    assert _data(patient) == {}
+
+
+@pytest.mark.django_db
+def test_custom_field_delete_removes_key(fields, make_patients):
+    text_field, number_field = fields
+    patient = make_patients(1)[0]
+
+    text_field.delete()
+
+    assert list(_data(patient)) == [str(number_field.pk)]
+
+
+@pytest.mark.django_db
+def test_bulk_writes_keep_projection_in_sync(provider, provider_client, fields):
+    text_field, number_field = fields
+    rows = [
+        {
+            **_payload(text_field, number_field, number_value=str(index)),
+            "external_id": f"b-{index}",
+        }
+        for index in range(3)
+    ]
+    provider_client.post(reverse("api-patients-bulk"), rows, format="json")
+    rows[0]["custom_field_values"] = []
+    provider_client.post(
+        reverse("api-patients-bulk") + "?upsert=true", rows, format="json"
+    )
+
+    row = {
+        "external_id": "i-1",
+        "first_name": "Imported",
+        "last_name": "Row",
+        "date_of_birth": "1980-01-01",
+        "status": "ACTIVE",
+        text_field.name: "Dr. X",
+    }
+    PatientImporter(provider, list(row)).run([(2, row)])
+
+    assert _data(Patient.objects.get(external_id="b-0")) == {}
+    assert _data(Patient.objects.get(external_id="i-1")) == {
+        str(text_field.pk): "Dr. X"
+    }
+    assert rebuild_custom_field_data() == (Patient.objects.count(), 0)
+
+
+@pytest.mark.django_db
+def test_rebuild_command(provider, make_patients):
+    patients = make_patients(5)
+    expected = _data(patients[0])
+    Patient.objects.update(custom_field_data={})
+    stdout = io.StringIO()
+
+    call_command(
+        "rebuild_custom_field_data",
+        provider=[provider.username],
+        batch_size=2,
+        stdout=stdout,
+    )
+
+    assert _data(patients[0]) == expected
+    assert "Checked 5 patients" in stdout.getvalue()
+    assert "5 projections rebuilt" in stdout.getvalue()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "condition,expected",
+    [
+        ("number:eq:3", [3]),
+        ("number:gt:3", [4, 5]),
+        ("number:lte:1", [0, 1]),
+        ("text:eq:Dr. 2", [2]),
+        ("text:contains:dr. 5", [5]),
+    ],
+)
+def test_patient_list_filters_by_custom_field(
+    provider_client, make_patients, fields, condition, expected
+):
+    patients = make_patients(6)
+    text_field, number_field = fields
+    field, rest = condition.split(":", 1)
+    custom_field = text_field if field == "text" else number_field
+
+    response = provider_client.get(
+        reverse("api-patients-list"), {"custom_field": f"{custom_field.pk}:{rest}"}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [patient["id"] for patient in response.data["results"]] == [
+        patients[index].pk for index in expected
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "condition",
+    ["{text}:gt:3", "{number}:contains:3", "{number}:eq:x", "0:eq:1", "3"],
+)
+def test_patient_list_rejects_invalid_custom_field_filters(
+    provider_client, fields, condition
+):
+    text_field, number_field = fields
+
+    response = provider_client.get(
+        reverse("api-patients-list"),
+        {"custom_field": condition.format(text=text_field.pk, number=number_field.pk)},
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "custom_field" in response.data
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("operator", ["eq", "gt"])
+def test_custom_field_filter_uses_gin_index(
+    provider, provider_client, fields, operator, explain, patient_page_sql
+):
+    text_field, number_field = fields
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO patients
+                (provider_id, first_name, last_name, date_of_birth, status,
+                 custom_field_data, created_at, modified_at)
+            SELECT %s, 'First', 'Last', '1980-01-01', 'ACTIVE',
+                   CASE WHEN i %% 100 = 0
+                        THEN jsonb_build_object(%s::text, i)
+                        ELSE jsonb_build_object(%s::text, 'Dr. ' || i)
+                   END,
+                   now(), now()
+            FROM generate_series(1, 5000) AS i
+            """,
+            [provider.pk, number_field.pk, text_field.pk],
+        )
+        cursor.execute("SELECT gin_clean_pending_list('patients_custom_data_idx')")
+
+    url = (
+        reverse("api-patients-list") + f"?custom_field={number_field.pk}:{operator}:100"
+    )
+
+    assert "patients_custom_data_idx" in explain(patient_page_sql(provider_client, url))
@@ -0,0 +1,70 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from api.cache import custom_field_cache
+
+# COUNT(*) for the paginator, the patient page and the prefetched addresses.
+# Custom field values come from the custom_field_data projection, and their
+# names and types from the warm custom field cache.
+LIST_QUERY_BUDGET = 3
+RETRIEVE_QUERY_BUDGET = 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("patient_count", [10, 100, 1000])
+def test_patient_list_query_budget(
+    provider_client,
+    provider,
+    make_patients,
+    django_assert_max_num_queries,
+    patient_count,
+):
+    make_patients(patient_count)
+    custom_field_cache.for_provider(provider.pk)
+
+    with django_assert_max_num_queries(LIST_QUERY_BUDGET):
+        response = provider_client.get(reverse("api-patients-list"))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["count"] == patient_count
+    patient = response.data["results"][0]
+    assert len(patient["addresses"]) == 1
+    assert len(patient["custom_field_values"]) == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("patient_count", [10, 100, 1000])
+def test_patient_retrieve_query_budget(
+    provider_client,
+    provider,
+    make_patients,
+    django_assert_max_num_queries,
+    patient_count,
+):
+    patients = make_patients(patient_count)
+    custom_field_cache.for_provider(provider.pk)
+
+    with django_assert_max_num_queries(RETRIEVE_QUERY_BUDGET):
+        response = provider_client.get(
+            reverse("api-patients-detail", args=[patients[-1].pk])
+        )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {
+        value["custom_field"] for value in response.data["custom_field_values"]
+    } == {
+        "Referred By",
+        "Number of Visits",
+    }
+
+
+@pytest.mark.django_db
+def test_patient_list_scoped_to_provider(provider_client, make_patients, user_factory):
+    other_provider = user_factory.create(username="other@example.com")
+    make_patients(3)
+    make_patients(5, provider=other_provider)
+
+    response = provider_client.get(reverse("api-patients-list"))
+
+    assert response.data["count"] == 3
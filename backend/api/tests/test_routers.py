@@ -0,0 +1,159 @@
+import pytest
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api.cache import custom_field_cache
+from api.checks import check_replica_stickiness_is_shared
+from api.metrics import REPLICA_READS
+from api.models import Patient
+from api.routers import (
+    _read_database,
+    choose_read_database,
+    record_write,
+    replica_lag,
+)
+
+
+@pytest.fixture(scope="module")
+def replica_database(django_db_setup):
+    """
+    A replica alias pointing at the test database, as a replica that is
+    never behind. Its connection only sees committed rows. Module scoped, as
+    test databases must be defined before the test case is set up.
+    """
+    connections.settings["replica"] = {**connections.settings["default"]}
+    yield "replica"
+    connections["replica"].close()
+    del connections["replica"]
+    del connections.settings["replica"]
+
+
+@pytest.fixture
+def replica(replica_database, settings):
+    settings.DATABASE_REPLICAS = [replica_database]
+    replica_lag.clear()
+    yield replica_database
+    replica_lag.clear()
+
+
+def queries_by_database(send):
+    with (
+        CaptureQueriesContext(connection) as primary,
+        CaptureQueriesContext(connections["replica"]) as replica,
+    ):
+        response = send()
+        if response.streaming:
+            b"".join(response.streaming_content)
+    return response, len(primary), len(replica)
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+@pytest.mark.parametrize(
+    "url",
+    [
+        reverse("api-patients-list"),
+        reverse("api-patients-stats"),
+        reverse("api-patients-export") + "?format=csv",
+        reverse("custom-field-list"),
+    ],
+)
+def test_reads_go_to_replica(provider, provider_client, make_patients, replica, url):
+    make_patients(2)
+    # Loaded from the primary, see test_custom_field_cache_reads_the_primary.
+    custom_field_cache.for_provider(provider.pk)
+
+    response, primary, replica_queries = queries_by_database(
+        lambda: provider_client.get(url)
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert primary == 0
+    assert replica_queries > 0
+
+
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_reads_stick_to_primary_after_write(provider, provider_client, replica):
+    url = reverse("api-patients-list")
+    response, primary, replica_queries = queries_by_database(
+        lambda: provider_client.post(
+            url,
+            {
+                "first_name": "Ada",
+                "last_name": "Lovelace",
+                "date_of_birth": "1815-12-10",
+                "status": "ACTIVE",
+                "addresses": [],
+            },
+            format="json",
+        )
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert replica_queries == 0
+
+    response, primary, replica_queries = queries_by_database(
+        lambda: provider_client.get(
+            reverse("api-patients-detail", args=[Patient.objects.get().pk])
+        )
+    )
+    assert response.data["first_name"] == "Ada"
+    assert primary > 0
+    assert replica_queries == 0
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_choose_read_database(provider, user_factory, replica, settings):
+    other = user_factory.create(username="other@example.com")
+    record_write(other.pk)
+    sticky = REPLICA_READS.series.get(("default", "sticky"), 0)
+
+    assert choose_read_database(provider.pk) == "replica"
+    assert choose_read_database(other.pk) is None
+    assert REPLICA_READS.series[("default", "sticky")] == sticky + 1
+
+    # The lag is checked once per interval, and replicas behind are skipped.
+    with CaptureQueriesContext(connections["replica"]) as queries:
+        choose_read_database(provider.pk)
+    assert len(queries) == 0
+    settings.DATABASE_REPLICA_MAX_LAG = -1
+    assert choose_read_database(provider.pk) is None
+
+    settings.DATABASE_REPLICAS = []
+    assert choose_read_database(provider.pk) is None
+
+
+@pytest.mark.django_db(databases=["default", "replica"])
+def test_custom_field_cache_reads_the_primary(provider, make_patients, replica):
+    make_patients(1)
+    # Read during a request served from the replica.
+    token = _read_database.set(replica)
+    try:
+        with CaptureQueriesContext(connections["replica"]) as queries:
+            custom_fields = custom_field_cache.for_provider(provider.pk)
+    finally:
+        _read_database.reset(token)
+
+    assert len(queries) == 0
+    assert {custom_field.name for custom_field in custom_fields.values()} == {
+        "Referred By",
+        "Number of Visits",
+    }
+
+
+def test_replica_stickiness_must_be_shared(settings):
+    assert check_replica_stickiness_is_shared(None) == []
+
+    settings.DATABASE_REPLICAS = ["replica"]
+    assert [error.id for error in check_replica_stickiness_is_shared(None)] == [
+        "api.W002"
+    ]
+
+    settings.CACHES = {
+        **settings.CACHES,
+        settings.PATIENT_CACHE_ALIAS: {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": "127.0.0.1:11211",
+        },
+    }
+    assert check_replica_stickiness_is_shared(None) == []
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+
+import pytest
+from django.db.models import Prefetch
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import custom_field_cache
+from api.models import (
+    AddressType,
+    CustomField,
+    Patient,
+    PatientAddress,
+    PatientCustomFieldValue,
+)
+from api.projection import refresh_custom_field_data
+from api.renderers import ORJSONRenderer
+from api.rows import patient_row_columns, patient_rows
+from api.serializers import PatientListSerializer
+
+
+@pytest.fixture
+def varied_patients(provider, make_patients):
+    """
+    Patients covering the values whose rendering could differ: missing and
+    non-ASCII names, line separators, several and no addresses, and number
+    values of various magnitudes.
+    """
+    patients = make_patients(4)
+    number_field = CustomField.objects.get(provider=provider, name="Number of Visits")
+    Patient.objects.filter(pk=patients[0].pk).update(
+        external_id='ext-"1"', middle_name="Zoë\u2028\U0001f600", first_name="Ana\\"
+    )
+    Patient.objects.filter(pk=patients[1].pk).update(middle_name="")
+    PatientAddress.objects.create(
+        patient=patients[0],
+        address_type=AddressType.WORK,
+        street_address="1\u2029Rue\tNoël",
+        city="Montréal",
+        state="NY",
+        postal_code="10001",
+        is_primary=False,
+    )
+    PatientAddress.objects.filter(patient=patients[2]).delete()
+    for patient, number in zip(
+        patients, ["0.01", "-2.50", "1234567890123.45", "100"], strict=True
+    ):
+        PatientCustomFieldValue.objects.filter(
+            patient=patient, custom_field=number_field
+        ).update(number_value=number)
+    refresh_custom_field_data(patient.pk for patient in patients)
+    # A custom field deleted after the projection was read.
+    Patient.objects.filter(pk=patients[3].pk).update(custom_field_data={"0": "gone"})
+    return patients
+
+
+def serializer_data(provider, selected=None):
+    patients = (
+        Patient.objects.filter(provider=provider)
+        .order_by("id")
+        .prefetch_related(Prefetch("addresses", queryset=PatientAddress.objects.all()))
+    )
+    return PatientListSerializer(
+        patients,
+        many=True,
+        context={
+            "custom_fields": custom_field_cache.for_provider(provider.pk),
+            "selected_fields": selected,
+        },
+    ).data
+
+
+def rows_bytes(provider, selected=None):
+    patients = (
+        Patient.objects.filter(provider=provider)
+        .order_by("id")
+        .values(*patient_row_columns(selected))
+    )
+    rows = patient_rows(
+        list(patients), custom_field_cache.for_provider(provider.pk), selected
+    )
+    return ORJSONRenderer().render(rows)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "selected",
+    [
+        None,
+        frozenset({"id", "full_name", "created_at"}),
+        frozenset({"date_of_birth", "addresses"}),
+        frozenset({"status", "custom_field_values"}),
+    ],
+)
+def test_patient_rows_render_like_serializer(provider, varied_patients, selected):
+    expected = JSONRenderer().render(serializer_data(provider, selected))
+
+    assert rows_bytes(provider, selected) == expected
+
+
+@pytest.mark.django_db
+def test_patient_endpoints_render_like_serializer(
+    provider, provider_client, varied_patients
+):
+    data = serializer_data(provider)
+
+    response = provider_client.get(reverse("api-patients-list"))
+    assert response.content == JSONRenderer().render(
+        OrderedDict(
+            [("count", 4), ("next", None), ("previous", None), ("results", data)]
+        )
+    )
+
+    response = provider_client.get(
+        reverse("api-patients-detail", args=[varied_patients[0].pk])
+    )
+    assert response.content == JSONRenderer().render(data[0])
+    assert b"\\u2028" in response.content
+
+
+def test_orjson_renderer_falls_back_for_indented_output():
+    data = {"name": "Zo\u00eb", "ids": [1, 2]}
+
+    assert ORJSONRenderer().render(
+        data, "application/json; indent=2"
+    ) == JSONRenderer().render(data, "application/json; indent=2")
@@ -0,0 +1,93 @@
+import pytest
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+
+
+@pytest.fixture
+def named_patients(provider, patient_factory):
+    return {
+        name: patient_factory.create(
+            provider=provider, first_name=first, middle_name=middle, last_name=last
+        )
+        for name, (first, middle, last) in {
+            "jonathan": ("Jonathan", None, "Smith"),
+            "jon": ("Jon", "Paul", "Smythe"),
+            "maria": ("Maria", "Jonas", "Garcia"),
+            "alice": ("Alice", None, "Wong"),
+        }.items()
+    }
+
+
+def _names(response):
+    assert response.status_code == status.HTTP_200_OK
+    return [patient["full_name"] for patient in response.data["results"]]
+
+
+@pytest.mark.django_db
+def test_patient_search_matches_partial_and_misspelled_names(
+    provider_client, named_patients
+):
+    response = provider_client.get(reverse("api-patients-list"), {"search": "jon smth"})
+
+    assert _names(response) == ["Jon Paul Smythe", "Jonathan Smith"]
+
+
+@pytest.mark.django_db
+def test_patient_search_ranks_by_similarity(provider_client, named_patients):
+    response = provider_client.get(reverse("api-patients-list"), {"search": "Jon"})
+
+    names = _names(response)
+    assert names[0] == "Jon Paul Smythe"
+    assert "Maria Jonas Garcia" in names
+    assert "Alice Wong" not in names
+
+
+@pytest.mark.django_db
+def test_patient_search_honours_explicit_ordering(provider_client, named_patients):
+    response = provider_client.get(
+        reverse("api-patients-list"), {"search": "Jon", "ordering": "-last_name"}
+    )
+
+    assert _names(response)[0] == "Jon Paul Smythe"
+    assert _names(response)[-1] == "Maria Jonas Garcia"
+
+
+@pytest.mark.django_db
+def test_patient_search_is_scoped_to_provider(
+    provider_client, named_patients, patient_factory, user_factory
+):
+    other_provider = user_factory.create(username="other@example.com")
+    patient_factory.create(provider=other_provider, first_name="Jon", last_name="Doe")
+
+    response = provider_client.get(reverse("api-patients-list"), {"search": "Doe"})
+
+    assert _names(response) == []
+
+
+@pytest.mark.django_db
+def test_patient_search_uses_trigram_index(
+    provider, provider_client, named_patients, explain, patient_page_sql
+):
+    # The trigram index only pays off over a provider-wide scan once the
+    # roster is large, so load random names in bulk.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO patients
+                (provider_id, first_name, last_name, date_of_birth, status,
+                 created_at, modified_at)
+            SELECT %s, md5(i::text), md5((-i)::text), '1980-01-01', 'ACTIVE',
+                   now(), now()
+            FROM generate_series(1, 5000) AS i
+            """,
+            [provider.pk],
+        )
+        # Merge the bulk insert out of the GIN pending list, as autovacuum would.
+        cursor.execute("SELECT gin_clean_pending_list('patients_prov_name_trgm_idx')")
+
+    sql = patient_page_sql(
+        provider_client, reverse("api-patients-list") + "?search=Jon"
+    )
+
+    assert "patients_prov_name_trgm_idx" in explain(sql)
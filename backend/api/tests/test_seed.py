@@ -0,0 +1,111 @@
+import io
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.models import CustomField, Patient, PatientAddress, PatientCustomFieldValue
+
+
+def _seed(*args, **options):
+    call_command("seed_patients", *args, stdout=io.StringIO(), **options)
+
+
+def _snapshot():
+    return list(
+        Patient.objects.order_by("external_id").values_list(
+            "external_id", "first_name", "last_name", "date_of_birth", "status"
+        )
+    )
+
+
+@pytest.mark.django_db
+def test_seed_patients():
+    _seed(providers=2, patients=120, custom_fields=3, workers=1, chunk_size=50)
+
+    assert Patient.objects.count() == 240
+    assert CustomField.objects.count() == 6
+    assert PatientCustomFieldValue.objects.count() == 720
+    assert PatientAddress.objects.filter(is_primary=True).count() <= 240
+    assert set(Patient.objects.values_list("provider__username", flat=True)) == {
+        "provider1@example.com",
+        "provider2@example.com",
+    }
+
+
+@pytest.mark.django_db
+def test_seed_patients_is_deterministic_and_rerunnable():
+    _seed(patients=30, workers=1, chunk_size=20, seed=7)
+    first = _snapshot()
+    _seed(patients=30, workers=1, chunk_size=20, seed=7)
+    assert _snapshot() == first
+
+    Patient.objects.all().delete()
+    _seed(patients=30, workers=1, chunk_size=20, seed=7)
+    assert _snapshot() == first
+
+    Patient.objects.all().delete()
+    _seed(patients=30, workers=1, chunk_size=20, seed=8)
+    assert _snapshot() != first
+
+
+@pytest.mark.django_db
+def test_seed_patients_created_at_is_deterministic():
+    def created_at():
+        return list(
+            Patient.objects.order_by("external_id").values_list("created_at", flat=True)
+        )
+
+    _seed(patients=20, workers=1, seed=3)
+    first = created_at()
+    Patient.objects.all().delete()
+    _seed(patients=20, workers=1, seed=3)
+    assert created_at() == first
+    assert max(first) <= datetime(2025, 1, 1, tzinfo=UTC)
+
+    Patient.objects.all().delete()
+    _seed("--as-of=2026-01-01", patients=20, workers=1, seed=3)
+    assert [value - timedelta(days=365) for value in created_at()] == first
+
+    with pytest.raises(CommandError):
+        _seed("--as-of=yesterday", workers=1)
+
+
+@pytest.mark.django_db
+def test_seed_patients_weights():
+    _seed(
+        patients=50,
+        workers=1,
+        status_weights="ACTIVE=1",
+        address_weights="2=1",
+    )
+
+    assert set(Patient.objects.values_list("status", flat=True)) == {"ACTIVE"}
+    assert PatientAddress.objects.count() == 200
+    assert PatientAddress.objects.filter(is_primary=True).count() == 100
+
+    with pytest.raises(CommandError):
+        _seed(status_weights="UNKNOWN=1", workers=1)
+
+
+@pytest.mark.django_db
+def test_seed_patients_queries_per_chunk():
+    _seed(patients=10, workers=1, chunk_size=10)
+    Patient.objects.all().delete()
+    with CaptureQueriesContext(connection) as small:
+        _seed(patients=10, workers=1, chunk_size=10)
+    Patient.objects.all().delete()
+    with CaptureQueriesContext(connection) as large:
+        _seed(patients=1000, workers=1, chunk_size=1000)
+
+    assert len(large) == len(small)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_seed_patients_in_parallel():
+    _seed(providers=2, patients=60, workers=2, chunk_size=25)
+
+    assert Patient.objects.count() == 120
@@ -0,0 +1,168 @@
+import io
+from datetime import timedelta
+
+import psycopg
+import pytest
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.events import listen_connection_params
+from api.imports import PatientImporter
+from api.models import Patient, PatientAddress, PatientStatistic
+from api.stats import (
+    STATS_LOCK_CLASS,
+    rebuild_patient_stats,
+    record_patient_stats,
+    status_stats,
+)
+
+
+def _patient(external_id, state="CA", **overrides):
+    patient = {
+        "external_id": external_id,
+        "first_name": "Jane",
+        "last_name": "Doe",
+        "date_of_birth": "1980-01-01",
+        "status": "ACTIVE",
+        "addresses": [
+            {
+                "address_type": "HOME",
+                "street_address": "1 Main St",
+                "city": "Springfield",
+                "state": state,
+                "postal_code": "90001",
+                "is_primary": True,
+            }
+        ],
+    }
+    patient.update(overrides)
+    return patient
+
+
+@pytest.mark.django_db
+def test_patient_stats_follow_writes(
+    provider, provider_client, make_patients, patient_factory
+):
+    make_patients(4)
+    url = reverse("api-patients-list")
+
+    provider_client.post(url, _patient("a"), format="json")
+    created = Patient.objects.get(external_id="a")
+    detail = reverse("api-patients-detail", args=[created.pk])
+    payload = _patient("a", state="NY", status="CHURNED")
+    payload["addresses"][0]["id"] = created.addresses.get().pk
+    provider_client.put(detail, payload, format="json")
+    provider_client.patch(detail, {"status": "INQUIRY"}, format="json")
+
+    bulk = reverse("api-patients-bulk")
+    provider_client.post(
+        bulk, [_patient("b"), _patient("c", state="TX")], format="json"
+    )
+    provider_client.post(
+        bulk + "?upsert=true",
+        [_patient("b", state="FL", status="ONBOARDING")],
+        format="json",
+    )
+    deleted = Patient.objects.get(external_id="c")
+    provider_client.delete(reverse("api-patients-detail", args=[deleted.pk]))
+
+    row = {
+        "external_id": "i",
+        "first_name": "Imported",
+        "last_name": "Row",
+        "date_of_birth": "1980-01-01",
+        "status": "ACTIVE",
+        "street_address": "2 Side St",
+        "city": "Boston",
+        "state": "MA",
+        "postal_code": "02101",
+    }
+    PatientImporter(provider, list(row)).run([(2, row)])
+
+    address = PatientAddress.objects.get(patient__external_id="i")
+    address.state = "WA"
+    address.save()
+    patient_factory.create(provider=provider, status="CHURNED").delete()
+
+    assert rebuild_patient_stats(provider.pk) == {}
+    response = provider_client.get(reverse("api-patients-stats"))
+    assert response.data["total"] == 7
+    assert response.data["by_status"]["INQUIRY"] == 2
+    assert response.data["by_state"]["WA"] == 1
+    # One of the four from make_patients, and the updated address.
+    assert response.data["by_state"]["NY"] == 2
+
+
+@pytest.mark.django_db
+def test_patient_stats_served_with_one_query(
+    provider_client, make_patients, django_assert_num_queries
+):
+    patients = make_patients(5)
+    Patient.objects.filter(pk=patients[0].pk).update(
+        created_at=timezone.now() - timedelta(weeks=2)
+    )
+    rebuild_patient_stats(patients[0].provider_id)
+
+    with django_assert_num_queries(1):
+        response = provider_client.get(reverse("api-patients-stats"), {"weeks": 4})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["total"] == 5
+    assert set(response.data["by_status"]) == {
+        "INQUIRY",
+        "ONBOARDING",
+        "ACTIVE",
+        "CHURNED",
+    }
+    assert sum(response.data["by_state"].values()) == 5
+    assert [week["count"] for week in response.data["new_per_week"]] == [0, 1, 0, 4]
+
+
+@pytest.mark.django_db
+def test_patient_stats_validates_weeks(provider_client):
+    response = provider_client.get(reverse("api-patients-stats"), {"weeks": 0})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "weeks" in response.data
+
+
+@pytest.mark.django_db
+def test_reconcile_patient_stats_command(provider, make_patients):
+    make_patients(3)
+    PatientStatistic.objects.filter(provider=provider, dimension="status").update(
+        count=9
+    )
+    stdout = io.StringIO()
+
+    call_command("reconcile_patient_stats", stdout=stdout)
+
+    assert "status ACTIVE was off by +8" in stdout.getvalue()
+    assert "1 providers, 3 counters corrected" in stdout.getvalue()
+    assert rebuild_patient_stats(provider.pk) == {}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rebuild_patient_stats_only_locks_the_provider(provider, user_factory):
+    other = user_factory.create(username="other@example.com")
+    with psycopg.connect(**listen_connection_params()) as rebuild:
+        # As rebuild_patient_stats(provider) in progress.
+        rebuild.execute(
+            f"SELECT pg_advisory_xact_lock({STATS_LOCK_CLASS}, %s)", [provider.pk]
+        )
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = '200ms'")
+            record_patient_stats(status_stats(other.pk, "ACTIVE"))
+
+        with pytest.raises(OperationalError, match="lock timeout"):
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '200ms'")
+                record_patient_stats(status_stats(provider.pk, "ACTIVE"))
+
+    assert PatientStatistic.objects.get(provider=other, key="ACTIVE").count == 1
+    assert not PatientStatistic.objects.filter(provider=provider).exists()
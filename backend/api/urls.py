@@ -4,7 +4,14 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework import routers
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .api import UserViewSet, PatientViewSet, CustomFieldViewSet
+from .api import CustomFieldViewSet, PatientViewSet, UserViewSet
+from .async_api import (
+    AsyncPatientDetailView,
+    AsyncPatientEventsView,
+    AsyncPatientListView,
+    AsyncPatientStatsView,
+)
+from .metrics import metrics_view
 
 router = routers.DefaultRouter()
 router.register("users", UserViewSet, basename="api-users")
@@ -17,6 +24,27 @@ urlpatterns = [
         SpectacularSwaggerView.as_view(url_name="schema"),
     ),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/metrics", metrics_view, name="metrics"),
+    path(
+        "api/async/patients/",
+        AsyncPatientListView.as_view(),
+        name="api-async-patients-list",
+    ),
+    path(
+        "api/async/patients/stats/",
+        AsyncPatientStatsView.as_view(),
+        name="api-async-patients-stats",
+    ),
+    path(
+        "api/async/patients/events/",
+        AsyncPatientEventsView.as_view(),
+        name="api-async-patients-events",
+    ),
+    path(
+        "api/async/patients/<int:pk>/",
+        AsyncPatientDetailView.as_view(),
+        name="api-async-patients-detail",
+    ),
     path("api/", include(router.urls)),
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),